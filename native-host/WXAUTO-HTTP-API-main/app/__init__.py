@@ -129,12 +129,25 @@ def create_app():
         logging.error("无法继续创建Flask应用")
         raise
 
+    # 注册请求指标统计
+    from app.metrics import metrics, init_app as init_metrics
+    from app.auth import require_api_key
+    init_metrics(app)
+
     # 添加健康检查路由
     @app.route('/health')
     def health_check():
         """健康检查路由"""
         return {'status': 'ok'}
 
+    # 添加运行指标路由
+    @app.route('/metrics')
+    @require_api_key
+    def export_metrics():
+        """以Prometheus文本格式导出运行指标"""
+        from flask import Response
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
     # 添加根路径重定向到API文档
     @app.route('/')
     def index():
@@ -1,10 +1,15 @@
-from flask import Blueprint, jsonify, request, g, Response, send_file
+from flask import Blueprint, jsonify, request, g, Response
+from flask import send_file as flask_send_file
 from app.auth import require_api_key
 from app.unified_logger import logger
 from app.wechat import wechat_manager
 from app.system_monitor import get_system_resources
 from app.api_queue import queue_task, get_queue_stats
 from app.config import Config
+from app.message_buffer import message_buffer
+import hashlib
+import json
+import math
 import os
 import time
 from typing import Optional, List
@@ -13,8 +18,31 @@
 
 api_bp = Blueprint('api', __name__)
 
-# 全局消息缓存 - 用于存储回调函数接收到的消息
-_message_cache = {}
+# 长轮询最长等待时间（秒）
+LISTEN_MAX_WAIT = 60
+# 推送连接的心跳间隔（秒）和客户端重连间隔（毫秒）
+LISTEN_STREAM_HEARTBEAT = 15
+LISTEN_STREAM_RETRY_MS = 3000
+
+
+def _parse_optional_int(name):
+    """解析可选的非负整数查询参数，格式错误时抛出ValueError"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"{name}不能为负数")
+    return value
+
+
+def _parse_wait_seconds(name, max_wait):
+    """解析长轮询等待秒数，拒绝nan/inf，负数按0处理，超过max_wait按max_wait处理"""
+    value = float(request.args.get(name) or 0)
+    if not math.isfinite(value):
+        raise ValueError(f"{name}必须是有限的数字")
+    return min(max(value, 0.0), max_wait)
+
 
 # 记录程序启动时间
 start_time = time.time()
@@ -144,6 +172,9 @@ def get_wechat_status():
         }
     })
 
+# 批量发送接口单次最多发送的消息数量
+SEND_BATCH_MAX_MESSAGES = 50
+
 def format_at_message(message: str, at_list: Optional[List[str]] = None) -> str:
     if not at_list:
         return message
@@ -199,70 +230,167 @@ def send_message():
             'data': None
         }), 500
 
-@queue_task(timeout=30)  # 使用队列处理请求，超时30秒
-def _send_message_task(receiver, message, at_list, clear):
-    """实际执行发送消息的队列任务"""
+@api_bp.route('/message/send-batch', methods=['POST'])
+@require_api_key
+def send_message_batch():
+    """批量发送消息：切换到接收者的聊天窗口一次，依次发送多条消息"""
+    try:
+        data = request.get_json()
+        receiver = data.get('receiver')
+        items = data.get('messages')
+        clear = "1" if data.get('clear', True) else "0"
+
+        if not receiver or not isinstance(items, list) or not items:
+            return jsonify({
+                'code': 1002,
+                'message': '缺少必要参数',
+                'data': None
+            }), 400
+        if len(items) > SEND_BATCH_MAX_MESSAGES:
+            return jsonify({
+                'code': 1002,
+                'message': f'单次最多发送{SEND_BATCH_MAX_MESSAGES}条消息',
+                'data': None
+            }), 400
+
+        messages = []
+        for item in items:
+            if isinstance(item, dict):
+                message, at_list = item.get('message'), item.get('at_list', [])
+            else:
+                message, at_list = item, []
+            if not message or not isinstance(message, str):
+                return jsonify({
+                    'code': 1002,
+                    'message': '消息内容不能为空',
+                    'data': None
+                }), 400
+            messages.append((message, at_list, clear))
+
+        results = _send_message_batch_task(receiver, messages)
+        success_count = sum(1 for result in results if result['response']['code'] == 0)
+        return jsonify({
+            'code': 0 if success_count == len(results) else 3001,
+            'message': '发送成功' if success_count == len(results) else '部分消息发送失败',
+            'data': {
+                'success_count': success_count,
+                'results': [
+                    {'index': index, 'code': result['response']['code'], 'message': result['response']['message']}
+                    for index, result in enumerate(results)
+                ]
+            }
+        })
+    except Exception as e:
+        logger.error(f"处理批量发送消息请求失败: {str(e)}")
+        return jsonify({
+            'code': 3001,
+            'message': f'处理请求失败: {str(e)}',
+            'data': None
+        }), 500
+
+def _send_messages(receiver, messages):
+    """
+    切换到接收者的聊天窗口一次，依次发送多条消息
+
+    Args:
+        receiver: 接收者
+        messages: [(message, at_list, clear), ...]
+
+    Returns:
+        list: 每条消息的发送结果 {'response', 'status_code'}
+    """
     wx_instance = wechat_manager.get_instance()
     if not wx_instance:
-        return {
+        return [{
             'response': {
                 'code': 2001,
                 'message': '微信未初始化',
                 'data': None
             },
             'status_code': 400
-        }
+        }] * len(messages)
 
     try:
-        formatted_message = format_at_message(message, at_list)
-
         # 查找联系人
         chat_name = wx_instance.ChatWith(receiver)
         if not chat_name:
-            return {
+            return [{
                 'response': {
                     'code': 3001,
                     'message': f'找不到联系人: {receiver}',
                     'data': None
                 },
                 'status_code': 404
-            }
+            }] * len(messages)
 
         # 确认切换到了正确的聊天窗口
         if chat_name != receiver:
-            return {
+            return [{
                 'response': {
                     'code': 3001,
                     'message': f'联系人匹配错误，期望: {receiver}, 实际: {chat_name}',
                     'data': None
                 },
                 'status_code': 400
-            }
-
-        if at_list:
-            wx_instance.SendMsg(formatted_message, clear=clear, at=at_list)
-            wx_instance.SendMsg(message, clear=clear, at=at_list)
-        else:
-            wx_instance.SendMsg(message, clear=clear)
-
-        return {
-            'response': {
-                'code': 0,
-                'message': '发送成功',
-                'data': {'message_id': 'success'}
-            },
-            'status_code': 200
-        }
+            }] * len(messages)
     except Exception as e:
         logger.error(f"发送消息失败: {str(e)}")
-        return {
+        return [{
             'response': {
                 'code': 3001,
                 'message': f'发送失败: {str(e)}',
                 'data': None
             },
             'status_code': 500
-        }
+        }] * len(messages)
+
+    results = []
+    for message, at_list, clear in messages:
+        try:
+            if at_list:
+                formatted_message = format_at_message(message, at_list)
+                wx_instance.SendMsg(formatted_message, clear=clear, at=at_list)
+                wx_instance.SendMsg(message, clear=clear, at=at_list)
+            else:
+                wx_instance.SendMsg(message, clear=clear)
+
+            results.append({
+                'response': {
+                    'code': 0,
+                    'message': '发送成功',
+                    'data': {'message_id': 'success'}
+                },
+                'status_code': 200
+            })
+        except Exception as e:
+            logger.error(f"发送消息失败: {str(e)}")
+            results.append({
+                'response': {
+                    'code': 3001,
+                    'message': f'发送失败: {str(e)}',
+                    'data': None
+                },
+                'status_code': 500
+            })
+    return results
+
+def _send_message_batch(calls):
+    """发送消息任务的批量执行函数：同一接收者排队中的多条消息只切换一次聊天窗口"""
+    receiver = calls[0][0][0]
+    return _send_messages(receiver, [args[1:] for args, kwargs in calls])
+
+# 使用队列处理请求，超时30秒；同一接收者的消息按提交顺序发送，排队中的连续消息合并成一批发送。
+# 发送不是幂等操作（"好的"、"收到"这类回复经常重复），内容相同的消息也必须逐条发送，不能合并
+@queue_task(timeout=30, task_class='send', chat_key=lambda receiver, *args: receiver,
+            batch_func=_send_message_batch)
+def _send_message_task(receiver, message, at_list, clear):
+    """实际执行发送消息的队列任务"""
+    return _send_messages(receiver, [(message, at_list, clear)])[0]
+
+@queue_task(timeout=60, task_class='send', chat_key=lambda receiver, *args: receiver)
+def _send_message_batch_task(receiver, messages):
+    """实际执行批量发送消息的队列任务"""
+    return _send_messages(receiver, messages)
 
 @api_bp.route('/message/send-typing', methods=['POST'])
 @require_api_key
@@ -381,7 +509,8 @@ def send_file():
             'data': None
         }), 500
 
-@queue_task(timeout=60)  # 使用队列处理请求，文件发送可能需要更长时间，设置60秒超时
+# 使用队列处理请求，文件发送可能需要更长时间，设置60秒超时
+@queue_task(timeout=60, task_class='send', chat_key=lambda receiver, *args: receiver)
 def _send_file_task(receiver, file_paths):
     """实际执行发送文件的队列任务"""
     wx_instance = wechat_manager.get_instance()
@@ -514,9 +643,9 @@ def parse_bool(value):
         # 不再设置wxauto保存路径，避免导入错误
         logger.debug("跳过wxauto保存路径设置，使用默认路径")
 
-        # 调用GetNextNewMessage方法
+        # 调用GetNextNewMessage方法（在UI队列中执行，优先级低于发送）
         try:
-            messages = wx_instance.GetNextNewMessage(**params)
+            messages = _get_next_new_message_task(params)
         except Exception as e:
             logger.error(f"获取新消息失败: {str(e)}")
             # 如果出现异常，返回空字典表示没有新消息
@@ -784,12 +913,19 @@ def clean_group_name(name):
             'data': None
         }), 500
 
+@queue_task(timeout=30, task_class='read')
+def _get_next_new_message_task(params):
+    """获取下一条新消息的队列任务"""
+    wx_instance = wechat_manager.get_instance()
+    if not wx_instance:
+        return {}
+    return wx_instance.GetNextNewMessage(**params)
+
 @api_bp.route('/message/listen/add', methods=['POST'])
 @require_api_key
 def add_listen_chat():
     """添加消息监听 - 按照官方文档实现"""
-    wx_instance = wechat_manager.get_instance()
-    if not wx_instance:
+    if not wechat_manager.get_instance():
         return jsonify({
             'code': 2001,
             'message': '微信未初始化',
@@ -813,6 +949,32 @@ def add_listen_chat():
             'data': None
         }), 400
 
+    try:
+        result = _add_listen_chat_task(nickname)
+        return jsonify(result['response']), result['status_code']
+    except Exception as e:
+        logger.error(f"添加监听失败: {str(e)}")
+        return jsonify({
+            'code': 3001,
+            'message': f'添加监听失败: {str(e)}',
+            'data': None
+        }), 500
+
+# 同一监听对象的添加/移除按提交顺序执行，重复的添加请求合并为一次
+@queue_task(timeout=30, task_class='admin', chat_key=lambda nickname: nickname, coalesce=True)
+def _add_listen_chat_task(nickname):
+    """实际执行添加监听的队列任务"""
+    wx_instance = wechat_manager.get_instance()
+    if not wx_instance:
+        return {
+            'response': {
+                'code': 2001,
+                'message': '微信未初始化',
+                'data': None
+            },
+            'status_code': 400
+        }
+
     try:
         # 获取原始微信实例（绕过WeChatAdapter的复杂处理）
         original_instance = wx_instance._instance if hasattr(wx_instance, '_instance') else wx_instance
@@ -847,10 +1009,8 @@ def message_callback(msg, chat):
                         'time': getattr(msg, 'time', None)
                     }
 
-                    # 将消息存储到全局缓存中
-                    if nickname not in _message_cache:
-                        _message_cache[nickname] = []
-                    _message_cache[nickname].append(serializable_msg)
+                    # 将消息存储到全局消息缓冲区
+                    message_buffer.append(nickname, serializable_msg)
 
                     logger.info(f"已将消息转换并存储到缓存: {serializable_msg}")
                 except Exception as e:
@@ -890,10 +1050,8 @@ def message_callback(msg, chat):
                         'time': getattr(msg, 'time', None)
                     }
 
-                    # 将消息存储到全局缓存中
-                    if nickname not in _message_cache:
-                        _message_cache[nickname] = []
-                    _message_cache[nickname].append(serializable_msg)
+                    # 将消息存储到全局消息缓冲区
+                    message_buffer.append(nickname, serializable_msg)
 
                     logger.info(f"已将消息转换并存储到缓存: {serializable_msg}")
                 except Exception as e:
@@ -911,26 +1069,42 @@ def message_callback(msg, chat):
 
         logger.info(f"成功添加监听对象: {nickname}")
 
-        return jsonify({
-            'code': 0,
-            'message': '添加监听成功',
-            'data': {
-                'nickname': nickname,
-                'library': lib_name
-            }
-        })
+        return {
+            'response': {
+                'code': 0,
+                'message': '添加监听成功',
+                'data': {
+                    'nickname': nickname,
+                    'library': lib_name
+                }
+            },
+            'status_code': 200
+        }
     except Exception as e:
         logger.error(f"添加监听失败: {str(e)}")
-        return jsonify({
-            'code': 3001,
-            'message': f'添加监听失败: {str(e)}',
-            'data': None
-        }), 500
+        return {
+            'response': {
+                'code': 3001,
+                'message': f'添加监听失败: {str(e)}',
+                'data': None
+            },
+            'status_code': 500
+        }
 
 @api_bp.route('/message/listen/get', methods=['GET'])
 @require_api_key
 def get_listen_messages():
-    """获取监听消息 - 统一处理wxauto和wxautox"""
+    """
+    获取监听消息 - 统一处理wxauto和wxautox
+
+    查询参数:
+        batch: 为true时一次返回所有聊天对象的消息，否则只返回第一个有消息的聊天对象
+        per_chat_limit: 每个聊天对象最多返回的消息数量
+        max_total: 本次最多返回的消息总数
+        ack: 为true时消息在确认后才从缓存删除，未确认的消息下次会重新返回
+        cursor: 确认此游标之前已返回的消息（等同于调用/message/listen/ack）
+        wait: 没有消息时最多等待的秒数（长轮询），有新消息立即返回，最大60秒
+    """
     wx_instance = wechat_manager.get_instance()
     if not wx_instance:
         return jsonify({
@@ -940,32 +1114,59 @@ def get_listen_messages():
         }), 400
 
     try:
-        lib_name = wx_instance.get_lib_name() if hasattr(wx_instance, 'get_lib_name') else 'wxauto'
-        logger.info(f"获取监听消息，使用库: {lib_name}")
-
-        # 统一从全局消息缓存获取消息
-        messages = {}
-        if _message_cache:
-            logger.info(f"缓存中的聊天对象: {list(_message_cache.keys())}")
-
-            # 找到第一个有消息的聊天对象
-            for chat_name, msg_list in _message_cache.items():
-                if msg_list:  # 如果有消息
-                    messages = {chat_name: msg_list}
-                    logger.info(f"返回 {chat_name} 的 {len(msg_list)} 条消息")
-                    # 清空缓存（消息已被消费）
-                    _message_cache[chat_name] = []
-                    break
+        batch = request.args.get('batch', 'false').lower() in ('true', '1', 'yes')
+        retain = request.args.get('ack', 'false').lower() in ('true', '1', 'yes')
+        per_chat_limit = _parse_optional_int('per_chat_limit')
+        max_total = _parse_optional_int('max_total')
+        cursor = _parse_optional_int('cursor')
+        wait = _parse_wait_seconds('wait', LISTEN_MAX_WAIT)
+    except ValueError as e:
+        return jsonify({
+            'code': 1002,
+            'message': f'参数错误: {str(e)}',
+            'data': None
+        }), 400
 
-        if not messages:
-            logger.info("缓存中没有新消息")
-            messages = {}
+    try:
+        lib_name = wx_instance.get_lib_name() if hasattr(wx_instance, 'get_lib_name') else 'wxauto'
+        logger.debug(f"获取监听消息，使用库: {lib_name}, 批量: {batch}, 确认模式: {retain}")
+
+        # 先确认上一批消息，再取新消息
+        if cursor is not None:
+            acked = message_buffer.ack(cursor)
+            logger.debug(f"已确认游标 {cursor} 之前的 {acked} 条消息")
+
+        # 统一从全局消息缓冲区获取消息，非批量模式只返回第一个有消息的聊天对象
+        deadline = time.time() + wait
+        while True:
+            # 先读版本号再取消息，取消息之后到达的消息会让wait()立即返回
+            version = message_buffer.version
+            messages, next_cursor, remaining = message_buffer.drain(
+                max_chats=None if batch else 1,
+                per_chat_limit=per_chat_limit,
+                max_total=max_total,
+                retain=retain
+            )
+            timeout = deadline - time.time()
+            if messages or timeout <= 0:
+                break
+            message_buffer.wait(version, timeout)
+
+        if messages:
+            total = sum(len(msg_list) for msg_list in messages.values())
+            logger.info(f"返回 {len(messages)} 个聊天对象的 {total} 条消息，剩余 {remaining} 条")
+        else:
+            logger.debug("缓存中没有新消息")
 
         # 直接返回消息，不需要复杂的格式化
         return jsonify({
             'code': 0,
             'message': '获取消息成功' if messages else '没有新消息',
-            'data': {'messages': messages}
+            'data': {
+                'messages': messages,
+                'cursor': next_cursor,
+                'remaining': remaining
+            }
         })
 
     except Exception as e:
@@ -977,12 +1178,106 @@ def get_listen_messages():
         }), 500
 
 
+@api_bp.route('/message/listen/ack', methods=['POST'])
+@require_api_key
+def ack_listen_messages():
+    """确认已收到的监听消息，从缓存中删除游标之前已返回的消息"""
+    data = request.get_json(silent=True) or {}
+    cursor = data.get('cursor')
+    if isinstance(cursor, bool) or not isinstance(cursor, int):
+        return jsonify({
+            'code': 1002,
+            'message': '缺少必要参数: cursor',
+            'data': None
+        }), 400
+
+    acked = message_buffer.ack(cursor)
+    return jsonify({
+        'code': 0,
+        'message': '确认成功',
+        'data': {'acked': acked}
+    })
+
+
+@api_bp.route('/message/listen/stream', methods=['GET'])
+@require_api_key
+def stream_listen_messages():
+    """
+    以SSE（text/event-stream）推送监听消息
+
+    每批消息作为一个messages事件发送，事件id为确认游标。查询参数per_chat_limit、max_total、ack
+    与/message/listen/get相同。ack模式下断线重连时浏览器会通过Last-Event-ID带回最后的游标，
+    服务端先确认这些消息，再重新推送其余未确认的消息；也可以随时调用/message/listen/ack确认。
+    """
+    try:
+        retain = request.args.get('ack', 'false').lower() in ('true', '1', 'yes')
+        per_chat_limit = _parse_optional_int('per_chat_limit')
+        max_total = _parse_optional_int('max_total')
+        cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+        cursor = int(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({
+            'code': 1002,
+            'message': f'参数错误: {str(e)}',
+            'data': None
+        }), 400
+
+    if cursor is not None:
+        acked = message_buffer.ack(cursor)
+        logger.debug(f"推送连接确认游标 {cursor} 之前的 {acked} 条消息")
+
+    def generate():
+        logger.info(f"监听消息推送连接已建立，确认模式: {retain}")
+        # 建立连接后先重新推送已下发但未确认的消息，之后只推送新消息
+        only_new = False
+        yield f"retry: {LISTEN_STREAM_RETRY_MS}\n\n"
+        try:
+            while True:
+                version = message_buffer.version
+                messages, next_cursor, remaining = message_buffer.drain(
+                    per_chat_limit=per_chat_limit,
+                    max_total=max_total,
+                    retain=retain,
+                    only_new=only_new
+                )
+                only_new = retain
+                if messages:
+                    payload = json.dumps({
+                        'messages': messages,
+                        'cursor': next_cursor,
+                        'remaining': remaining
+                    }, ensure_ascii=False)
+                    yield f"id: {next_cursor}\nevent: messages\ndata: {payload}\n\n"
+                    continue
+
+                # 没有新消息时发送注释行作为心跳，连接断开时写入失败，生成器随之结束
+                if message_buffer.wait(version, LISTEN_STREAM_HEARTBEAT) == version:
+                    yield ": keep-alive\n\n"
+        finally:
+            logger.info("监听消息推送连接已关闭")
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@api_bp.route('/message/listen/stats', methods=['GET'])
+@require_api_key
+def get_listen_buffer_stats():
+    """获取监听消息缓冲区指标：深度、丢弃数、最旧消息等待时间等"""
+    return jsonify({
+        'code': 0,
+        'message': '获取成功',
+        'data': message_buffer.get_stats()
+    })
+
+
 @api_bp.route('/message/listen/remove', methods=['POST'])
 @require_api_key
 def remove_listen_chat():
     """移除监听对象 - 统一处理wxauto和wxautox"""
-    wx_instance = wechat_manager.get_instance()
-    if not wx_instance:
+    if not wechat_manager.get_instance():
         return jsonify({
             'code': 2001,
             'message': '微信未初始化',
@@ -999,6 +1294,31 @@ def remove_listen_chat():
 
     nickname = data['nickname']
 
+    try:
+        result = _remove_listen_chat_task(nickname)
+        return jsonify(result['response']), result['status_code']
+    except Exception as e:
+        logger.error(f"移除监听失败: {str(e)}")
+        return jsonify({
+            'code': 3003,
+            'message': f'移除监听失败: {str(e)}',
+            'data': None
+        }), 500
+
+@queue_task(timeout=30, task_class='admin', chat_key=lambda nickname: nickname, coalesce=True)
+def _remove_listen_chat_task(nickname):
+    """实际执行移除监听的队列任务"""
+    wx_instance = wechat_manager.get_instance()
+    if not wx_instance:
+        return {
+            'response': {
+                'code': 2001,
+                'message': '微信未初始化',
+                'data': None
+            },
+            'status_code': 400
+        }
+
     try:
         # 获取原始微信实例（绕过WeChatAdapter的复杂处理）
         original_instance = wx_instance._instance if hasattr(wx_instance, '_instance') else wx_instance
@@ -1014,26 +1334,31 @@ def remove_listen_chat():
             logger.warning(f"{lib_name}库不支持RemoveListenChat方法")
 
         # 从全局缓存中移除
-        if nickname in _message_cache:
-            del _message_cache[nickname]
+        if message_buffer.remove_chat(nickname):
             logger.info(f"已从缓存中移除监听对象: {nickname}")
 
-        return jsonify({
-            'code': 0,
-            'message': '移除监听成功',
-            'data': {
-                'nickname': nickname,
-                'library': lib_name
-            }
-        })
+        return {
+            'response': {
+                'code': 0,
+                'message': '移除监听成功',
+                'data': {
+                    'nickname': nickname,
+                    'library': lib_name
+                }
+            },
+            'status_code': 200
+        }
 
     except Exception as e:
         logger.error(f"移除监听失败: {str(e)}")
-        return jsonify({
-            'code': 3003,
-            'message': f'移除监听失败: {str(e)}',
-            'data': None
-        }), 500
+        return {
+            'response': {
+                'code': 3003,
+                'message': f'移除监听失败: {str(e)}',
+                'data': None
+            },
+            'status_code': 500
+        }
 
 
 
@@ -1678,10 +2003,27 @@ def health_check():
             'status': 'ok',
             'wechat_status': wx_status,
             'uptime': int(time.time() - start_time),
-            'wx_lib': wx_lib
+            'wx_lib': wx_lib,
+            'resources': _health_resources(),
+            'chat_cache': wx_instance.get_chat_cache_stats() if wx_instance else None
         }
     })
 
+
+def _health_resources():
+    """健康检查附带的资源快照，直接读取后台采样缓存"""
+    try:
+        resources = get_system_resources(include_history=False)
+        return {
+            'cpu_percent': resources['cpu']['usage_percent'],
+            'memory_percent': resources['memory']['usage_percent'],
+            'process_memory': resources['process']['memory'],
+            'sampled_at': resources['sampled_at']
+        }
+    except Exception as e:
+        logger.error(f"获取系统资源快照失败: {str(e)}")
+        return None
+
 @api_bp.route('/system/resources', methods=['GET'])
 @require_api_key
 def get_resources():
@@ -1899,21 +2241,50 @@ def reactivate_listen_chat():
             'data': None
         }), 500
 
-@api_bp.route('/file/download', methods=['POST'])
+# 文件下载大小上限
+FILE_DOWNLOAD_MAX_SIZE = 100 * 1024 * 1024
+# 计算文件哈希时每次读取的字节数
+FILE_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=512)
+def _file_sha256(file_path, file_size, mtime_ns):
+    """
+    计算文件内容的SHA-256，按(路径, 大小, 修改时间)缓存，文件变化后自动重新计算
+
+    file_size和mtime_ns只作为缓存键使用
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(FILE_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@api_bp.route('/file/download', methods=['GET', 'POST'])
 @require_api_key
 def download_file():
-    """下载文件接口"""
+    """
+    下载文件接口
+
+    文件以流式响应返回，不整体读入内存。ETag和X-Content-SHA256响应头为文件内容的SHA-256。
+    GET（file_path作为查询参数）支持HEAD获取文件信息、Range断点续传以及If-None-Match/If-Range条件请求；
+    POST（file_path在请求体中）保持原有用法。
+    """
     try:
-        data = request.get_json()
-        if not data or 'file_path' not in data:
+        if request.method == 'POST':
+            data = request.get_json(silent=True)
+            file_path = data.get('file_path') if isinstance(data, dict) else None
+        else:
+            file_path = request.args.get('file_path')
+        if not file_path:
             return jsonify({
                 'code': 1002,
                 'message': '参数错误',
                 'data': {'error': '缺少file_path参数'}
             }), 400
 
-        file_path = data['file_path']
-        if not os.path.exists(file_path):
+        if not os.path.isfile(file_path):
             return jsonify({
                 'code': 3003,
                 'message': '文件下载失败',
@@ -1921,8 +2292,8 @@ def download_file():
             }), 404
 
         # 检查文件大小
-        file_size = os.path.getsize(file_path)
-        if file_size > 100 * 1024 * 1024:  # 100MB限制
+        stat = os.stat(file_path)
+        if stat.st_size > FILE_DOWNLOAD_MAX_SIZE:
             return jsonify({
                 'code': 3003,
                 'message': '文件下载失败',
@@ -1931,19 +2302,19 @@ def download_file():
 
         # 获取文件名
         filename = os.path.basename(file_path)
+        content_hash = _file_sha256(file_path, stat.st_size, stat.st_mtime_ns)
 
-        # 读取文件内容
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
-
-        # 设置响应头
-        response = Response(
-            file_content,
+        # flask_send_file以文件包装器流式返回内容，conditional=True时处理Range和条件请求（仅GET/HEAD）
+        response = flask_send_file(
+            file_path,
             mimetype='application/octet-stream',
-            headers={
-                'Content-Disposition': f'attachment; filename="{filename}"'
-            }
+            as_attachment=True,
+            download_name=filename,
+            conditional=True,
+            etag=content_hash,
+            max_age=0
         )
+        response.headers['X-Content-SHA256'] = content_hash
         return response
 
     except PermissionError:
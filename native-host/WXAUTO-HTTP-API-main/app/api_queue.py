@@ -1,174 +1,478 @@
 """
 API请求队列处理模块
 提供高并发支持和请求队列管理
+
+微信UI自动化操作实际上是串行的，因此任务分为两类：
+- UI任务：由单个UI执行线程按优先级处理（发送 > 读取 > 管理），就绪后等待超过UI_AGING_SECONDS的
+  低优先级任务会被提前执行，避免持续的发送请求让读取和管理任务一直等到超时
+- 非UI任务：由并行线程池处理
+同一聊天对象的任务严格按提交顺序执行；与该聊天对象最后提交的、尚未开始执行的任务相同的请求会合并为一次执行；
+支持批量执行的任务（如发送消息）会把同一聊天对象排队中的后续任务合并成一批，只切换一次聊天窗口。
 """
 
-import queue
 import threading
 import time
 import traceback
+from collections import deque
 from functools import wraps
 from app.unified_logger import logger
+from app.metrics import LatencyHistogram
+
+# UI任务类别及优先级（数值越小越优先）
+UI_TASK_PRIORITIES = {
+    'send': 0,
+    'read': 1,
+    'admin': 2
+}
 
-# 全局请求队列
-request_queue = queue.Queue()
+# UI任务就绪后等待超过该秒数时，不再按优先级排队，按就绪顺序优先执行
+UI_AGING_SECONDS = 5
 
-# 请求计数器
-request_counter = 0
-error_counter = 0
+# 非UI任务类别，由并行线程池处理
+IO_TASK_CLASS = 'io'
 
-# 队列处理线程数量
+# 非UI任务处理线程数量
 WORKER_THREADS = 5
 
-# 队列处理线程列表
-worker_threads = []
+# 一批最多合并执行的任务数量
+MAX_BATCH_SIZE = 20
+
+
+class QueueTask:
+    """队列任务，合并的请求共享同一个任务和结果"""
 
-# 队列状态
-queue_running = False
+    __slots__ = ('id', 'func', 'args', 'kwargs', 'task_class', 'chat', 'coalesce_key', 'batch_func',
+                 'enqueue_time', 'ready_time', 'started', 'cancelled', 'waiters', 'result', 'done')
 
-# 锁，用于线程安全的计数器更新
-counter_lock = threading.Lock()
+    def __init__(self, task_id, func, args, kwargs, task_class, chat, coalesce_key, batch_func=None):
+        self.id = task_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.task_class = task_class
+        self.chat = chat
+        self.coalesce_key = coalesce_key
+        self.batch_func = batch_func
+        self.enqueue_time = time.perf_counter()
+        self.ready_time = self.enqueue_time
+        self.started = False
+        self.cancelled = False
+        self.waiters = 1
+        self.result = None
+        self.done = threading.Event()
 
-def enqueue_request(func, *args, **kwargs):
+    @property
+    def is_ui(self):
+        return self.task_class != IO_TASK_CLASS
+
+
+class UIReadyQueue:
     """
-    将请求加入队列
-    
-    Args:
-        func: 要执行的函数
-        args: 位置参数
-        kwargs: 关键字参数
-        
-    Returns:
-        任务ID
+    UI任务就绪队列
+
+    每个类别一个按就绪顺序排列的FIFO队列。通常取优先级最高的非空类别的队首任务；
+    某个类别的队首任务已等待超过aging_seconds时，在所有超时的队首任务中取就绪最早的一个，
+    保证低优先级任务的等待时间有上限。
     """
-    global request_counter
-    
-    with counter_lock:
-        request_counter += 1
-        task_id = request_counter
-        
-    # 创建任务
-    task = {
-        'id': task_id,
-        'func': func,
-        'args': args,
-        'kwargs': kwargs,
-        'result_queue': queue.Queue(),
-        'timestamp': time.time()
-    }
-    
-    # 加入队列
-    request_queue.put(task)
-    logger.debug(f"任务 {task_id} 已加入队列")
-    
-    return task
-
-def queue_processor():
-    """队列处理线程函数"""
-    global error_counter
-    
-    logger.info("队列处理线程已启动")
-    
-    while queue_running:
-        try:
-            # 从队列获取任务，超时1秒
-            try:
-                task = request_queue.get(timeout=1)
-            except queue.Empty:
+
+    def __init__(self, aging_seconds=UI_AGING_SECONDS):
+        self.aging_seconds = aging_seconds
+        # 按优先级从高到低排列
+        self._queues = {
+            task_class: deque() for task_class in sorted(UI_TASK_PRIORITIES, key=UI_TASK_PRIORITIES.get)
+        }
+        self.promoted = {task_class: 0 for task_class in UI_TASK_PRIORITIES}
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def append(self, task):
+        task.ready_time = time.perf_counter()
+        self._queues[task.task_class].append(task)
+
+    def pop(self):
+        now = time.perf_counter()
+        first = None
+        starved = None
+        for queue in self._queues.values():
+            if not queue:
                 continue
-                
-            # 处理任务
-            try:
-                logger.debug(f"处理任务 {task['id']}")
-                result = task['func'](*task['args'], **task['kwargs'])
-                task['result_queue'].put(('success', result))
-            except Exception as e:
-                with counter_lock:
-                    error_counter += 1
-                logger.error(f"任务 {task['id']} 处理失败: {str(e)}")
-                logger.debug(traceback.format_exc())
-                task['result_queue'].put(('error', str(e)))
-            finally:
-                request_queue.task_done()
-                
+            head = queue[0]
+            if first is None:
+                first = head
+            if now - head.ready_time < self.aging_seconds:
+                continue
+            if starved is None or head.ready_time < starved.ready_time:
+                starved = head
+        task = starved or first
+        if task is not first:
+            self.promoted[task.task_class] += 1
+        return self._queues[task.task_class].popleft()
+
+    def oldest_wait(self, task_class):
+        """该类别队首任务已就绪等待的秒数"""
+        queue = self._queues[task_class]
+        return time.perf_counter() - queue[0].ready_time if queue else 0.0
+
+
+class TaskScheduler:
+    """
+    请求任务调度器
+
+    - UI任务进入按优先级分类、带老化提升的就绪队列（UIReadyQueue），由单个UI执行线程处理
+    - 非UI任务进入FIFO队列，由并行线程池处理
+    - 指定了聊天对象的任务，同一时间每个聊天对象只有一个任务处于就绪或执行状态，
+      其余任务在该聊天对象的等待队列中按提交顺序排队
+    """
+
+    def __init__(self, io_workers=WORKER_THREADS, aging_seconds=UI_AGING_SECONDS):
+        self.io_workers = io_workers
+        self._lock = threading.Lock()
+        self._ui_cond = threading.Condition(self._lock)
+        self._io_cond = threading.Condition(self._lock)
+        self._ui_ready = UIReadyQueue(aging_seconds)
+        self._io_ready = deque()
+        self._chat_waiting = {}
+        self._chat_busy = set()
+        self._coalescing = {}
+        # 聊天对象 -> 最后提交且尚未开始执行的任务，只有与它相同的请求才能合并，
+        # 否则会越过中间提交的其他任务（如添加、移除、再添加同一监听对象）
+        self._chat_last = {}
+        self._running = False
+        self._threads = []
+
+        self.request_count = 0
+        self.error_count = 0
+        self.coalesced_count = 0
+        self.cancelled_count = 0
+        self.batch_count = 0
+        self.batched_task_count = 0
+        self._class_stats = {}
+
+    def _stats_for(self, task_class):
+        stats = self._class_stats.get(task_class)
+        if stats is None:
+            stats = {
+                'pending': 0,
+                'completed': 0,
+                'errors': 0,
+                'queue_wait': LatencyHistogram(),
+                'service_time': LatencyHistogram()
+            }
+            self._class_stats[task_class] = stats
+        return stats
+
+    def submit(self, func, args=(), kwargs=None, task_class='admin', chat=None, coalesce=False,
+               batch_func=None):
+        """
+        提交任务
+
+        Args:
+            func: 要执行的函数
+            args: 位置参数
+            kwargs: 关键字参数
+            task_class: 任务类别，send/read/admin为UI任务，io为非UI任务
+            chat: 聊天对象，同一聊天对象的任务按提交顺序执行
+            coalesce: 是否与尚未开始执行的相同请求合并；指定了聊天对象时，只与该聊天对象最后提交的任务合并
+            batch_func: 批量执行函数，接收[(args, kwargs), ...]并按顺序返回每个任务的结果；
+                        指定后同一聊天对象排队中的连续同类任务会合并成一批执行
+
+        Returns:
+            QueueTask: 任务对象
+        """
+        if task_class != IO_TASK_CLASS and task_class not in UI_TASK_PRIORITIES:
+            raise ValueError(f"未知的任务类别: {task_class}")
+        kwargs = kwargs or {}
+        coalesce_key = None
+        if coalesce:
+            coalesce_key = (func, task_class, chat, repr(args), repr(sorted(kwargs.items())))
+
+        with self._lock:
+            if coalesce_key is not None:
+                existing = self._coalescing.get(coalesce_key)
+                if existing is not None and chat is not None and self._chat_last.get(chat) is not existing:
+                    existing = None
+                if existing is not None and not existing.cancelled:
+                    existing.waiters += 1
+                    self.coalesced_count += 1
+                    logger.debug(f"任务 {existing.id} 合并了一个相同的请求")
+                    return existing
+
+            self.request_count += 1
+            task = QueueTask(self.request_count, func, args, kwargs, task_class, chat, coalesce_key, batch_func)
+            self._stats_for(task_class)['pending'] += 1
+            if coalesce_key is not None:
+                self._coalescing[coalesce_key] = task
+
+            if chat is not None:
+                self._chat_last[chat] = task
+                if chat in self._chat_busy:
+                    self._chat_waiting.setdefault(chat, deque()).append(task)
+                    logger.debug(f"任务 {task.id} 等待聊天对象 {chat} 的前序任务")
+                    return task
+                self._chat_busy.add(chat)
+            self._make_ready(task)
+
+        logger.debug(f"任务 {task.id} 已加入队列，类别: {task_class}")
+        return task
+
+    def _make_ready(self, task):
+        """把任务放入就绪队列，调用方需持有锁"""
+        if task.is_ui:
+            self._ui_ready.append(task)
+            self._ui_cond.notify()
+        else:
+            self._io_ready.append(task)
+            self._io_cond.notify()
+
+    def _release_chat(self, task):
+        """任务结束后放行同一聊天对象的下一个任务，调用方需持有锁"""
+        if task.chat is None:
+            return
+        waiting = self._chat_waiting.get(task.chat)
+        if waiting:
+            next_task = waiting.popleft()
+            if not waiting:
+                del self._chat_waiting[task.chat]
+            self._make_ready(next_task)
+        else:
+            self._chat_busy.discard(task.chat)
+
+    def _start_task(self, task):
+        """
+        标记任务开始执行，调用方需持有锁
+
+        Returns:
+            bool: 任务已被取消时返回False
+        """
+        if task.coalesce_key is not None and self._coalescing.get(task.coalesce_key) is task:
+            del self._coalescing[task.coalesce_key]
+        if task.chat is not None and self._chat_last.get(task.chat) is task:
+            del self._chat_last[task.chat]
+        if task.cancelled:
+            self._stats_for(task.task_class)['pending'] -= 1
+            return False
+        task.started = True
+        return True
+
+    def _collect_batch(self, task):
+        """从该聊天对象的等待队列中取出紧随其后的同类任务，与task合并成一批，调用方需持有锁"""
+        batch = [task]
+        waiting = self._chat_waiting.get(task.chat)
+        while waiting and len(batch) < MAX_BATCH_SIZE and waiting[0].func is task.func:
+            next_task = waiting.popleft()
+            if self._start_task(next_task):
+                batch.append(next_task)
+        if waiting is not None and not waiting:
+            del self._chat_waiting[task.chat]
+        return batch
+
+    def _take(self, cond, ready, pop):
+        """从就绪队列取出下一批可执行的任务，已取消的任务直接跳过"""
+        with self._lock:
+            while self._running:
+                while ready:
+                    task = pop()
+                    if not self._start_task(task):
+                        self._release_chat(task)
+                        continue
+                    if task.batch_func is not None and task.chat is not None:
+                        return self._collect_batch(task)
+                    return [task]
+                cond.wait(timeout=1)
+        return None
+
+    def _worker(self, cond, ready, pop):
+        logger.info("队列处理线程已启动")
+        while True:
+            batch = self._take(cond, ready, pop)
+            if batch is None:
+                break
+            self._execute(batch)
+        logger.info("队列处理线程已停止")
+
+    def _execute(self, batch):
+        task = batch[0]
+        started = time.perf_counter()
+        failed = False
+        try:
+            if len(batch) == 1:
+                logger.debug(f"处理任务 {task.id}")
+                task.result = ('success', task.func(*task.args, **task.kwargs))
+            else:
+                logger.debug(f"批量处理任务 {[item.id for item in batch]}，聊天对象: {task.chat}")
+                results = task.batch_func([(item.args, item.kwargs) for item in batch])
+                for item, result in zip(batch, results):
+                    item.result = ('success', result)
         except Exception as e:
-            with counter_lock:
-                error_counter += 1
-            logger.error(f"队列处理线程异常: {str(e)}")
+            failed = True
+            logger.error(f"任务 {task.id} 处理失败: {str(e)}")
             logger.debug(traceback.format_exc())
-            
-    logger.info("队列处理线程已停止")
+            for item in batch:
+                item.result = ('error', str(e))
+        finished = time.perf_counter()
+        for item in batch:
+            item.done.set()
+
+        with self._lock:
+            stats = self._stats_for(task.task_class)
+            stats['pending'] -= len(batch)
+            stats['completed'] += len(batch)
+            for item in batch:
+                stats['queue_wait'].observe(started - item.enqueue_time)
+                # 批量执行时按任务数平摊耗时
+                stats['service_time'].observe((finished - started) / len(batch))
+            if failed:
+                stats['errors'] += len(batch)
+                self.error_count += len(batch)
+            if len(batch) > 1:
+                self.batch_count += 1
+                self.batched_task_count += len(batch)
+            self._release_chat(task)
+
+    def wait(self, task, timeout):
+        """
+        等待任务结果
+
+        所有等待方都超时且任务尚未开始执行时取消任务，避免客户端已放弃的请求（如发送消息）稍后仍被执行
+        """
+        if not task.done.wait(timeout):
+            with self._lock:
+                task.waiters -= 1
+                if task.waiters <= 0 and not task.started and not task.cancelled:
+                    task.cancelled = True
+                    self.cancelled_count += 1
+            raise TimeoutError(f"任务 {task.id} 处理超时")
+        return task.result
+
+    def start(self):
+        """启动UI执行线程和非UI线程池"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+
+        self._threads = [threading.Thread(
+            target=self._worker, args=(self._ui_cond, self._ui_ready, self._ui_ready.pop),
+            daemon=True, name="QueueProcessor-UI"
+        )]
+        for i in range(self.io_workers):
+            self._threads.append(threading.Thread(
+                target=self._worker, args=(self._io_cond, self._io_ready, self._io_ready.popleft),
+                daemon=True, name=f"QueueProcessor-{i}"
+            ))
+        for thread in self._threads:
+            thread.start()
+
+        logger.info(f"已启动 1 个UI队列处理线程和 {self.io_workers} 个并行队列处理线程")
+
+    def stop(self):
+        """停止所有处理线程"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            self._ui_cond.notify_all()
+            self._io_cond.notify_all()
+
+        # 等待所有线程结束
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+
+        logger.info("所有队列处理线程已停止")
+
+    @property
+    def running(self):
+        return self._running
+
+    def get_stats(self):
+        """获取调度器统计信息"""
+        with self._lock:
+            classes = {
+                task_class: {
+                    'pending': stats['pending'],
+                    'completed': stats['completed'],
+                    'errors': stats['errors'],
+                    'queue_wait': stats['queue_wait'].snapshot(),
+                    'service_time': stats['service_time'].snapshot()
+                }
+                for task_class, stats in self._class_stats.items()
+            }
+            for task_class in UI_TASK_PRIORITIES:
+                if task_class in classes:
+                    classes[task_class]['promoted'] = self._ui_ready.promoted[task_class]
+                    classes[task_class]['oldest_ready_wait_ms'] = round(
+                        self._ui_ready.oldest_wait(task_class) * 1000, 3)
+            return {
+                'queue_size': sum(stats['pending'] for stats in self._class_stats.values()),
+                'ui_ready': len(self._ui_ready),
+                'io_ready': len(self._io_ready),
+                'busy_chats': len(self._chat_busy),
+                'request_count': self.request_count,
+                'error_count': self.error_count,
+                'coalesced_count': self.coalesced_count,
+                'cancelled_count': self.cancelled_count,
+                'batch_count': self.batch_count,
+                'batched_task_count': self.batched_task_count,
+                'aging_seconds': self._ui_ready.aging_seconds,
+                'promoted_count': sum(self._ui_ready.promoted.values()),
+                'worker_threads': len(self._threads),
+                'queue_running': self._running,
+                'classes': classes
+            }
+
+
+# 创建全局实例
+task_scheduler = TaskScheduler()
+
 
 def start_queue_processors():
     """启动队列处理线程"""
-    global queue_running, worker_threads
-    
-    if queue_running:
-        return
-        
-    queue_running = True
-    worker_threads = []
-    
-    # 创建并启动工作线程
-    for i in range(WORKER_THREADS):
-        thread = threading.Thread(target=queue_processor, daemon=True, name=f"QueueProcessor-{i}")
-        thread.start()
-        worker_threads.append(thread)
-        
-    logger.info(f"已启动 {WORKER_THREADS} 个队列处理线程")
+    task_scheduler.start()
+
 
 def stop_queue_processors():
     """停止队列处理线程"""
-    global queue_running
-    
-    if not queue_running:
-        return
-        
-    queue_running = False
-    
-    # 等待所有线程结束
-    for thread in worker_threads:
-        thread.join(timeout=2)
-        
-    logger.info("所有队列处理线程已停止")
-
-def queue_task(timeout=30):
+    task_scheduler.stop()
+
+
+def queue_task(timeout=30, task_class='admin', chat_key=None, coalesce=False, batch_func=None):
     """
     将API请求加入队列的装饰器
-    
+
     Args:
         timeout: 超时时间（秒）
-        
+        task_class: 任务类别，send/read/admin为按优先级串行执行的UI任务，io为并行执行的非UI任务
+        chat_key: 从调用参数中取出聊天对象的函数，同一聊天对象的任务按提交顺序执行
+        coalesce: 是否把尚未开始执行的相同请求合并为一次执行
+        batch_func: 批量执行函数，同一聊天对象排队中的连续请求合并成一批调用
+
     Returns:
         装饰器函数
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
+            chat = chat_key(*args, **kwargs) if chat_key else None
             # 将请求加入队列
-            task = enqueue_request(func, *args, **kwargs)
-            
+            task = task_scheduler.submit(func, args, kwargs, task_class=task_class,
+                                         chat=chat, coalesce=coalesce, batch_func=batch_func)
+
             # 等待结果
-            try:
-                result_type, result = task['result_queue'].get(timeout=timeout)
-                if result_type == 'error':
-                    raise Exception(result)
-                return result
-            except queue.Empty:
-                raise TimeoutError(f"任务 {task['id']} 处理超时")
-                
+            result_type, result = task_scheduler.wait(task, timeout)
+            if result_type == 'error':
+                raise Exception(result)
+            return result
+
         return wrapper
     return decorator
 
+
 def get_queue_stats():
     """获取队列统计信息"""
-    return {
-        'queue_size': request_queue.qsize(),
-        'request_count': request_counter,
-        'error_count': error_counter,
-        'worker_threads': len(worker_threads),
-        'queue_running': queue_running
-    }
+    return task_scheduler.get_stats()
+
 
 # 启动队列处理器
 start_queue_processors()
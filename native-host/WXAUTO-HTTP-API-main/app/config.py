@@ -33,6 +33,10 @@ class Config:
         # Flask配置
         PORT = app_config.get('port', 5000)
 
+        # 监听消息缓冲配置
+        MESSAGE_BUFFER_SIZE = app_config.get('message_buffer_size', 1000)
+        MESSAGE_BUFFER_OVERFLOW = app_config.get('message_buffer_overflow', 'drop_oldest')
+
         # 微信库选择配置
         configured_lib = app_config.get('wechat_lib', 'wxauto').lower()
 
@@ -59,6 +63,8 @@ class Config:
         # 如果无法导入config_manager，则使用默认值
         PORT = 5000
         WECHAT_LIB = 'wxauto'
+        MESSAGE_BUFFER_SIZE = 1000
+        MESSAGE_BUFFER_OVERFLOW = 'drop_oldest'
 
     @staticmethod
     def get_api_keys():
@@ -0,0 +1,389 @@
+"""
+监听消息缓冲模块
+为每个监听对象维护一个有界队列，监听回调线程写入，API请求线程读取和确认
+
+- 每个聊天对象一把锁，不同聊天对象的写入互不阻塞
+- 消息序号全局递增，作为确认(ack)游标
+- 队列写满时按溢出策略处理：丢弃最旧的消息，或写入磁盘文件，队列有空位时再按顺序读回
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from app.unified_logger import logger
+
+# 溢出策略
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_SPILL = 'spill'
+
+# 默认每个聊天对象在内存中保留的消息数量
+DEFAULT_MAX_PER_CHAT = 1000
+
+
+class ChatBuffer:
+    """单个聊天对象的消息队列"""
+
+    def __init__(self, chat_name, max_size, spill_path=None):
+        self.chat_name = chat_name
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # [序号, 消息, 是否已下发, 入队时间]
+        self.entries = deque()
+        self.spill_path = spill_path
+        self.spill_count = 0
+        self.spill_offset = 0
+        self.dropped = 0
+
+    def depth(self):
+        """缓冲的消息总数（含磁盘上的消息）"""
+        return len(self.entries) + self.spill_count
+
+    def oldest_age(self, now):
+        """最旧消息的等待时间（秒）"""
+        if not self.entries:
+            return 0.0
+        return now - self.entries[0][3]
+
+    def spill(self, entry):
+        """把消息追加到磁盘文件"""
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps([entry[0], entry[1], entry[3]], ensure_ascii=False) + '\n')
+        self.spill_count += 1
+
+    def refill(self):
+        """队列有空位时从磁盘文件按顺序读回消息"""
+        if not self.spill_count or len(self.entries) >= self.max_size:
+            return
+        try:
+            with open(self.spill_path, 'r', encoding='utf-8') as f:
+                f.seek(self.spill_offset)
+                while self.spill_count and len(self.entries) < self.max_size:
+                    line = f.readline()
+                    if not line:
+                        # 文件被外部删除或截断，剩余消息已无法恢复
+                        logger.warning(f"消息溢出文件不完整: {self.spill_path}, 丢失 {self.spill_count} 条消息")
+                        self.dropped += self.spill_count
+                        self.spill_count = 0
+                        break
+                    seq, message, enqueue_time = json.loads(line)
+                    self.entries.append([seq, message, False, enqueue_time])
+                    self.spill_count -= 1
+                self.spill_offset = f.tell()
+        except OSError as e:
+            logger.error(f"读取消息溢出文件失败: {self.spill_path}, 错误: {str(e)}")
+            self.dropped += self.spill_count
+            self.spill_count = 0
+
+        if not self.spill_count:
+            self.remove_spill_file()
+
+    def remove_spill_file(self):
+        """删除磁盘文件"""
+        self.spill_count = 0
+        self.spill_offset = 0
+        if self.spill_path:
+            try:
+                self.spill_path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"删除消息溢出文件失败: {self.spill_path}, 错误: {str(e)}")
+
+
+class MessageBuffer:
+    """监听消息缓冲区"""
+
+    def __init__(self, max_per_chat=DEFAULT_MAX_PER_CHAT, overflow=OVERFLOW_DROP_OLDEST, spill_dir=None):
+        """
+        Args:
+            max_per_chat: 每个聊天对象在内存中最多保留的消息数量
+            overflow: 溢出策略，drop_oldest或spill
+            spill_dir: spill策略使用的目录
+        """
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL):
+            logger.warning(f"未知的消息溢出策略: {overflow}，使用 {OVERFLOW_DROP_OLDEST}")
+            overflow = OVERFLOW_DROP_OLDEST
+        if overflow == OVERFLOW_SPILL and spill_dir is None:
+            logger.warning("未配置消息溢出目录，使用 drop_oldest 策略")
+            overflow = OVERFLOW_DROP_OLDEST
+
+        self.max_per_chat = max(1, int(max_per_chat))
+        self.overflow = overflow
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+
+        self._chats = {}
+        self._chats_lock = threading.Lock()
+        # itertools.count的next()在CPython中是原子操作，写入路径不需要全局锁
+        self._seq = itertools.count(1)
+        self._chat_ids = itertools.count(1)
+        self._counters = {'appended': 0, 'delivered': 0, 'acked': 0, 'dropped': 0, 'spilled': 0}
+        self._counters_lock = threading.Lock()
+        self._max_depth = 0
+
+        # 新消息通知：每追加一条消息版本号加一，等待方比较版本号判断是否有新消息
+        self._version = 0
+        self._version_cond = threading.Condition()
+
+        # 清理上次运行遗留的溢出文件，序号已重新开始，旧文件无法再确认
+        if self.spill_dir and self.spill_dir.exists():
+            for path in self.spill_dir.glob('*.jsonl'):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def _get_chat(self, chat_name):
+        """获取聊天对象的队列，不存在时创建"""
+        chat = self._chats.get(chat_name)
+        if chat is None:
+            with self._chats_lock:
+                chat = self._chats.get(chat_name)
+                if chat is None:
+                    spill_path = None
+                    if self.overflow == OVERFLOW_SPILL:
+                        spill_path = self.spill_dir / f"chat_{next(self._chat_ids)}.jsonl"
+                    chat = ChatBuffer(chat_name, self.max_per_chat, spill_path)
+                    self._chats[chat_name] = chat
+        return chat
+
+    def _count(self, name, value=1):
+        with self._counters_lock:
+            self._counters[name] += value
+
+    def _spill(self, chat, entry):
+        """写入溢出文件，失败时返回False"""
+        try:
+            chat.spill(entry)
+            return True
+        except OSError as e:
+            logger.error(f"写入消息溢出文件失败: {chat.spill_path}, 错误: {str(e)}")
+            return False
+
+    def append(self, chat_name, message):
+        """
+        追加一条消息，由监听回调线程调用
+
+        Args:
+            chat_name: 聊天对象
+            message: 可序列化的消息字典
+        """
+        chat = self._get_chat(chat_name)
+        entry = [next(self._seq), message, False, time.time()]
+        dropped = spilled = 0
+        with chat.lock:
+            if chat.spill_count or len(chat.entries) >= chat.max_size:
+                if self.overflow == OVERFLOW_SPILL and self._spill(chat, entry):
+                    spilled = 1
+                elif chat.spill_count:
+                    # 磁盘上还有更早的消息，不能插队，只能丢弃当前消息
+                    dropped = 1
+                else:
+                    chat.entries.popleft()
+                    dropped = 1
+                chat.dropped += dropped
+            if not spilled and not (dropped and chat.spill_count):
+                chat.entries.append(entry)
+            depth = chat.depth()
+            chat_dropped = chat.dropped
+
+        with self._counters_lock:
+            self._counters['appended'] += 1
+            self._counters['dropped'] += dropped
+            self._counters['spilled'] += spilled
+            if depth > self._max_depth:
+                self._max_depth = depth
+        with self._version_cond:
+            self._version += 1
+            self._version_cond.notify_all()
+
+        # 持续溢出时只间隔记录日志，避免日志刷屏
+        if dropped and (chat_dropped == 1 or chat_dropped % 100 == 0):
+            logger.warning(f"监听消息队列已满，{chat_name} 累计丢弃 {chat_dropped} 条消息")
+
+    def drain(self, max_chats=None, per_chat_limit=None, max_total=None, retain=False, only_new=False):
+        """
+        取出消息
+
+        Args:
+            max_chats: 最多返回的聊天对象数量，None表示不限
+            per_chat_limit: 每个聊天对象最多返回的消息数量，None表示不限
+            max_total: 本次最多返回的消息总数，None表示不限
+            retain: 为True时消息只标记为已下发，收到确认后才从缓冲区删除
+            only_new: retain模式下跳过已下发但未确认的消息（推送连接使用）
+
+        Returns:
+            tuple: (聊天对象 -> 消息列表, 游标, 缓冲区中剩余未返回的消息数)
+        """
+        messages = {}
+        cursor = None
+        remaining = 0
+        total = 0
+        with self._chats_lock:
+            chats = list(self._chats.values())
+
+        for chat in chats:
+            with chat.lock:
+                depth = chat.depth()
+                if not depth:
+                    continue
+                start = 0
+                if retain and only_new:
+                    # 已下发的消息一定是队列的前缀
+                    while start < len(chat.entries) and chat.entries[start][2]:
+                        start += 1
+                    depth -= start
+                take = len(chat.entries) - start
+                if per_chat_limit is not None:
+                    take = min(take, per_chat_limit)
+                if max_total is not None:
+                    take = min(take, max_total - total)
+                if max_chats is not None and len(messages) >= max_chats:
+                    take = 0
+                remaining += depth - max(take, 0)
+                if take <= 0:
+                    continue
+
+                if retain:
+                    batch = list(itertools.islice(chat.entries, start, start + take))
+                    for entry in batch:
+                        entry[2] = True
+                else:
+                    batch = [chat.entries.popleft() for _ in range(take)]
+                    chat.refill()
+
+            messages[chat.chat_name] = [entry[1] for entry in batch]
+            total += take
+            cursor = max(cursor or 0, batch[-1][0])
+
+        if total:
+            self._count('delivered', total)
+        return messages, cursor, remaining
+
+    @property
+    def version(self):
+        """当前版本号，在取消息之前读取，用于之后的wait()"""
+        return self._version
+
+    def wait(self, version, timeout):
+        """
+        等待新消息
+
+        Args:
+            version: 调用方上次读取的版本号
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            int: 最新的版本号，与传入的版本号相同表示超时
+        """
+        with self._version_cond:
+            self._version_cond.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def ack(self, cursor):
+        """
+        确认游标之前已下发的消息，从缓冲区删除
+
+        每个聊天对象的消息总是从头开始下发，已下发的消息一定是队列的前缀。
+
+        Returns:
+            int: 删除的消息数量
+        """
+        acked = 0
+        with self._chats_lock:
+            chats = list(self._chats.values())
+
+        for chat in chats:
+            with chat.lock:
+                entries = chat.entries
+                count = 0
+                while entries and entries[0][2] and entries[0][0] <= cursor:
+                    entries.popleft()
+                    count += 1
+                if count:
+                    chat.refill()
+            acked += count
+
+        if acked:
+            self._count('acked', acked)
+        return acked
+
+    def remove_chat(self, chat_name):
+        """
+        移除聊天对象及其所有缓冲消息
+
+        Returns:
+            bool: 是否存在该聊天对象
+        """
+        with self._chats_lock:
+            chat = self._chats.pop(chat_name, None)
+        if chat is None:
+            return False
+        with chat.lock:
+            chat.entries.clear()
+            chat.remove_spill_file()
+        return True
+
+    def get_stats(self):
+        """
+        获取缓冲区指标
+
+        Returns:
+            dict: 总体计数、当前深度和每个聊天对象的深度、丢弃数、最旧消息等待时间
+        """
+        now = time.time()
+        with self._chats_lock:
+            chats = list(self._chats.values())
+
+        chat_stats = {}
+        total_depth = 0
+        oldest_age = 0.0
+        for chat in chats:
+            with chat.lock:
+                depth = chat.depth()
+                age = chat.oldest_age(now)
+                chat_stats[chat.chat_name] = {
+                    'depth': depth,
+                    'in_memory': len(chat.entries),
+                    'spilled': chat.spill_count,
+                    'dropped': chat.dropped,
+                    'oldest_age': round(age, 3)
+                }
+            total_depth += depth
+            oldest_age = max(oldest_age, age)
+
+        with self._counters_lock:
+            counters = dict(self._counters)
+            max_depth = self._max_depth
+
+        return {
+            'max_per_chat': self.max_per_chat,
+            'overflow': self.overflow,
+            'chats': len(chat_stats),
+            'depth': total_depth,
+            'max_depth': max_depth,
+            'oldest_age': round(oldest_age, 3),
+            **counters,
+            'per_chat': chat_stats
+        }
+
+
+def _create_message_buffer():
+    """根据配置创建全局缓冲区"""
+    try:
+        from app.config import Config
+        return MessageBuffer(
+            max_per_chat=Config.MESSAGE_BUFFER_SIZE,
+            overflow=Config.MESSAGE_BUFFER_OVERFLOW,
+            spill_dir=Config.API_DIR / "message_spill"
+        )
+    except Exception as e:
+        logger.error(f"加载消息缓冲区配置失败，使用默认配置: {str(e)}")
+        return MessageBuffer()
+
+
+# 全局消息缓冲区
+message_buffer = _create_message_buffer()
@@ -0,0 +1,382 @@
+"""
+运行指标模块
+统计每个接口的耗时分布、进行中的请求数和微信自动化方法的耗时，
+并与队列、消息缓存、资源采样等模块的统计一起导出为Prometheus文本格式
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# 耗时直方图的桶上界（毫秒）
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# 导出的分位数
+EXPORTED_QUANTILES = (0.5, 0.95, 0.99)
+
+# 未匹配到路由的请求（404等）统一使用的路由标签，避免任意路径产生大量标签
+UNMATCHED_ROUTE = 'unmatched'
+
+# 指标名前缀
+METRIC_PREFIX = 'wxauto'
+
+
+class LatencyHistogram:
+    """耗时直方图，按固定的桶统计并估算分位数"""
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        # 最后一个桶统计超过最大上界的值
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds):
+        """记录一次耗时（秒）"""
+        value_ms = seconds * 1000
+        self.counts[bisect_left(self.buckets_ms, value_ms)] += 1
+        self.count += 1
+        self.sum_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def percentile(self, fraction):
+        """按桶上界估算分位数（毫秒）"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                if index < len(self.buckets_ms):
+                    return round(min(self.buckets_ms[index], self.max_ms), 3)
+                break
+        return round(self.max_ms, 3)
+
+    def snapshot(self):
+        """导出直方图数据"""
+        buckets = {f"le_{bound}": count for bound, count in zip(self.buckets_ms, self.counts)}
+        buckets['le_inf'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'sum_ms': round(self.sum_ms, 3),
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': buckets
+        }
+
+
+class MetricsRegistry:
+    """
+    运行指标注册表
+
+    请求指标按(方法, 路由模板)统计，路由使用Flask的规则字符串（如/api/chat/<id>），标签数量有限；
+    微信方法指标按适配器上被调用的方法名统计。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}       # (method, route) -> {'latency': LatencyHistogram, 'statuses': {status: count}}
+        self._in_flight = {}      # route -> 进行中的请求数
+        self._wechat_calls = {}   # method -> {'latency': LatencyHistogram, 'errors': int}
+        self.started_at = time.time()
+
+    def request_started(self, route):
+        """记录请求开始"""
+        with self._lock:
+            self._in_flight[route] = self._in_flight.get(route, 0) + 1
+
+    def request_ended(self, route):
+        """记录请求结束（无论成功与否），与request_started成对调用"""
+        with self._lock:
+            self._in_flight[route] = max(self._in_flight.get(route, 0) - 1, 0)
+
+    def observe_request(self, method, route, status_code, seconds):
+        """记录一次请求的状态码和耗时"""
+        key = (method, route)
+        with self._lock:
+            stats = self._requests.get(key)
+            if stats is None:
+                stats = self._requests[key] = {'latency': LatencyHistogram(), 'statuses': {}}
+            stats['latency'].observe(seconds)
+            stats['statuses'][status_code] = stats['statuses'].get(status_code, 0) + 1
+
+    def observe_wechat_call(self, method, seconds, failed=False):
+        """记录一次微信自动化方法调用的耗时"""
+        with self._lock:
+            stats = self._wechat_calls.get(method)
+            if stats is None:
+                stats = self._wechat_calls[method] = {'latency': LatencyHistogram(), 'errors': 0}
+            stats['latency'].observe(seconds)
+            if failed:
+                stats['errors'] += 1
+
+    def get_stats(self):
+        """获取指标快照"""
+        with self._lock:
+            return {
+                'requests': [
+                    {
+                        'method': method,
+                        'route': route,
+                        'statuses': dict(stats['statuses']),
+                        'latency': stats['latency'].snapshot()
+                    }
+                    for (method, route), stats in sorted(self._requests.items())
+                ],
+                'in_flight': dict(self._in_flight),
+                'wechat_calls': {
+                    method: {'errors': stats['errors'], 'latency': stats['latency'].snapshot()}
+                    for method, stats in sorted(self._wechat_calls.items())
+                }
+            }
+
+    def render(self):
+        """
+        导出Prometheus文本格式的全部指标
+
+        队列、消息缓存等模块按需导入，某个模块不可用时跳过对应指标，不影响其他指标的导出
+        """
+        writer = _PrometheusWriter()
+        stats = self.get_stats()
+
+        writer.gauge('uptime_seconds', '服务运行时间', [({}, round(time.time() - self.started_at, 3))])
+
+        writer.counter('http_requests_total', '按路由和状态码统计的请求数', [
+            ({'method': item['method'], 'route': item['route'], 'status': status}, count)
+            for item in stats['requests']
+            for status, count in sorted(item['statuses'].items())
+        ])
+        writer.histogram('http_request_duration_seconds', '接口处理耗时', [
+            ({'method': item['method'], 'route': item['route']}, item['latency'])
+            for item in stats['requests']
+        ])
+        writer.gauge('http_requests_in_flight', '正在处理的请求数', [
+            ({'route': route}, count) for route, count in sorted(stats['in_flight'].items())
+        ])
+
+        writer.histogram('wechat_call_duration_seconds', '微信自动化方法调用耗时', [
+            ({'method': method}, item['latency']) for method, item in stats['wechat_calls'].items()
+        ])
+        writer.counter('wechat_call_errors_total', '微信自动化方法调用失败次数', [
+            ({'method': method}, item['errors']) for method, item in stats['wechat_calls'].items()
+        ])
+
+        for collect in (_collect_queue, _collect_message_buffer, _collect_chat_cache, _collect_resources):
+            try:
+                collect(writer)
+            except Exception as e:
+                writer.comment(f"{collect.__name__} failed: {e}")
+
+        return writer.text()
+
+
+class _PrometheusWriter:
+    """Prometheus文本格式（0.0.4）的简单生成器"""
+
+    def __init__(self):
+        self._lines = []
+
+    def comment(self, text):
+        self._lines.append(f"# {_single_line(text)}")
+
+    def _header(self, name, help_text, metric_type):
+        self._lines.append(f"# HELP {name} {_single_line(help_text)}")
+        self._lines.append(f"# TYPE {name} {metric_type}")
+
+    def _sample(self, name, labels, value):
+        self._lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def gauge(self, name, help_text, samples):
+        self._simple(name, help_text, 'gauge', samples)
+
+    def counter(self, name, help_text, samples):
+        self._simple(name, help_text, 'counter', samples)
+
+    def _simple(self, name, help_text, metric_type, samples):
+        name = f"{METRIC_PREFIX}_{name}"
+        self._header(name, help_text, metric_type)
+        for labels, value in samples:
+            self._sample(name, labels, value)
+
+    def histogram(self, name, help_text, samples):
+        """
+        写入直方图
+
+        samples中的直方图为LatencyHistogram.snapshot()，桶计数是非累计的毫秒桶，这里转换为累计的秒桶；
+        另外附带一组按桶估算的分位数gauge，便于直接查看p50/p95/p99
+        """
+        samples = list(samples)
+        name = f"{METRIC_PREFIX}_{name}"
+        self._header(name, help_text, 'histogram')
+        for labels, snapshot in samples:
+            cumulative = 0
+            for bucket, count in snapshot['buckets'].items():
+                cumulative += count
+                bound = bucket[len('le_'):]
+                le = '+Inf' if bound == 'inf' else _format_value(int(bound) / 1000)
+                self._sample(f"{name}_bucket", dict(labels, le=le), cumulative)
+            self._sample(f"{name}_sum", labels, snapshot['sum_ms'] / 1000)
+            self._sample(f"{name}_count", labels, snapshot['count'])
+
+        quantile_name = f"{name[:-len('_seconds')]}_quantile_seconds"
+        self._header(quantile_name, f"{help_text}（按桶估算的分位数）", 'gauge')
+        for labels, snapshot in samples:
+            for quantile in EXPORTED_QUANTILES:
+                value = snapshot[f"p{int(quantile * 100)}_ms"] / 1000
+                self._sample(quantile_name, dict(labels, quantile=str(quantile)), value)
+
+    def text(self):
+        return '\n'.join(self._lines) + '\n'
+
+
+def _single_line(text):
+    return str(text).replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(round(float(value), 6))
+
+
+def _collect_queue(writer):
+    """请求队列：各类任务的排队数、排队等待时间（即等待UI线程的时间）和执行耗时"""
+    from app.api_queue import get_queue_stats
+
+    stats = get_queue_stats()
+    classes = stats['classes']
+    writer.gauge('queue_pending', '排队中的任务数', [
+        ({'class': task_class}, item['pending']) for task_class, item in classes.items()
+    ])
+    writer.counter('queue_tasks_total', '已完成的任务数', [
+        ({'class': task_class}, item['completed']) for task_class, item in classes.items()
+    ])
+    writer.counter('queue_task_errors_total', '执行失败的任务数', [
+        ({'class': task_class}, item['errors']) for task_class, item in classes.items()
+    ])
+    writer.histogram('queue_wait_seconds', '任务排队等待耗时，UI任务即等待UI执行线程的时间', [
+        ({'class': task_class}, item['queue_wait']) for task_class, item in classes.items()
+    ])
+    writer.histogram('queue_service_seconds', '任务执行耗时', [
+        ({'class': task_class}, item['service_time']) for task_class, item in classes.items()
+    ])
+    writer.counter('queue_promoted_total', '等待超时后提前执行的低优先级UI任务数', [
+        ({'class': task_class}, item['promoted']) for task_class, item in classes.items() if 'promoted' in item
+    ])
+    writer.gauge('queue_oldest_ready_wait_seconds', '各类UI任务中等待最久的就绪任务的等待时间', [
+        ({'class': task_class}, round(item['oldest_ready_wait_ms'] / 1000, 6))
+        for task_class, item in classes.items() if 'oldest_ready_wait_ms' in item
+    ])
+    writer.gauge('queue_busy_chats', '有任务正在执行的聊天对象数', [({}, stats['busy_chats'])])
+    writer.counter('queue_events_total', '队列合并、取消和批量执行的次数', [
+        ({'event': 'coalesced'}, stats['coalesced_count']),
+        ({'event': 'cancelled'}, stats['cancelled_count']),
+        ({'event': 'batch'}, stats['batch_count']),
+        ({'event': 'batched_task'}, stats['batched_task_count'])
+    ])
+
+
+def _collect_message_buffer(writer):
+    """监听消息缓存：总深度、各聊天的深度和累计计数"""
+    from app.message_buffer import message_buffer
+
+    stats = message_buffer.get_stats()
+    writer.gauge('listen_buffer_depth', '缓存中未确认的消息数', [({}, stats['depth'])])
+    writer.gauge('listen_buffer_chat_depth', '各聊天缓存中未确认的消息数', [
+        ({'chat': chat}, item['depth']) for chat, item in sorted(stats['per_chat'].items())
+    ])
+    writer.gauge('listen_buffer_oldest_age_seconds', '缓存中最早一条未确认消息的等待时间', [
+        ({}, stats['oldest_age'])
+    ])
+    writer.counter('listen_buffer_messages_total', '缓存消息的累计计数', [
+        ({'event': event}, stats[event]) for event in ('appended', 'delivered', 'acked', 'dropped', 'spilled')
+    ])
+
+
+def _collect_chat_cache(writer):
+    """微信适配器的聊天切换缓存命中统计"""
+    from app.wechat import wechat_manager
+
+    wx_instance = wechat_manager.get_instance()
+    if not wx_instance or not hasattr(wx_instance, 'get_chat_cache_stats'):
+        return
+    stats = wx_instance.get_chat_cache_stats()
+    writer.counter('chat_switch_total', '切换聊天的次数，按是否命中缓存区分', [
+        ({'result': 'focus_hit'}, stats['focus_hits']),
+        ({'result': 'subwindow_hit'}, stats['subwindow_hits']),
+        ({'result': 'miss'}, stats['misses'])
+    ])
+    writer.gauge('chat_subwindows_cached', '缓存的已打开子窗口数', [({}, stats['subwindows'])])
+
+
+def _collect_resources(writer):
+    """后台采样的系统和进程资源"""
+    from app.system_monitor import resource_sampler
+
+    snapshot = resource_sampler.snapshot()
+    writer.gauge('system_cpu_percent', '系统CPU使用率', [({}, snapshot['cpu']['usage_percent'])])
+    writer.gauge('system_memory_percent', '系统内存使用率', [({}, snapshot['memory']['usage_percent'])])
+    writer.gauge('process_cpu_percent', '本进程CPU使用率', [({}, snapshot['process']['cpu_percent'])])
+    writer.gauge('process_memory_megabytes', '本进程内存占用（MB）', [({}, snapshot['process']['memory'])])
+    writer.gauge('process_threads', '本进程线程数', [({}, snapshot['process']['threads'])])
+
+
+def timed_wechat_call(method, func):
+    """包装微信自动化方法，记录每次调用的耗时和是否失败"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            metrics.observe_wechat_call(method, time.perf_counter() - start, failed)
+    return wrapper
+
+
+def init_app(app):
+    """为Flask应用的所有请求注册指标统计钩子"""
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_before_request():
+        g.metrics_start = time.perf_counter()
+        g.metrics_route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+        metrics.request_started(g.metrics_route)
+
+    @app.after_request
+    def _metrics_after_request(response):
+        if 'metrics_start' in g:
+            metrics.observe_request(request.method, g.metrics_route, response.status_code,
+                                    time.perf_counter() - g.metrics_start)
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown_request(exc=None):
+        route = g.pop('metrics_route', None)
+        if route is not None:
+            metrics.request_ended(route)
+
+
+# 创建全局实例
+metrics = MetricsRegistry()
@@ -10,6 +10,7 @@
 from app.unified_logger import logger
 from app.config import Config
 from app.api_queue import start_queue_processors, stop_queue_processors
+from app.system_monitor import resource_sampler
 
 # 导入互斥锁模块
 try:
@@ -94,6 +95,7 @@ def cleanup():
     """退出时清理资源"""
     logger.info("正在停止队列处理器...")
     stop_queue_processors()
+    resource_sampler.stop()
 
     # 关闭统一日志管理器
     try:
@@ -181,6 +183,12 @@ def signal_handler(sig, frame):
         logger.error(traceback.format_exc())
         sys.exit(3)  # 返回码3表示队列处理器启动失败
 
+    # 启动系统资源采样线程，接口直接读取采样缓存
+    try:
+        resource_sampler.start()
+    except Exception as e:
+        logger.error(f"启动系统资源采样失败: {str(e)}")
+
     # 创建应用
     try:
         app = create_app()
@@ -1,28 +1,139 @@
+import threading
+import time
+from collections import deque
+
 import psutil
 
-def get_system_resources():
+from app.unified_logger import logger
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 2.0
+# 保留的历史采样数量（默认约5分钟）
+HISTORY_SIZE = 150
+
+
+def _percentiles(values):
+    """计算一组采样值的p50/p95/最大值"""
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        'p50': ordered[int(last * 0.5)],
+        'p95': ordered[int(last * 0.95 + 0.5)],
+        'max': ordered[last]
+    }
+
+
+class ResourceSampler:
+    """
+    后台系统资源采样器
+
+    采样线程按固定间隔读取CPU、内存和本进程的资源占用，保存最新快照和最近一段时间的历史；
+    接口只读取缓存的快照，不再在请求线程中阻塞等待CPU采样。
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, history_size=HISTORY_SIZE):
+        self.interval = interval
+        self._history = deque(maxlen=history_size)
+        self._latest = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._process = psutil.Process()
+
+    def start(self):
+        """启动采样线程，已启动时直接返回"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            # 首次短暂阻塞采样一次，保证启动后立即有可用的快照；同时作为后续非阻塞采样的基准
+            self._process.cpu_percent(interval=None)
+            self._record(psutil.cpu_percent(interval=0.1))
+            self._thread = threading.Thread(target=self._run, daemon=True, name="ResourceSampler")
+            self._thread.start()
+
+    def stop(self):
+        """停止采样线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                # interval=None返回距上一次调用期间的CPU使用率，即一个采样间隔内的平均值
+                self._record(psutil.cpu_percent(interval=None))
+            except Exception as e:
+                logger.error(f"系统资源采样失败: {str(e)}")
+
+    def _record(self, cpu_percent):
+        memory = psutil.virtual_memory()
+        with self._process.oneshot():
+            process_memory = self._process.memory_info().rss
+            process_cpu = self._process.cpu_percent(interval=None)
+            process_threads = self._process.num_threads()
+
+        snapshot = {
+            'cpu': {
+                'usage_percent': cpu_percent,
+                'core_count': psutil.cpu_count()
+            },
+            'memory': {
+                'total': int(memory.total / (1024 * 1024)),  # 转换为MB
+                'used': int(memory.used / (1024 * 1024)),    # 转换为MB
+                'free': int(memory.available / (1024 * 1024)),  # 转换为MB
+                'usage_percent': memory.percent
+            },
+            'process': {
+                'cpu_percent': process_cpu,
+                'memory': int(process_memory / (1024 * 1024)),  # 转换为MB
+                'threads': process_threads
+            },
+            'sampled_at': time.time()
+        }
+        # 快照整体替换，读取方无需加锁
+        self._latest = snapshot
+        self._history.append((cpu_percent, memory.percent, process_cpu, snapshot['process']['memory']))
+
+    def snapshot(self):
+        """获取最新的资源快照，采样线程未启动时先启动"""
+        if self._latest is None or not self._thread:
+            self.start()
+        return self._latest
+
+    def history_stats(self):
+        """获取历史采样的分位数统计"""
+        history = list(self._history)
+        return {
+            'samples': len(history),
+            'window_seconds': int(len(history) * self.interval),
+            'cpu_percent': _percentiles([item[0] for item in history]),
+            'memory_percent': _percentiles([item[1] for item in history]),
+            'process_cpu_percent': _percentiles([item[2] for item in history]),
+            'process_memory': _percentiles([item[3] for item in history])
+        }
+
+
+# 创建全局实例
+resource_sampler = ResourceSampler()
+
+
+def get_system_resources(include_history=True):
     """
     获取系统CPU和内存使用情况
-    
+
+    读取后台采样线程缓存的快照，不阻塞调用方
+
+    Args:
+        include_history: 是否附带最近一段时间的分位数统计
+
     Returns:
-        dict: 包含CPU和内存使用情况的字典
+        dict: 包含CPU、内存和本进程资源使用情况的字典
     """
-    # 获取CPU信息
-    cpu_percent = psutil.cpu_percent(interval=1)
-    cpu_count = psutil.cpu_count()
-    
-    # 获取内存信息
-    memory = psutil.virtual_memory()
-    
-    return {
-        'cpu': {
-            'usage_percent': cpu_percent,
-            'core_count': cpu_count
-        },
-        'memory': {
-            'total': int(memory.total / (1024 * 1024)),  # 转换为MB
-            'used': int(memory.used / (1024 * 1024)),    # 转换为MB
-            'free': int(memory.available / (1024 * 1024)),  # 转换为MB
-            'usage_percent': memory.percent
-        }
-    } 
\ No newline at end of file
+    resources = dict(resource_sampler.snapshot())
+    if include_history:
+        resources['history'] = resource_sampler.history_stats()
+    return resources
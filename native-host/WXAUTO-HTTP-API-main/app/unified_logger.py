@@ -3,6 +3,7 @@
 实现标准格式：[时间戳] [库名称] [日志级别] 日志内容 (重复 X 次，最后: 时间戳)
 """
 
+import queue
 import sys
 import threading
 import time
@@ -42,6 +43,7 @@ def __init__(self, max_age_seconds: int = 60):
         self.max_age_seconds = max_age_seconds
         self.entries: Dict[str, LogEntry] = {}
         self._lock = threading.Lock()
+        self._last_cleanup = datetime.now()
     
     def add_entry(self, entry: LogEntry) -> Optional[LogEntry]:
         """添加日志条目，返回需要输出的条目（如果有）"""
@@ -82,8 +84,11 @@ def _get_key(self, entry: LogEntry) -> str:
         return f"{entry.lib_name}:{entry.level}:{entry.message}"
     
     def _cleanup_old_entries(self):
-        """清理过期条目"""
+        """清理过期条目，最多每秒遍历一次"""
         current_time = datetime.now()
+        if (current_time - self._last_cleanup).total_seconds() < 1:
+            return
+        self._last_cleanup = current_time
         expired_keys = []
         
         for key, entry in self.entries.items():
@@ -120,14 +125,28 @@ def __init__(self, log_dir: str = "data/api/logs"):
     
     def write(self, formatted_log: str):
         """写入日志到文件"""
+        self.write_lines([formatted_log], flush=True)
+
+    def write_lines(self, lines: List[str], flush: bool = False):
+        """批量写入日志到文件，flush为False时由文件缓冲区决定何时落盘"""
         with self._lock:
             self._ensure_file()
             if self._current_file:
                 try:
-                    self._current_file.write(formatted_log + '\n')
-                    self._current_file.flush()
+                    self._current_file.write('\n'.join(lines) + '\n')
+                    if flush:
+                        self._current_file.flush()
                 except Exception:
                     pass  # 忽略写入错误
+
+    def flush(self):
+        """把缓冲的日志写入磁盘"""
+        with self._lock:
+            if self._current_file:
+                try:
+                    self._current_file.flush()
+                except Exception:
+                    pass
     
     def _ensure_file(self):
         """确保日志文件存在且是当天的"""
@@ -151,7 +170,25 @@ def _ensure_file(self):
 
 
 class UnifiedLogger:
-    """统一日志管理器"""
+    """
+    统一日志管理器
+
+    调用方只把日志条目放入有界队列；后台写入线程负责聚合、格式化，
+    并批量写文件、控制台和UI处理器，按时间间隔或缓冲大小刷新文件。
+    队列积压时先丢弃DEBUG日志，队列满时其他级别最多等待LOG_BLOCK_TIMEOUT秒后丢弃。
+    """
+
+    # 日志队列容量
+    LOG_QUEUE_SIZE = 10000
+    # 队列积压超过该比例时丢弃DEBUG日志
+    DEBUG_DROP_RATIO = 0.8
+    # 队列满时非DEBUG日志最多等待的时间（秒）
+    LOG_BLOCK_TIMEOUT = 1.0
+    # 每批最多处理的日志条数
+    LOG_BATCH_SIZE = 500
+    # 文件刷新间隔（秒）和未刷新数据的上限（字符数）
+    FLUSH_INTERVAL = 0.5
+    FLUSH_SIZE = 64 * 1024
     
     def __init__(self):
         self.aggregator = LogAggregator()
@@ -160,10 +197,15 @@ def __init__(self):
         self.ui_handlers: List[Callable[[str], None]] = []
         self.console_enabled = True
         self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self.LOG_QUEUE_SIZE)
+        self._debug_drop_threshold = int(self.LOG_QUEUE_SIZE * self.DEBUG_DROP_RATIO)
+        self._dropped = 0
+        self._dropped_reported = 0
         
-        # 启动聚合处理线程
+        # 启动后台写入线程（同时处理聚合日志）
         self._running = True
-        self._aggregation_thread = threading.Thread(target=self._process_aggregation, daemon=True)
+        self._aggregation_thread = threading.Thread(target=self._process_queue, daemon=True,
+                                                    name="UnifiedLoggerWriter")
         self._aggregation_thread.start()
     
     def add_ui_handler(self, handler: Callable[[str], None]):
@@ -178,14 +220,23 @@ def remove_ui_handler(self, handler: Callable[[str], None]):
                 self.ui_handlers.remove(handler)
     
     def log(self, lib_name: str, level: str, message: str):
-        """记录日志"""
+        """记录日志，只入队，不在调用线程中做任何I/O"""
         entry = LogEntry(datetime.now(), lib_name, level, message)
-        
-        # 聚合处理
-        output_entry = self.aggregator.add_entry(entry)
-        
-        if output_entry:
-            self._output_entry(output_entry)
+
+        if not self._running:
+            # 已关闭时直接同步输出
+            self._output_entries([entry])
+            return
+
+        try:
+            if level == "DEBUG":
+                if self._queue.qsize() >= self._debug_drop_threshold:
+                    raise queue.Full
+                self._queue.put_nowait(entry)
+            else:
+                self._queue.put(entry, timeout=self.LOG_BLOCK_TIMEOUT)
+        except queue.Full:
+            self._dropped += 1
     
     def info(self, lib_name: str, message: str):
         """记录INFO级别日志"""
@@ -205,10 +256,16 @@ def debug(self, lib_name: str, message: str):
     
     def _output_entry(self, entry: LogEntry):
         """输出日志条目"""
-        formatted_log = self.formatter.format_entry(entry)
+        self._output_entries([entry], flush=True)
+
+    def _output_entries(self, entries: List[LogEntry], flush: bool = True):
+        """批量输出日志条目"""
+        lines = [self.formatter.format_entry(entry) for entry in entries]
+        if not lines:
+            return
 
         # 写入文件
-        self.file_handler.write(formatted_log)
+        self.file_handler.write_lines(lines, flush=flush)
 
         # 控制台输出 - 添加安全检查
         if self.console_enabled:
@@ -219,7 +276,7 @@ def _output_entry(self, entry: LogEntry):
                     self.console_enabled = False
                 elif hasattr(sys.stdout, 'write'):
                     # 尝试写入，如果失败则禁用控制台输出
-                    print(formatted_log)
+                    print('\n'.join(lines))
                 else:
                     # stdout 不可用，禁用控制台输出
                     self.console_enabled = False
@@ -233,28 +290,84 @@ def _output_entry(self, entry: LogEntry):
 
         # UI处理器
         with self._lock:
-            for handler in self.ui_handlers:
+            handlers = list(self.ui_handlers)
+        for handler in handlers:
+            for formatted_log in lines:
                 try:
                     handler(formatted_log)
                 except Exception:
                     pass  # 忽略UI处理器错误
+
+    def _drain(self, first: Optional[LogEntry]) -> List[LogEntry]:
+        """取出一批日志条目并经过聚合，返回需要输出的条目"""
+        batch = []
+        entry = first
+        while entry is not None:
+            output_entry = self.aggregator.add_entry(entry)
+            if output_entry:
+                batch.append(output_entry)
+            if len(batch) >= self.LOG_BATCH_SIZE:
+                break
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                entry = None
+        return batch
+
+    def _report_dropped(self) -> Optional[LogEntry]:
+        """队列满丢弃了日志时生成一条提示"""
+        dropped = self._dropped - self._dropped_reported
+        if dropped <= 0:
+            return None
+        self._dropped_reported += dropped
+        return LogEntry(datetime.now(), "Logger", "WARNING", f"日志队列已满，丢弃了 {dropped} 条日志")
     
-    def _process_aggregation(self):
-        """处理聚合日志的后台线程"""
-        while self._running:
+    def _process_queue(self):
+        """后台写入线程：批量输出日志，按间隔刷新文件并处理聚合日志"""
+        last_flush = time.time()
+        last_aggregation = last_flush
+        unflushed = 0
+
+        while self._running or not self._queue.empty():
             try:
-                # 获取待输出的聚合条目
-                pending_entries = self.aggregator.get_pending_entries()
-                
-                for entry in pending_entries:
-                    self._output_entry(entry)
-                
-                time.sleep(1)  # 每秒检查一次
+                try:
+                    first = self._queue.get(timeout=self.FLUSH_INTERVAL)
+                except queue.Empty:
+                    first = None
+
+                batch = self._drain(first)
+                dropped_entry = self._report_dropped()
+                if dropped_entry:
+                    batch.append(dropped_entry)
+
+                now = time.time()
+                if now - last_aggregation >= 1:
+                    # 输出有重复的聚合条目
+                    batch.extend(self.aggregator.get_pending_entries())
+                    last_aggregation = now
+
+                if batch:
+                    self._output_entries(batch, flush=False)
+                    unflushed += sum(len(entry.message) for entry in batch)
+
+                if unflushed and (unflushed >= self.FLUSH_SIZE or now - last_flush >= self.FLUSH_INTERVAL):
+                    self.file_handler.flush()
+                    unflushed = 0
+                    last_flush = now
             except Exception:
                 pass  # 忽略处理错误
+
+        self.file_handler.flush()
+
+    def flush(self, timeout: float = 5):
+        """等待队列中的日志全部写出"""
+        deadline = time.time() + timeout
+        while not self._queue.empty() and time.time() < deadline:
+            time.sleep(0.01)
+        self.file_handler.flush()
     
     def shutdown(self):
-        """关闭日志管理器"""
+        """关闭日志管理器，写出队列中剩余的日志"""
         self._running = False
         if self._aggregation_thread.is_alive():
             self._aggregation_thread.join(timeout=5)
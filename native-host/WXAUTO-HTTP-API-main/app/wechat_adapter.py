@@ -10,6 +10,7 @@
 import time
 import pythoncom
 import logging
+from collections import OrderedDict
 from typing import Optional, Union, List, Dict, Any
 
 
@@ -25,6 +26,25 @@
     )
     logger = logging.getLogger("wechat_adapter")
 
+from app.metrics import timed_wechat_call
+
+# 主窗口当前聊天缓存的有效期（秒），超时后重新切换
+CHAT_FOCUS_TTL = 10.0
+# 缓存的已打开子窗口数量
+SUBWINDOW_CACHE_SIZE = 8
+# 作用于当前聊天的方法，目标在子窗口中时优先调用子窗口的同名方法
+CURRENT_CHAT_METHODS = frozenset({
+    'SendTypingText', 'SendFile', 'AtAll', 'SendEmotion', 'SendUrlCard', 'GetAllMessage', 'LoadMoreMessage'
+})
+# 不会改变主窗口当前聊天的只读方法
+FOCUS_SAFE_METHODS = frozenset({'CurrentChat', 'GetSessionList', 'IsOnline', 'GetMyInfo'})
+
+
+def _timed(func):
+    """记录适配器方法的调用耗时，指标按方法名统计"""
+    return timed_wechat_call(func.__name__, func)
+
+
 class WeChatAdapter:
     """微信自动化库适配器，支持wxauto和wxautox"""
 
@@ -37,6 +57,13 @@ def __init__(self, lib_name: str = 'wxauto', lazy_init: bool = False):
             lazy_init: 是否延迟初始化，如果为True，则不立即导入库
         """
         self._instance = None
+        # 聊天切换缓存：主窗口当前聊天、最近使用的子窗口，以及ChatWith选中的发送目标
+        self._chat_lock = threading.Lock()
+        self._focused_chat = None
+        self._focused_at = 0.0
+        self._subwindows = OrderedDict()
+        self._route_window = None
+        self._chat_stats = {'focus_hits': 0, 'subwindow_hits': 0, 'misses': 0, 'subwindow_errors': 0}
         self._lib_name = None
         self._requested_lib_name = lib_name  # 保存请求的库名称
         self._lock = threading.Lock()
@@ -478,10 +505,217 @@ def __getattr__(self, name):
 
         # 直接代理到实际实例，暂时禁用所有特殊处理
         try:
-            return getattr(self._instance, name)
+            attr = getattr(self._instance, name)
         except AttributeError:
             raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
 
+        if callable(attr) and name not in FOCUS_SAFE_METHODS:
+            route = self._route_window
+            if name in CURRENT_CHAT_METHODS and route:
+                # ChatWith选中的是子窗口：优先调用子窗口的方法，子窗口不支持时再切换主窗口
+                who, chat_wnd = route
+                sub_attr = getattr(chat_wnd, name, None)
+                if callable(sub_attr):
+                    return timed_wechat_call(name, sub_attr)
+                self._switch_main_chat(who)
+            elif name not in CURRENT_CHAT_METHODS:
+                # 其他操作可能切换主窗口的聊天
+                self._invalidate_chat_focus()
+        if callable(attr):
+            return timed_wechat_call(name, attr)
+        return attr
+
+    @_timed
+    def ChatWith(self, who, *args, **kwargs):
+        """
+        切换到指定聊天
+
+        目标已是主窗口的当前聊天，或已有打开的子窗口时，跳过搜索和切换，后续发送直接使用对应窗口
+
+        Returns:
+            str: 聊天名称
+        """
+        if not self._instance:
+            raise AttributeError("微信实例未初始化")
+
+        with self._chat_lock:
+            if self._is_focused(who):
+                self._chat_stats['focus_hits'] += 1
+                self._route_window = None
+                return who
+
+            chat_wnd = self._find_subwindow(who)
+            if chat_wnd is not None:
+                self._chat_stats['subwindow_hits'] += 1
+                self._route_window = (who, chat_wnd)
+                return who
+
+            self._chat_stats['misses'] += 1
+
+        return self._switch_main_chat(who, *args, **kwargs)
+
+    @_timed
+    def SendMsg(self, msg, *args, **kwargs):
+        """发送消息，ChatWith选中子窗口时通过子窗口发送"""
+        who = kwargs.pop('who', None)
+        if who:
+            self.ChatWith(who)
+
+        route = self._route_window
+        if route:
+            sent, result = self._subwindow_send(route, 'SendMsg', msg, *args, **self._subwindow_send_kwargs(kwargs))
+            if sent:
+                return result
+        return self._handle_SendMsg(msg, *args, **kwargs)
+
+    @_timed
+    def SendFiles(self, filepath, *args, **kwargs):
+        """发送文件，ChatWith选中子窗口时通过子窗口发送"""
+        who = kwargs.pop('who', None)
+        if who:
+            self.ChatWith(who)
+
+        route = self._route_window
+        if route and hasattr(route[1], 'SendFiles'):
+            sent, result = self._subwindow_send(route, 'SendFiles', filepath, *args, **kwargs)
+            if sent:
+                return result
+        elif route:
+            self._switch_main_chat(route[0])
+        return self._handle_SendFiles(filepath, *args, **kwargs)
+
+    def _switch_main_chat(self, who, *args, **kwargs):
+        """在主窗口中搜索并切换到指定聊天，记录切换结果"""
+        with self._chat_lock:
+            self._route_window = None
+            self._focused_chat = None
+        result = self._handle_ChatWith(who, *args, **kwargs)
+        with self._chat_lock:
+            if result:
+                self._focused_chat = result
+                self._focused_at = time.time()
+        return result
+
+    def _is_focused(self, who) -> bool:
+        """主窗口的当前聊天是否为who，调用方需持有_chat_lock"""
+        if self._focused_chat != who or time.time() - self._focused_at > CHAT_FOCUS_TTL:
+            return False
+        # 用户可能手动切换了聊天，支持CurrentChat时再确认一次（只读取，不搜索）
+        current_chat = getattr(self._instance, 'CurrentChat', None)
+        if current_chat is None:
+            return True
+        try:
+            return current_chat() == who
+        except Exception:
+            return False
+
+    def _find_subwindow(self, who):
+        """查找who已打开的子窗口，调用方需持有_chat_lock"""
+        chat_wnd = self._subwindows.get(who)
+        if chat_wnd is not None:
+            self._subwindows.move_to_end(who)
+            return chat_wnd
+
+        listen = getattr(self._instance, 'listen', None)
+        if isinstance(listen, dict):
+            chat_wnd = listen.get(who)
+            # 回调方式添加的监听（wxauto 4 / wxautox）保存的是(chat, callback)
+            if isinstance(chat_wnd, tuple):
+                chat_wnd = chat_wnd[0] if chat_wnd else None
+            if not hasattr(chat_wnd, 'SendMsg'):
+                chat_wnd = None
+        if chat_wnd is None and hasattr(self._instance, 'GetSubWindow'):
+            try:
+                chat_wnd = self._instance.GetSubWindow(who)
+            except Exception:
+                chat_wnd = None
+        if chat_wnd is None or not hasattr(chat_wnd, 'SendMsg'):
+            return None
+
+        self._subwindows[who] = chat_wnd
+        while len(self._subwindows) > SUBWINDOW_CACHE_SIZE:
+            self._subwindows.popitem(last=False)
+        return chat_wnd
+
+    def _subwindow_send_kwargs(self, kwargs):
+        """
+        转换子窗口发送的参数
+
+        与routes中直接调用聊天窗口的处理一致：wxautox的聊天窗口接受clear参数，
+        wxauto的聊天窗口不接受clear参数，需要去掉
+        """
+        if self._lib_name == "wxautox" or 'clear' not in kwargs:
+            return kwargs
+        kwargs = dict(kwargs)
+        kwargs.pop('clear')
+        return kwargs
+
+    @staticmethod
+    def _subwindow_exists(chat_wnd):
+        """子窗口是否仍然存在，无法判断时按存在处理"""
+        # wxauto 4 / wxautox的Chat对象为_api.control，旧版wxauto的ChatWnd为UiaAPI
+        control = getattr(getattr(chat_wnd, '_api', None), 'control', None) or getattr(chat_wnd, 'UiaAPI', None)
+        exists = getattr(control, 'Exists', None)
+        if exists is None:
+            return True
+        try:
+            return bool(exists(0))
+        except Exception:
+            return False
+
+    def _subwindow_send(self, route, method_name, *args, **kwargs):
+        """
+        通过子窗口发送
+
+        子窗口已关闭、缺少方法或参数不兼容时消息还没有发出，返回(False, None)，由调用方改用主窗口发送；
+        其他异常可能发生在消息已经发出之后，改用主窗口会重复发送，因此只把子窗口移出缓存并抛出异常
+
+        Returns:
+            tuple: (是否已通过子窗口发送, 发送结果)
+        """
+        who, chat_wnd = route
+        if not self._subwindow_exists(chat_wnd):
+            self._subwindow_failed(who, "子窗口已关闭")
+            return False, None
+        try:
+            return True, getattr(chat_wnd, method_name)(*args, **kwargs)
+        except (AttributeError, TypeError) as e:
+            self._subwindow_failed(who, e)
+            return False, None
+        except Exception as e:
+            logger.error(f"通过子窗口 {who} 调用 {method_name} 失败，消息可能已发出，不再改用主窗口重发: {str(e)}")
+            self._evict_subwindow(who)
+            raise
+
+    def _evict_subwindow(self, who):
+        """把子窗口移出缓存"""
+        with self._chat_lock:
+            self._chat_stats['subwindow_errors'] += 1
+            self._subwindows.pop(who, None)
+            self._route_window = None
+
+    def _subwindow_failed(self, who, error):
+        """子窗口不可用（可能已被关闭），移出缓存并切换主窗口"""
+        logger.warning(f"通过子窗口 {who} 发送失败，改用主窗口: {str(error)}")
+        self._evict_subwindow(who)
+        self._switch_main_chat(who)
+
+    def _invalidate_chat_focus(self):
+        """主窗口的当前聊天可能已变化"""
+        with self._chat_lock:
+            self._focused_chat = None
+            self._route_window = None
+
+    def get_chat_cache_stats(self) -> Dict[str, Any]:
+        """获取聊天切换缓存的命中统计"""
+        with self._chat_lock:
+            stats = dict(self._chat_stats)
+            lookups = stats['focus_hits'] + stats['subwindow_hits'] + stats['misses']
+            stats['hit_rate'] = round((stats['focus_hits'] + stats['subwindow_hits']) / lookups, 4) if lookups else 0.0
+            stats['focused_chat'] = self._focused_chat
+            stats['subwindows'] = len(self._subwindows)
+            return stats
+
     def _handle_ChatWith(self, *args, **kwargs):
         """处理ChatWith方法的差异"""
         if not self._instance:
@@ -1367,6 +1601,7 @@ def _handle_chat_window_method(self, chat_wnd, method_name, *args, **kwargs):
             # 重新抛出异常，让上层处理
             raise
 
+    @_timed
     def get_friend_list(self):
         """
         获取好友列表
@@ -1379,12 +1614,14 @@ def get_friend_list(self):
         
         try:
             # 使用GetAllFriends方法获取好友详细信息
+            self._invalidate_chat_focus()
             return self._instance.GetAllFriends()
         except Exception as e:
             logger.error(f"获取好友列表失败: {str(e)}")
             # 重新抛出异常，让上层处理
             raise
 
+    @_timed
     def get_group_list(self):
         """
         获取群聊列表
@@ -1397,6 +1634,7 @@ def get_group_list(self):
         
         try:
             # 使用GetAllGroups方法获取群组详细信息
+            self._invalidate_chat_focus()
             groups_info = self._instance.GetAllGroups()
             
             # 提取群聊名称和人数
@@ -1414,6 +1652,7 @@ def get_group_list(self):
             # 重新抛出异常，让上层处理
             raise
 
+    @_timed
     def GetNextNewMessage(self, *args, **kwargs):
         """
         获取下一条新消息 - 独立实现，无缓存机制
@@ -1431,6 +1670,9 @@ def GetNextNewMessage(self, *args, **kwargs):
 
         logger.debug(f"GetNextNewMessage调用，库: {self._lib_name}, 参数: args={args}, kwargs={kwargs}")
 
+        # 获取新消息会切换到有新消息的聊天
+        self._invalidate_chat_focus()
+
         try:
             if self._lib_name == "wxautox":
                 # wxautox只支持filter_mute参数
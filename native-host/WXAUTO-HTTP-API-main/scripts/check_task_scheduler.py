@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求队列调度检查
+
+使用独立的TaskScheduler实例（不涉及微信操作）检查调度器的顺序和公平性：
+- 同一聊天对象的添加、移除、再添加请求按提交顺序全部执行，不会越过中间的请求合并
+- 连续提交的相同请求仍然合并为一次执行
+- 持续有发送任务时，读取和管理任务在老化阈值之后得到执行，不会等到超时
+
+任何检查失败时以非零状态码退出，可在修改app/api_queue.py后运行。
+
+用法:
+    python scripts/check_task_scheduler.py
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.api_queue import TaskScheduler
+
+
+def _submit_and_wait(scheduler, results, index, func, args, task_class='admin', chat=None, coalesce=False):
+    task = scheduler.submit(func, args, task_class=task_class, chat=chat, coalesce=coalesce)
+    results[index] = scheduler.wait(task, 10)
+
+
+def _submit_in_order(scheduler, calls):
+    """先用一个阻塞任务占住聊天对象，保证后续请求都在排队，再按顺序提交calls"""
+    release = threading.Event()
+    blocker = scheduler.submit(release.wait, (10,), task_class='admin', chat='A')
+    results = [None] * len(calls)
+    threads = []
+    for index, (func, args, coalesce) in enumerate(calls):
+        thread = threading.Thread(target=_submit_and_wait,
+                                  args=(scheduler, results, index, func, args, 'admin', 'A', coalesce))
+        thread.start()
+        threads.append(thread)
+        # 等待提交完成，保证提交顺序
+        time.sleep(0.05)
+    release.set()
+    scheduler.wait(blocker, 10)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def check_coalesce_order():
+    """添加、移除、再添加同一监听对象"""
+    errors = []
+    listening = set()
+    executed = []
+
+    def add(who):
+        executed.append(('add', who))
+        listening.add(who)
+        return 'added'
+
+    def remove(who):
+        executed.append(('remove', who))
+        listening.discard(who)
+        return 'removed'
+
+    scheduler = TaskScheduler(io_workers=1)
+    scheduler.start()
+    try:
+        results = _submit_in_order(scheduler, [(add, ('A',), True), (remove, ('A',), True), (add, ('A',), True)])
+        if executed != [('add', 'A'), ('remove', 'A'), ('add', 'A')]:
+            errors.append(f"添加/移除/添加的执行顺序错误: {executed}")
+        if 'A' not in listening:
+            errors.append("最后一次添加后A不在监听列表中")
+        if [result[0] for result in results] != ['success'] * 3:
+            errors.append(f"请求结果错误: {results}")
+
+        executed.clear()
+        results = _submit_in_order(scheduler, [(add, ('B',), True), (add, ('B',), True)])
+        if executed != [('add', 'B')]:
+            errors.append(f"连续的相同请求没有合并: {executed}")
+        if scheduler.get_stats()['coalesced_count'] != 1:
+            errors.append(f"合并次数错误: {scheduler.get_stats()['coalesced_count']}")
+    finally:
+        scheduler.stop()
+    return errors
+
+
+def check_aging(aging_seconds=0.2, duration=1.5):
+    """持续提交发送任务时，读取和管理任务的等待时间不超过老化阈值太多"""
+    errors = []
+    scheduler = TaskScheduler(io_workers=1, aging_seconds=aging_seconds)
+    scheduler.start()
+    stop = threading.Event()
+
+    def flood():
+        # 始终保持若干个就绪的发送任务
+        tasks = []
+        index = 0
+        while not stop.is_set():
+            tasks = [task for task in tasks if not task.done.is_set()]
+            while len(tasks) < 5:
+                index += 1
+                tasks.append(scheduler.submit(time.sleep, (0.02,), task_class='send', chat=f'send-{index}'))
+            time.sleep(0.005)
+
+    producer = threading.Thread(target=flood)
+    producer.start()
+    try:
+        time.sleep(0.1)
+        waits = {}
+        for task_class in ('read', 'admin'):
+            start = time.perf_counter()
+            task = scheduler.submit(time.sleep, (0,), task_class=task_class)
+            try:
+                result_type, _ = scheduler.wait(task, duration * 2)
+            except TimeoutError:
+                errors.append(f"{task_class}任务等待{duration * 2}秒后仍未执行")
+                continue
+            waits[task_class] = time.perf_counter() - start
+            if result_type != 'success':
+                errors.append(f"{task_class}任务执行失败")
+            elif waits[task_class] > aging_seconds + 0.5:
+                errors.append(f"{task_class}任务等待了{waits[task_class]:.2f}秒，超过老化阈值{aging_seconds}秒过多")
+        stats = scheduler.get_stats()
+        if stats['promoted_count'] < 2:
+            errors.append(f"提前执行次数错误: {stats['promoted_count']}")
+        print("老化检查等待时间: " + ", ".join(f"{name}={wait:.2f}s" for name, wait in waits.items()))
+    finally:
+        stop.set()
+        producer.join()
+        scheduler.stop()
+    return errors
+
+
+def main():
+    """主函数"""
+    failed = 0
+    for check in (check_coalesce_order, check_aging):
+        errors = check()
+        print(f"{check.__name__}: {'通过' if not errors else '失败'}")
+        for error in errors:
+            print(f"    {error}")
+        failed += len(errors)
+    if failed:
+        sys.exit(1)
+    print("\n请求队列调度检查全部通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,10 @@
 """
 WxAuto API客户端模块
-使用简单的requests方法实现API调用，支持多实例管理
+使用共享的aiohttp长连接会话实现API调用，支持多实例管理
 """
 
 import logging
-import requests
-import json
+import json as json_module
 import asyncio
 from typing import Dict, List, Optional, Any, Tuple
 import aiohttp
@@ -27,7 +26,16 @@ class ApiError(Exception):
 class WxAutoApiClient:
     """WxAuto API客户端"""
 
-    def __init__(self, instance_id: str, base_url: str, api_key: str):
+    # 默认超时时间（秒）
+    GET_TIMEOUT = 3.0
+    POST_TIMEOUT = 5.0
+    CONNECT_TIMEOUT = 1.0
+    DOWNLOAD_TIMEOUT = 60.0
+    DOWNLOAD_RETRIES = 3
+    DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, instance_id: str, base_url: str, api_key: str,
+                 timeout: float = 30, connection_limit: int = 8, keepalive_timeout: float = 60):
         """
         初始化API客户端
 
@@ -35,13 +43,79 @@ class WxAutoApiClient:
             instance_id: 实例ID
             base_url: API基础URL
             api_key: API密钥
+            timeout: 发送消息、监听管理等耗时操作的超时时间（秒）
+            connection_limit: 连接池中到该实例的最大并发连接数
+            keepalive_timeout: 空闲连接保持时间（秒）
         """
         self.instance_id = instance_id
         self.base_url = base_url
         self.api_key = api_key
+        self.timeout = timeout
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
         self._initialized = False
         self._connected = False
 
+        # 每个事件循环一个长连接会话（Qt主循环和Web服务线程各自使用）
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+        # 监听消息确认游标：下一次拉取时带上，服务端确认后才删除上一批消息
+        self._listen_cursor: Optional[int] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取当前事件循环上的共享会话，不存在时创建"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            # 清理已关闭事件循环上的会话
+            for stale_loop in [l for l in self._sessions if l.is_closed()]:
+                del self._sessions[stale_loop]
+
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'X-API-Key': self.api_key},
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.CONNECT_TIMEOUT)
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def close(self) -> None:
+        """关闭所有事件循环上的会话"""
+        sessions, self._sessions = self._sessions, {}
+        current_loop = asyncio.get_running_loop()
+        for loop, session in sessions.items():
+            if session.closed or loop.is_closed():
+                continue
+            if loop is current_loop:
+                await session.close()
+            else:
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+    def _timeout(self, total: float) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=total, connect=self.CONNECT_TIMEOUT)
+
+    async def _request(self, method: str, endpoint: str, timeout: float,
+                       params: Dict = None, json: Dict = None, headers: Dict = None) -> Tuple[int, Any]:
+        """
+        通过共享会话发送请求
+
+        Returns:
+            Tuple[int, Any]: (HTTP状态码, 解析后的JSON；无法解析时为响应文本)
+        """
+        session = self._get_session()
+        async with session.request(method, f"{self.base_url}{endpoint}", params=params, json=json,
+                                   headers=headers, timeout=self._timeout(timeout)) as response:
+            text = await response.text()
+            try:
+                return response.status, json_module.loads(text)
+            except ValueError:
+                return response.status, text
+
     async def _get(self, endpoint: str, params: Dict = None) -> Dict:
         """发送GET请求"""
         try:
@@ -50,25 +124,16 @@ class WxAutoApiClient:
                 params = {k: str(v).lower() if isinstance(v, bool) else v
                          for k, v in params.items()}
 
-            # 使用aiohttp发送异步请求
-            url = f"{self.base_url}{endpoint}"
-            headers = {'X-API-Key': self.api_key}
-
             # 设置超时时间，避免长时间阻塞UI
-            timeout = aiohttp.ClientTimeout(total=3.0, connect=1.0)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(url, params=params, headers=headers) as response:
-                    if response.status != 200:
-                        text = await response.text()
-                        logger.error(f"GET请求失败，状态码: {response.status}, 响应: {text}")
-                        raise ApiError(f"HTTP错误: {response.status}")
-
-                    data = await response.json()
+            status, data = await self._request('GET', endpoint, self.GET_TIMEOUT, params=params)
+            if status != 200:
+                logger.error(f"GET请求失败，状态码: {status}, 响应: {data}")
+                raise ApiError(f"HTTP错误: {status}")
 
-                    if data.get('code') != 0:
-                        raise ApiError(data.get('message', '未知错误'), data.get('code', -1))
+            if data.get('code') != 0:
+                raise ApiError(data.get('message', '未知错误'), data.get('code', -1))
 
-                    return data.get('data', {})
+            return data.get('data', {})
         except aiohttp.ClientError as e:
             logger.error(f"GET请求网络错误: {e}")
             raise ApiError(str(e))
@@ -79,30 +144,17 @@ class WxAutoApiClient:
     async def _post(self, endpoint: str, json: Dict = None) -> Dict:
         """发送POST请求"""
         try:
-            # 构建完整URL和请求头
-            url = f"{self.base_url}{endpoint}"
-            headers = {
-                'X-API-Key': self.api_key,
-                'Content-Type': 'application/json'
-            }
+            status, data = await self._request('POST', endpoint, self.POST_TIMEOUT, json=json)
+            if status != 200:
+                logger.error(f"POST请求失败，状态码: {status}, 响应: {data}")
+                raise ApiError(f"HTTP错误: {status}")
 
-            # 使用aiohttp发送异步请求，设置超时时间
-            timeout = aiohttp.ClientTimeout(total=5.0, connect=1.0)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(url, json=json, headers=headers) as response:
-                    if response.status != 200:
-                        text = await response.text()
-                        logger.error(f"POST请求失败，状态码: {response.status}, 响应: {text}")
-                        raise ApiError(f"HTTP错误: {response.status}")
-
-                    data = await response.json()
-
-                    # 检查API响应状态码
-                    if data.get('code') != 0:
-                        logger.error(f"API错误: [{data.get('code', -1)}] {data.get('message', '未知错误')}")
-                        raise ApiError(data.get('message', '未知错误'), data.get('code', -1))
+            # 检查API响应状态码
+            if data.get('code') != 0:
+                logger.error(f"API错误: [{data.get('code', -1)}] {data.get('message', '未知错误')}")
+                raise ApiError(data.get('message', '未知错误'), data.get('code', -1))
 
-                    return data.get('data', {})
+            return data.get('data', {})
         except aiohttp.ClientError as e:
             logger.error(f"POST请求网络错误: {e}")
             raise ApiError(str(e))
@@ -215,15 +267,9 @@ class WxAutoApiClient:
             Dict: 发送结果
         """
         try:
-            # 使用requests库直接发送请求，模拟curl方式
-            url = f"{self.base_url}/api/chat-window/message/send-typing"
             headers = {
-                "X-API-Key": self.api_key,
-                "Content-Type": "application/json",
                 "User-Agent": "PostmanRuntime/7.43.0",
-                "Accept": "*/*",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Connection": "keep-alive"
+                "Accept": "*/*"
             }
 
             data = {
@@ -235,43 +281,25 @@ class WxAutoApiClient:
             if at_list and len(at_list) > 0:
                 data["at_list"] = at_list
 
-            # 使用同步requests库发送请求
-            def send_request():
-                try:
-                    response = requests.post(url, headers=headers, json=data, timeout=30)
-                    return response
-                except Exception as e:
-                    logger.error(f"同步请求异常: {e}")
-                    raise e
-
-            # 在事件循环的线程池中执行同步请求
-            import asyncio
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, send_request)
-
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    if result.get("code") == 0:
-                        logger.info(f"发送消息成功: {receiver}")
-                        return {"success": True, "message": "发送成功"}
-                    else:
-                        error_msg = f"API返回错误: {result.get('message', '未知错误')}"
-                        logger.error(error_msg)
-                        return {"success": False, "message": error_msg}
-                except Exception as e:
-                    error_msg = f"解析响应JSON失败: {e}"
+            status, result = await self._request(
+                'POST', '/api/chat-window/message/send-typing', self.timeout, json=data, headers=headers
+            )
+
+            if status == 200:
+                if not isinstance(result, dict):
+                    error_msg = f"解析响应JSON失败: {str(result)[:200]}"
+                    logger.error(error_msg)
+                    return {"success": False, "message": error_msg}
+                if result.get("code") == 0:
+                    logger.info(f"发送消息成功: {receiver}")
+                    return {"success": True, "message": "发送成功"}
+                else:
+                    error_msg = f"API返回错误: {result.get('message', '未知错误')}"
                     logger.error(error_msg)
                     return {"success": False, "message": error_msg}
             else:
-                error_msg = f"POST请求失败，状态码: {response.status_code}"
-                try:
-                    result = response.text
-                    error_msg += f", 响应: {result}"
-                except:
-                    pass
-                logger.error(error_msg)
-                return {"success": False, "message": f"HTTP错误: {response.status_code}"}
+                logger.error(f"POST请求失败，状态码: {status}, 响应: {result}")
+                return {"success": False, "message": f"HTTP错误: {status}"}
         except Exception as e:
             logger.error(f"发送消息失败: {e}")
             return {"success": False, "message": str(e)}
@@ -306,60 +334,38 @@ class WxAutoApiClient:
     async def add_listener(self, who: str, **kwargs) -> bool:
         """添加监听对象"""
         try:
-            import requests
-            import json
-            import asyncio
-
             # 新的API只需要nickname参数，移除其他多余参数
             api_params = {
                 'nickname': who
             }
 
-            # 构建完整的API URL和请求头
-            url = f"{self.base_url}/api/message/listen/add"
-            headers = {
-                'X-API-Key': self.api_key,
-                'Content-Type': 'application/json'
-            }
-
             # 记录完整的curl命令，方便调试
+            url = f"{self.base_url}/api/message/listen/add"
             curl_cmd = f"""curl -X POST '{url}' \\
   -H 'X-API-Key: {self.api_key}' \\
   -H 'Content-Type: application/json' \\
-  -d '{json.dumps(api_params)}'"""
+  -d '{json_module.dumps(api_params)}'"""
             logger.debug(f"执行API请求，等效curl命令: \n{curl_cmd}")
 
-            # 使用同步requests库发送请求
-            def send_request():
-                try:
-                    response = requests.post(url, headers=headers, json=api_params, timeout=30)
-                    return response
-                except Exception as e:
-                    logger.error(f"同步请求异常: {e}")
-                    raise e
-
-            # 在事件循环的线程池中执行同步请求
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, send_request)
-            status_code = response.status_code
+            status_code, result = await self._request(
+                'POST', '/api/message/listen/add', self.timeout, json=api_params
+            )
 
             if status_code != 200:
-                logger.error(f"添加监听对象请求失败，状态码: {status_code}, 响应: {response.text}")
+                logger.error(f"添加监听对象请求失败，状态码: {status_code}, 响应: {result}")
                 return False
 
-            # 解析JSON响应
-            result = response.json()
             logger.debug(f"添加监听对象API响应: {result}")
 
             # 检查结果
-            success = result.get('code') == 0
+            success = isinstance(result, dict) and result.get('code') == 0
             if success:
                 logger.info(f"成功添加监听对象 {who}")
                 return True
             else:
                 logger.error(f"添加监听对象失败，API返回: {result}")
                 return False
-        except requests.RequestException as e:
+        except aiohttp.ClientError as e:
             logger.error(f"添加监听对象网络错误: {e}")
             logger.exception(e)
             return False
@@ -371,56 +377,36 @@ class WxAutoApiClient:
     async def remove_listener(self, who: str) -> bool:
         """移除监听对象"""
         try:
-            import requests
-            import json
-            import asyncio
             data = {'nickname': who}
 
-            # 构建完整的API URL和请求头
-            url = f"{self.base_url}/api/message/listen/remove"
-            headers = {
-                'X-API-Key': self.api_key,
-                'Content-Type': 'application/json'
-            }
-
             # 记录完整的curl命令，方便调试
+            url = f"{self.base_url}/api/message/listen/remove"
             curl_cmd = f"""curl -X POST '{url}' \\
   -H 'X-API-Key: {self.api_key}' \\
   -H 'Content-Type: application/json' \\
-  -d '{json.dumps(data)}'"""
+  -d '{json_module.dumps(data)}'"""
             logger.debug(f"执行API请求，等效curl命令: \n{curl_cmd}")
 
-            # 使用同步requests库发送请求
-            def send_request():
-                try:
-                    response = requests.post(url, headers=headers, json=data, timeout=30)
-                    return response
-                except Exception as e:
-                    logger.error(f"同步请求异常: {e}")
-                    raise e
-
-            # 在事件循环的线程池中执行同步请求
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, send_request)
-            status_code = response.status_code
+            status_code, result = await self._request(
+                'POST', '/api/message/listen/remove', self.timeout, json=data
+            )
 
             if status_code != 200:
-                logger.error(f"移除监听对象请求失败，状态码: {status_code}, 响应: {response.text}")
+                logger.error(f"移除监听对象请求失败，状态码: {status_code}, 响应: {result}")
                 return False
 
-            # 解析JSON响应
-            result = response.json()
             logger.debug(f"移除监听对象API响应: {result}")
 
             # 检查结果 - API成功时返回data中包含who字段，这表示成功
-            success = isinstance(result.get('data'), dict) and 'who' in result.get('data', {})
+            success = (isinstance(result, dict) and isinstance(result.get('data'), dict)
+                       and 'who' in result.get('data', {}))
             if success:
                 logger.debug(f"成功移除监听对象 {who}")
                 return True
             else:
                 logger.error(f"移除监听对象失败，API返回: {result}")
                 return False
-        except requests.RequestException as e:
+        except aiohttp.ClientError as e:
             logger.error(f"移除监听对象网络错误: {e}")
             logger.exception(e)
             return False
@@ -440,9 +426,6 @@ class WxAutoApiClient:
             Optional[bytes]: 文件内容，如果下载失败则返回None
         """
         try:
-            import requests
-            import json
-            import asyncio
             import platform
             import os
 
@@ -468,81 +451,60 @@ class WxAutoApiClient:
             file_logger.debug(f"文件路径详情: 原始={file_path}, 修正后={file_path_fixed}")
             file_logger.debug(f"文件名: {os.path.basename(file_path_fixed)}")
 
-            # 构建完整的API URL和请求头
             url = f"{self.base_url}/api/file/download"
-            headers = {
-                'X-API-Key': self.api_key,
-                'Content-Type': 'application/json'
-            }
-
             file_logger.debug(f"下载文件请求URL: {url}")
-            file_logger.debug(f"下载文件请求头: {headers}")
 
             # 记录完整的curl命令，方便调试
             curl_cmd = f"""curl -X POST '{url}' \\
   -H 'X-API-Key: {self.api_key}' \\
   -H 'Content-Type: application/json' \\
-  -d '{json.dumps(data)}'"""
+  -d '{json_module.dumps(data)}'"""
             file_logger.debug(f"执行文件下载API请求，等效curl命令: \n{curl_cmd}")
 
-            # 使用同步requests库发送请求
-            def send_request():
+            # 通过共享会话下载，失败时重试
+            session = self._get_session()
+            max_retries = 3
+            retry_count = 0
+            while True:
                 try:
-                    file_logger.debug(f"开始发送同步下载请求...")
-                    # 增加重试机制
-                    max_retries = 3
-                    retry_count = 0
-
-                    while retry_count < max_retries:
-                        try:
-                            response = requests.post(url, headers=headers, json=data, timeout=60)  # 文件下载可能需要更长的超时时间
-                            file_logger.debug(f"同步下载请求完成，状态码: {response.status_code}")
-                            return response
-                        except requests.exceptions.RequestException as e:
-                            retry_count += 1
-                            file_logger.warning(f"下载请求失败，正在重试 ({retry_count}/{max_retries}): {e}")
-                            if retry_count >= max_retries:
-                                raise
-                            # 等待一段时间再重试
-                            import time
-                            time.sleep(1)
-                except Exception as e:
-                    file_logger.error(f"文件下载同步请求异常: {e}")
-                    logger.error(f"文件下载同步请求异常: {e}")
-                    raise e
-
-            # 在事件循环的线程池中执行同步请求
-            file_logger.debug(f"准备在事件循环中执行同步请求...")
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, send_request)
-            status_code = response.status_code
-            file_logger.debug(f"下载请求响应状态码: {status_code}")
+                    async with session.post(url, json=data,
+                                            timeout=self._timeout(self.DOWNLOAD_TIMEOUT)) as response:
+                        status_code = response.status
+                        content_type = response.headers.get('Content-Type', '')
+                        file_content = await response.read()
+                    file_logger.debug(f"下载请求完成，状态码: {status_code}")
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    retry_count += 1
+                    file_logger.warning(f"下载请求失败，正在重试 ({retry_count}/{max_retries}): {e}")
+                    if retry_count >= max_retries:
+                        raise
+                    # 等待一段时间再重试
+                    await asyncio.sleep(1)
 
             if status_code != 200:
                 # 尝试解析错误信息
                 try:
-                    error_data = response.json()
+                    error_data = json_module.loads(file_content)
                     error_msg = error_data.get('message', '未知错误')
                     error_code = error_data.get('code', -1)
                     error_detail = error_data.get('data', {}).get('error', '')
                     file_logger.error(f"文件下载失败，状态码: {status_code}, 错误码: {error_code}, 错误信息: {error_msg}, 详情: {error_detail}")
                     logger.error(f"文件下载失败，状态码: {status_code}")
                 except:
-                    file_logger.error(f"文件下载失败，状态码: {status_code}, 响应: {response.text[:200]}")
+                    file_logger.error(f"文件下载失败，状态码: {status_code}, 响应: {file_content[:200]}")
                     logger.error(f"文件下载失败，状态码: {status_code}")
                 return None
 
             # 检查Content-Type
-            content_type = response.headers.get('Content-Type', '')
             file_logger.debug(f"响应Content-Type: {content_type}")
 
             # 更宽松地检查Content-Type，有些服务器可能返回不同的MIME类型
             valid_content_types = ['application/octet-stream', 'binary/octet-stream', 'application/binary']
-            is_binary_content = any(ct in content_type for ct in valid_content_types) or len(response.content) > 0
+            is_binary_content = any(ct in content_type for ct in valid_content_types) or len(file_content) > 0
 
             if is_binary_content:
                 # 成功获取文件内容
-                file_content = response.content
                 file_size = len(file_content)
                 file_logger.info(f"成功下载文件: {file_path}, 大小: {file_size} 字节")
                 logger.info(f"成功下载文件: {file_path}, 大小: {file_size} 字节")
@@ -562,14 +524,8 @@ class WxAutoApiClient:
 
                 return file_content
             else:
-                # 可能是错误响应
-                try:
-                    error_data = response.json()
-                    file_logger.error(f"文件下载API返回非文件内容: {error_data}")
-                    logger.error(f"文件下载API返回非文件内容")
-                except:
-                    file_logger.error(f"文件下载API返回非文件内容且无法解析: {response.text[:200]}")
-                    logger.error(f"文件下载API返回非文件内容且无法解析")
+                file_logger.error(f"文件下载API返回非文件内容且无法解析: {file_content[:200]}")
+                logger.error(f"文件下载API返回非文件内容且无法解析")
                 return None
 
         except Exception as e:
@@ -578,29 +534,151 @@ class WxAutoApiClient:
             logger.error(f"下载文件失败: {e}")
             return None
 
-    async def get_all_listener_messages(self) -> Dict[str, List[Dict]]:
-        """获取所有监听对象的消息"""
+    @staticmethod
+    def _remote_file_path(file_path: str) -> str:
+        """按当前操作系统修正远程文件路径的分隔符"""
+        import platform
+        if platform.system() == "Windows":
+            return file_path.replace('/', '\\')
+        return file_path.replace('\\', '/')
+
+    async def get_file_info(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """
+        通过HEAD请求获取远程文件信息，不下载内容
+
+        Args:
+            file_path: 文件路径
+
+        Returns:
+            Optional[Dict[str, Any]]: {'size', 'sha256', 'etag'}；文件不存在或服务端不支持时返回None
+        """
         try:
-            import requests
+            session = self._get_session()
+            async with session.head(f"{self.base_url}/api/file/download",
+                                    params={'file_path': self._remote_file_path(file_path)},
+                                    timeout=self._timeout(self.GET_TIMEOUT)) as response:
+                if response.status != 200:
+                    file_logger.debug(f"获取文件信息失败，状态码: {response.status}")
+                    return None
+                sha256 = response.headers.get('X-Content-SHA256')
+                if not sha256:
+                    return None
+                return {
+                    'size': int(response.headers.get('Content-Length', 0)),
+                    'sha256': sha256,
+                    'etag': response.headers.get('ETag'),
+                }
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            file_logger.debug(f"获取文件信息失败: {e}")
+            return None
 
-            # 使用requests执行请求，不带who参数获取所有监听对象的消息
+    async def download_file_to(self, file_path: str, dest_path: str, etag: str = None) -> Optional[int]:
+        """
+        流式下载文件并直接写入本地文件，不在内存中保留完整内容
+
+        传入etag且dest_path已有部分内容时，使用Range和If-Range从断点续传；
+        远程文件已变化时服务端返回完整内容，本地文件从头覆盖。网络错误时自动重试并续传。
+
+        Args:
+            file_path: 远程文件路径
+            dest_path: 本地保存路径
+            etag: 远程文件的ETag（来自get_file_info），用于断点续传
+
+        Returns:
+            Optional[int]: 本地文件大小，下载失败返回None
+        """
+        import os
+
+        url = f"{self.base_url}/api/file/download"
+        params = {'file_path': self._remote_file_path(file_path)}
+        # 大文件下载时间不可预估，只限制连接和两次读取之间的间隔
+        timeout = aiohttp.ClientTimeout(total=None, connect=self.CONNECT_TIMEOUT,
+                                        sock_read=self.DOWNLOAD_TIMEOUT)
+        session = self._get_session()
+
+        for attempt in range(1, self.DOWNLOAD_RETRIES + 1):
+            offset = os.path.getsize(dest_path) if etag and os.path.exists(dest_path) else 0
+            headers = {'Range': f"bytes={offset}-", 'If-Range': etag} if offset else None
+            try:
+                async with session.get(url, params=params, headers=headers, timeout=timeout) as response:
+                    if response.status == 405:
+                        # 旧版服务端只支持POST整体下载
+                        file_logger.info("服务端不支持GET下载，使用POST方式下载")
+                        file_content = await self.download_file(file_path)
+                        if not file_content:
+                            return None
+                        with open(dest_path, 'wb') as f:
+                            f.write(file_content)
+                        return len(file_content)
+
+                    if response.status == 416:
+                        # 本地部分文件比远程文件还大，重新下载
+                        file_logger.warning(f"续传范围无效，重新下载: {file_path}")
+                        os.remove(dest_path)
+                        continue
+
+                    if response.status not in (200, 206):
+                        error_text = await response.text()
+                        file_logger.error(f"文件下载失败，状态码: {response.status}, 响应: {error_text[:200]}")
+                        logger.error(f"文件下载失败，状态码: {response.status}")
+                        return None
+
+                    if response.status == 206:
+                        file_logger.info(f"从 {offset} 字节处续传文件: {file_path}")
+                    with open(dest_path, 'ab' if response.status == 206 else 'wb') as f:
+                        async for chunk in response.content.iter_chunked(self.DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+
+                file_size = os.path.getsize(dest_path)
+                file_logger.info(f"成功下载文件: {file_path}, 大小: {file_size} 字节")
+                return file_size
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                file_logger.warning(f"下载请求失败，正在重试 ({attempt}/{self.DOWNLOAD_RETRIES}): {e}")
+                if attempt >= self.DOWNLOAD_RETRIES:
+                    logger.error(f"下载文件失败: {e}")
+                    return None
+                await asyncio.sleep(1)
+            except OSError as e:
+                file_logger.error(f"写入下载文件失败: {dest_path}, 错误: {e}")
+                logger.error(f"写入下载文件失败: {e}")
+                return None
+        return None
+
+    async def get_all_listener_messages(self, wait: float = 0, peek: bool = False) -> Dict[str, List[Dict]]:
+        """
+        获取所有监听对象的消息
+
+        使用批量确认模式：一次取回所有聊天对象的消息，并在下一次拉取时确认上一批，
+        响应丢失时服务端会重新返回未确认的消息。旧版本服务端忽略这些参数，仍按原方式返回。
+
+        Args:
+            wait: 没有消息时服务端最多等待的秒数（长轮询），必须小于请求超时时间
+            peek: 只查看消息，不确认也不推进游标，消息仍会在正常拉取时返回
+        """
+        try:
+            # 不带who参数获取所有监听对象的消息
             url = f"{self.base_url}/api/message/listen/get"
-            headers = {'X-API-Key': self.api_key}
+            params = {'batch': 'true', 'ack': 'true'}
+            if self._listen_cursor is not None and not peek:
+                params['cursor'] = self._listen_cursor
+            if wait > 0:
+                params['wait'] = min(wait, max(0, self.timeout - 5))
 
             # 记录完整的curl命令，方便调试
-            curl_cmd = f"curl -X GET '{url}' -H 'X-API-Key: {self.api_key}'"
+            query = '&'.join(f"{k}={v}" for k, v in params.items())
+            curl_cmd = f"curl -X GET '{url}?{query}' -H 'X-API-Key: {self.api_key}'"
             logger.debug(f"执行API请求，等效curl命令: {curl_cmd}")
 
             # 执行请求
-            response = requests.get(url, headers=headers)
-            status_code = response.status_code
+            status_code, data = await self._request('GET', '/api/message/listen/get', self.timeout, params=params)
 
             if status_code != 200:
-                logger.error(f"获取监听消息请求失败，状态码: {status_code}, 响应: {response.text}")
+                logger.error(f"获取监听消息请求失败，状态码: {status_code}, 响应: {data}")
                 return {}
 
-            # 解析JSON响应
-            data = response.json()
+            if not isinstance(data, dict):
+                logger.error(f"解析监听消息响应失败: {str(data)[:200]}")
+                return {}
             logger.debug(f"获取消息API响应: {data}")
 
             # 检查API响应状态码
@@ -609,9 +687,13 @@ class WxAutoApiClient:
                 return {}
 
             # 获取消息数据
-            result_data = data.get('data', {})
+            result_data = data.get('data') or {}
             messages_data = result_data.get('messages', {})
 
+            # 本批消息交给调用方处理，下一次拉取时确认
+            if not peek:
+                self._listen_cursor = result_data.get('cursor')
+
             # 处理空消息情况 - 这是正常的，表示没有新消息
             if not messages_data:
                 logger.debug(f"没有任何监听对象的新消息")
@@ -648,7 +730,7 @@ class WxAutoApiClient:
 
             return filtered_messages_data
 
-        except requests.RequestException as e:
+        except aiohttp.ClientError as e:
             logger.error(f"获取监听消息网络错误: {e}")
             logger.exception(e)
             return {}
@@ -658,8 +740,8 @@ class WxAutoApiClient:
             return {}
 
     async def get_listener_messages(self, who: str) -> List[Dict]:
-        """获取指定监听对象的消息（向后兼容方法）"""
-        all_messages = await self.get_all_listener_messages()
+        """获取指定监听对象的消息（向后兼容方法），不确认消息，其他聊天对象的消息留给正常拉取"""
+        all_messages = await self.get_all_listener_messages(peek=True)
         return all_messages.get(who, [])
 
     @property
@@ -692,7 +774,11 @@ class InstanceManager:
         Returns:
             WxAutoApiClient: API客户端实例
         """
-        client = WxAutoApiClient(instance_id, base_url, api_key)
+        old_client = self._instances.get(instance_id)
+        if old_client:
+            self._schedule_close(old_client)
+
+        client = WxAutoApiClient(instance_id, base_url, api_key, timeout=timeout)
         self._instances[instance_id] = client
         return client
 
@@ -703,7 +789,17 @@ class InstanceManager:
     def remove_instance(self, instance_id: str):
         """移除指定实例"""
         if instance_id in self._instances:
-            del self._instances[instance_id]
+            client = self._instances.pop(instance_id)
+            self._schedule_close(client)
+
+    @staticmethod
+    def _schedule_close(client: WxAutoApiClient):
+        """在当前事件循环中异步关闭客户端会话，没有运行中的事件循环时跳过"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.create_task(client.close())
 
     def get_all_instances(self) -> Dict[str, WxAutoApiClient]:
         """获取所有实例"""
@@ -711,7 +807,13 @@ class InstanceManager:
 
     async def close_all(self):
         """关闭所有实例"""
+        clients = list(self._instances.values())
         self._instances.clear()
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"关闭实例 {client.instance_id} 的会话时出错: {e}")
 
 # 创建全局实例管理器
 instance_manager = InstanceManager()
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+会话调度器模块
+
+按(实例ID, 聊天对象)为每个会话维护一个FIFO队列，每个会话只有一个工作协程，
+保证同一会话内的消息严格按提交顺序处理；不同会话之间并行执行，
+并用每个实例一个信号量限制该实例同时处理的会话数，
+避免某个实例或某次慢速的平台调用阻塞其他实例和会话。
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ChatKey = Tuple[str, str]
+
+
+class ChatScheduler:
+    """会话级并发调度器"""
+
+    def __init__(self, per_instance_limit: int = 4):
+        """
+        初始化调度器
+
+        Args:
+            per_instance_limit: 每个实例同时处理的最大会话数
+        """
+        self.per_instance_limit = max(1, per_instance_limit)
+
+        self._queues: Dict[ChatKey, Deque[Tuple[str, Callable[[], Awaitable[Any]], asyncio.Future]]] = {}
+        self._workers: Dict[ChatKey, asyncio.Task] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # 已提交但尚未完成的任务ID -> future，用于去重
+        self._scheduled: Dict[str, asyncio.Future] = {}
+
+    def submit(self, instance_id: str, chat_name: str, task_id: str,
+               fn: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """
+        提交一个任务到会话队列
+
+        Args:
+            instance_id: 实例ID
+            chat_name: 聊天对象
+            task_id: 任务ID（通常为消息ID），相同ID的任务未完成前不会重复提交
+            fn: 无参协程函数
+
+        Returns:
+            asyncio.Future: 任务结果，fn抛出的异常也会设置到该future上
+        """
+        existing = self._scheduled.get(task_id)
+        if existing is not None and not existing.done():
+            logger.debug(f"任务已在调度队列中，跳过重复提交: {task_id}")
+            return existing
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._scheduled[task_id] = future
+
+        key = (instance_id, chat_name)
+        self._queues.setdefault(key, deque()).append((task_id, fn, future))
+
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            self._workers[key] = loop.create_task(self._run_chat(key))
+
+        return future
+
+    def is_scheduled(self, task_id: str) -> bool:
+        """任务是否已提交且尚未完成"""
+        future = self._scheduled.get(task_id)
+        return future is not None and not future.done()
+
+    def is_chat_busy(self, instance_id: str, chat_name: str) -> bool:
+        """会话是否有任务正在处理或排队"""
+        worker = self._workers.get((instance_id, chat_name))
+        return worker is not None and not worker.done()
+
+    def _get_semaphore(self, instance_id: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(instance_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_instance_limit)
+            self._semaphores[instance_id] = semaphore
+        return semaphore
+
+    async def _run_chat(self, key: ChatKey) -> None:
+        """会话工作协程：依次处理队列中的任务，队列为空时退出"""
+        queue = self._queues[key]
+        semaphore = self._get_semaphore(key[0])
+        try:
+            while queue:
+                task_id, fn, future = queue.popleft()
+                try:
+                    # 每个任务单独获取信号量，避免积压较多的会话长期占用实例配额
+                    async with semaphore:
+                        result = await fn()
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    logger.error(f"会话任务执行失败: 实例={key[0]}, 聊天={key[1]}, 任务={task_id}, 错误: {e}")
+                    future.set_exception(e)
+                    # 调用方未必会等待结果，这里标记异常已被读取，避免事件循环告警
+                    future.exception()
+                else:
+                    future.set_result(result)
+                finally:
+                    if self._scheduled.get(task_id) is future:
+                        del self._scheduled[task_id]
+        finally:
+            if self._workers.get(key) is asyncio.current_task():
+                del self._workers[key]
+            if not queue:
+                self._queues.pop(key, None)
+
+    async def wait_idle(self, timeout: Optional[float] = None) -> None:
+        """等待所有已提交的任务完成"""
+        futures = [f for f in self._scheduled.values() if not f.done()]
+        if futures:
+            await asyncio.wait(futures, timeout=timeout)
+
+    async def cancel_all(self) -> None:
+        """取消所有排队和正在执行的任务"""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        for queue in self._queues.values():
+            for _, _, future in queue:
+                future.cancel()
+        self._queues.clear()
+        self._workers.clear()
+        self._scheduled.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取调度统计信息"""
+        return {
+            'active_chats': sum(1 for w in self._workers.values() if not w.done()),
+            'queued_tasks': sum(len(q) for q in self._queues.values()),
+            'scheduled_tasks': len(self._scheduled),
+        }
+
+
+# 创建全局实例
+chat_scheduler = ChatScheduler()
@@ -890,6 +890,13 @@ class ConfigManager:
                 logger.error(f"删除实例 {instance_id} 的消息记录时出错: {e}")
                 # 继续执行，不要因为这个错误而中断整个删除过程
 
+            # 清除该实例的会话历史缓存和总结
+            try:
+                from ..core.conversation_history import conversation_history
+                await conversation_history.remove_instance(instance_id)
+            except Exception as e:
+                logger.error(f"清除实例 {instance_id} 的会话历史时出错: {e}")
+
             # 3. 删除实例本身
             try:
                 logger.info(f"正在删除实例 {instance_id} 的配置记录...")
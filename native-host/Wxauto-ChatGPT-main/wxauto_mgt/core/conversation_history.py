@@ -0,0 +1,335 @@
+"""
+会话历史缓存模块
+
+为连续对话的平台（如OpenAI平台）在内存中保存每个(实例, 聊天对象, 平台)最近的对话轮次：
+- 首次使用时从数据库加载一次，之后回复发送成功时由投递服务追加，不再每条消息都查询数据库
+- 超出上下文预算时，只把最旧的几轮和上一次的总结合并成新的滚动总结，
+  总结持久化到conversation_summaries表，重启后继续使用
+- 每轮对话的token数在创建时计算一次，并维护累计值，组装历史和估算长度都不需要重新计数
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from wxauto_mgt.data.db_manager import db_manager
+from wxauto_mgt.data.hot_queries import HISTORY_MESSAGES_SQL
+from wxauto_mgt.utils.tokenizer import (
+    MESSAGE_OVERHEAD_TOKENS, count_message_tokens, count_messages_tokens, truncate_text
+)
+
+logger = logging.getLogger(__name__)
+
+# 内存中最多保留的会话数量，超出后淘汰最久未使用的会话
+MAX_CONVERSATIONS = 2000
+
+SUMMARY_SQL = (
+    "SELECT summary, summarized_until, summarized_until_id FROM conversation_summaries "
+    "WHERE instance_id = ? AND chat_name = ? AND platform_id = ?"
+)
+
+SAVE_SUMMARY_SQL = """
+INSERT INTO conversation_summaries (instance_id, chat_name, platform_id, summary, summarized_until,
+                                    summarized_until_id, update_time)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(instance_id, chat_name, platform_id)
+DO UPDATE SET summary = excluded.summary, summarized_until = excluded.summarized_until,
+              summarized_until_id = excluded.summarized_until_id, update_time = excluded.update_time
+"""
+
+
+class ConversationTurn:
+    """一轮对话：用户消息和对应的回复，message_row_id为messages表的自增id"""
+
+    __slots__ = ('create_time', 'message_row_id', 'user', 'reply', 'tokens')
+
+    def __init__(self, create_time: int, user: str, reply: str, message_row_id: int = 0):
+        self.create_time = create_time
+        self.message_row_id = message_row_id
+        self.user = user
+        self.reply = reply
+        self.tokens = count_messages_tokens(self.to_messages())
+
+    def to_messages(self) -> List[Dict[str, str]]:
+        """转换为OpenAI消息格式"""
+        messages = []
+        if self.user:
+            messages.append({"role": "user", "content": self.user})
+        if self.reply:
+            messages.append({"role": "assistant", "content": self.reply})
+        return messages
+
+
+class Conversation:
+    """单个会话的历史环形缓冲区和滚动总结"""
+
+    def __init__(self, key: Tuple[str, str, str], limit: int):
+        self.key = key
+        self.turns: Deque[ConversationTurn] = deque(maxlen=max(1, limit))
+        # 总结水位：已并入总结的最后一轮的(create_time, messages.id)
+        self.summarized_until = 0
+        self.summarized_until_id = 0
+        self.loaded = False
+        self.lock = asyncio.Lock()
+        self._summary = ''
+        self._summary_tokens = 0
+        self._turn_tokens = 0
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @summary.setter
+    def summary(self, value: str) -> None:
+        self._summary = value
+        message = self.summary_message()
+        self._summary_tokens = count_message_tokens(message) if message else 0
+
+    @property
+    def tokens(self) -> int:
+        """总结和全部轮次的token数"""
+        return self._summary_tokens + self._turn_tokens
+
+    def append(self, turn: ConversationTurn) -> None:
+        """追加一轮对话，缓冲区满时丢弃最旧的一轮"""
+        if len(self.turns) == self.turns.maxlen:
+            self._turn_tokens -= self.turns[0].tokens
+        self.turns.append(turn)
+        self._turn_tokens += turn.tokens
+
+    def resize(self, limit: int) -> None:
+        """调整保留的轮次数量"""
+        limit = max(1, limit)
+        if limit != self.turns.maxlen:
+            self.turns = deque(self.turns, maxlen=limit)
+            self._turn_tokens = sum(turn.tokens for turn in self.turns)
+
+    def oldest_turns(self, max_tokens: int) -> List[ConversationTurn]:
+        """
+        从最旧的一轮开始取出轮次，直到剩余轮次的token数不超过max_tokens
+
+        Returns:
+            List[ConversationTurn]: 需要并入总结的轮次（不会从缓冲区移除）
+        """
+        folded = []
+        remaining = self._turn_tokens
+        for turn in self.turns:
+            if remaining <= max_tokens:
+                break
+            folded.append(turn)
+            remaining -= turn.tokens
+        return folded
+
+    def fold(self, count: int, summary: str) -> None:
+        """用新的总结替换最旧的count轮对话"""
+        for _ in range(min(count, len(self.turns))):
+            turn = self.turns.popleft()
+            self._turn_tokens -= turn.tokens
+            watermark = (turn.create_time, turn.message_row_id)
+            if watermark > (self.summarized_until, self.summarized_until_id):
+                self.summarized_until, self.summarized_until_id = watermark
+        self.summary = summary
+
+    def summary_message(self) -> Optional[Dict[str, str]]:
+        """总结消息"""
+        if not self.summary:
+            return None
+        return {"role": "assistant", "content": self.summary}
+
+    def to_messages(self, skip: int = 0) -> List[Dict[str, str]]:
+        """
+        组装历史消息：总结在前，随后是最近的轮次
+
+        Args:
+            skip: 跳过最旧的轮次数量
+        """
+        messages = []
+        summary = self.summary_message()
+        if summary:
+            messages.append(summary)
+        for index, turn in enumerate(self.turns):
+            if index >= skip:
+                messages.extend(turn.to_messages())
+        return messages
+
+    def fit_messages(self, max_tokens: int) -> List[Dict[str, str]]:
+        """
+        总结之后仍超出预算时的兜底：保留总结，再从最新的一轮往前取放得下的轮次
+
+        总结本身超出预算时截断总结内容。
+
+        Args:
+            max_tokens: 历史消息可用的token数
+        """
+        messages = []
+        remaining = max_tokens
+        summary = self.summary_message()
+        if summary:
+            if self._summary_tokens <= remaining:
+                messages.append(summary)
+                remaining -= self._summary_tokens
+            else:
+                content = truncate_text(self.summary, remaining - MESSAGE_OVERHEAD_TOKENS)
+                if content:
+                    messages.append({"role": "assistant", "content": content})
+                remaining = 0
+
+        recent = []
+        for turn in reversed(self.turns):
+            if turn.tokens > remaining:
+                break
+            recent.append(turn)
+            remaining -= turn.tokens
+        for turn in reversed(recent):
+            messages.extend(turn.to_messages())
+        return messages
+
+
+class ConversationHistory:
+    """会话历史缓存管理器"""
+
+    def __init__(self, max_conversations: int = MAX_CONVERSATIONS):
+        self._conversations: 'OrderedDict[Tuple[str, str, str], Conversation]' = OrderedDict()
+        self._max_conversations = max_conversations
+        self._stats = {'hits': 0, 'loads': 0, 'appends': 0, 'summaries_saved': 0}
+
+    async def get(self, instance_id: str, chat_name: str, platform_id: str, limit: int) -> Conversation:
+        """
+        获取会话历史，首次访问时从数据库加载总结和总结之后的最近轮次
+
+        Args:
+            instance_id: 实例ID
+            chat_name: 聊天对象
+            platform_id: 平台ID
+            limit: 保留的最近轮次数量
+
+        Returns:
+            Conversation: 会话历史
+        """
+        key = (instance_id, chat_name, platform_id)
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            conversation = Conversation(key, limit)
+            self._conversations[key] = conversation
+            while len(self._conversations) > self._max_conversations:
+                self._conversations.popitem(last=False)
+        else:
+            self._conversations.move_to_end(key)
+            conversation.resize(limit)
+
+        if conversation.loaded:
+            self._stats['hits'] += 1
+            return conversation
+
+        async with conversation.lock:
+            if not conversation.loaded:
+                await self._load(conversation)
+        return conversation
+
+    async def _load(self, conversation: Conversation) -> None:
+        """从数据库加载会话历史"""
+        instance_id, chat_name, platform_id = conversation.key
+        try:
+            row = await db_manager.fetchone(SUMMARY_SQL, conversation.key)
+            if row:
+                conversation.summary = row.get('summary') or ''
+                conversation.summarized_until = row.get('summarized_until') or 0
+                conversation.summarized_until_id = row.get('summarized_until_id') or 0
+
+            history = await db_manager.fetchall(
+                HISTORY_MESSAGES_SQL,
+                (instance_id, chat_name, platform_id, conversation.summarized_until,
+                 conversation.summarized_until_id, conversation.turns.maxlen)
+            )
+        except Exception as e:
+            # 加载失败时本次按无历史处理，下次再重新加载
+            logger.error(f"加载会话历史失败: {conversation.key}, 错误: {e}")
+            return
+
+        for item in reversed(history or []):
+            conversation.append(ConversationTurn(
+                item.get('create_time') or 0,
+                (item.get('content') or '').strip(),
+                (item.get('reply_content') or '').strip(),
+                item.get('id') or 0,
+            ))
+        conversation.loaded = True
+        self._stats['loads'] += 1
+        logger.debug(f"会话历史加载完成: {conversation.key}, {len(conversation.turns)} 轮")
+
+    def record_turn(self, instance_id: str, chat_name: str, platform_id: Optional[str],
+                    content: Optional[str], reply_content: Optional[str],
+                    create_time: Optional[int] = None, message_row_id: Optional[int] = None) -> None:
+        """
+        回复发送成功后追加一轮对话
+
+        只更新已经在内存中的会话；未加载的会话在首次使用时会从数据库读到这一轮。
+
+        Args:
+            instance_id: 实例ID
+            chat_name: 聊天对象
+            platform_id: 平台ID
+            content: 用户消息内容
+            reply_content: 回复内容
+            create_time: 用户消息的创建时间
+            message_row_id: 用户消息在messages表中的id
+        """
+        if not platform_id:
+            return
+        conversation = self._conversations.get((instance_id, chat_name, platform_id))
+        if conversation is None or not conversation.loaded:
+            return
+
+        turn = ConversationTurn(
+            create_time or int(time.time()),
+            (content or '').strip(),
+            (reply_content or '').strip(),
+            message_row_id or 0,
+        )
+        if turn.user or turn.reply:
+            conversation.append(turn)
+            self._stats['appends'] += 1
+
+    async def save_summary(self, conversation: Conversation, folded_count: int, summary: str) -> None:
+        """
+        把最旧的folded_count轮并入新的总结并持久化
+
+        Args:
+            conversation: 会话历史
+            folded_count: 并入总结的轮次数量
+            summary: 新的总结内容
+        """
+        conversation.fold(folded_count, summary)
+        try:
+            await db_manager.execute(
+                SAVE_SUMMARY_SQL,
+                (*conversation.key, summary, conversation.summarized_until,
+                 conversation.summarized_until_id, int(time.time()))
+            )
+            self._stats['summaries_saved'] += 1
+        except Exception as e:
+            logger.error(f"保存会话总结失败: {conversation.key}, 错误: {e}")
+
+    async def remove_instance(self, instance_id: str) -> None:
+        """
+        删除实例时清除该实例的会话历史和总结
+
+        Args:
+            instance_id: 实例ID
+        """
+        for key in [key for key in self._conversations if key[0] == instance_id]:
+            del self._conversations[key]
+        await db_manager.execute(
+            "DELETE FROM conversation_summaries WHERE instance_id = ?",
+            (instance_id,)
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        return {'conversations': len(self._conversations), **self._stats}
+
+
+# 创建全局实例
+conversation_history = ConversationHistory()
@@ -12,7 +12,11 @@ import json
 from typing import Dict, List, Optional, Any, Set
 
 from wxauto_mgt.data.db_manager import db_manager
+from wxauto_mgt.data.hot_queries import MESSAGE_BY_ID_SQL, PENDING_MESSAGES_SQL, UNPROCESSED_MESSAGES_SQL
 from wxauto_mgt.core.api_client import instance_manager
+from wxauto_mgt.core.chat_scheduler import chat_scheduler
+from wxauto_mgt.core.conversation_history import conversation_history
+from wxauto_mgt.core.reply_scheduler import reply_scheduler
 from wxauto_mgt.core.service_platform_manager import platform_manager, rule_manager
 from wxauto_mgt.core.message_sender import message_sender
 
@@ -24,11 +28,15 @@ logger.setLevel(logging.DEBUG)
 # 导入文件处理专用日志记录器 - 现在也使用主日志记录器
 from wxauto_mgt.utils import file_logger
 
+# 回复状态：等待延时发送（0未回复，1已回复，2回复失败）
+REPLY_STATUS_SCHEDULED = 3
+
 class MessageDeliveryService:
     """消息投递服务"""
 
     def __init__(self, poll_interval: int = 5, batch_size: int = 10,
-                merge_messages: bool = True, merge_window: int = 60):
+                merge_messages: bool = True, merge_window: int = 60,
+                recovery_interval: int = 30):
         """
         初始化消息投递服务
 
@@ -37,8 +45,11 @@ class MessageDeliveryService:
             batch_size: 每次处理的消息数量
             merge_messages: 是否合并消息
             merge_window: 消息合并时间窗口（秒）
+            recovery_interval: 恢复扫描间隔（秒），新消息由监听器直接通知，
+                扫描只用于处理崩溃或通知丢失后遗留的消息
         """
         self.poll_interval = poll_interval
+        self.recovery_interval = recovery_interval
         self.batch_size = batch_size
         self.merge_messages = merge_messages
         self.merge_window = merge_window
@@ -49,6 +60,11 @@ class MessageDeliveryService:
         self._initialized = False
         self._processing_messages: Set[str] = set()  # 正在处理的消息ID集合
 
+        # 新消息通知队列 (instance_id, chat_name, message_id)，由监听器保存消息后写入
+        self._notify_queue: Optional[asyncio.Queue] = None
+        self._notified_messages: Set[str] = set()  # 已通知但尚未提交到调度器的消息ID
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
     async def initialize(self) -> bool:
         """
         初始化服务
@@ -138,6 +154,17 @@ class MessageDeliveryService:
                 )
 
                 logger.info("添加消息投递相关字段到messages表")
+
+            # 延时回复的到期时间，重启后据此恢复未发送的回复
+            if 'reply_due_time' not in table_sql:
+                await db_manager.execute(
+                    "ALTER TABLE messages ADD COLUMN reply_due_time REAL"
+                )
+                logger.info("添加reply_due_time字段到messages表")
+            await db_manager.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_scheduled_replies ON messages(reply_status, reply_due_time) "
+                f"WHERE reply_status = {REPLY_STATUS_SCHEDULED}"
+            )
         except Exception as e:
             logger.error(f"确保数据库表结构正确时出错: {e}")
             raise
@@ -157,7 +184,17 @@ class MessageDeliveryService:
         self._running = True
         logger.info("启动消息投递服务")
 
-        # 启动独立的轮询循环
+        # 启动新消息分发任务
+        self._loop = asyncio.get_running_loop()
+        self._notify_queue = asyncio.Queue()
+        dispatch_task = asyncio.create_task(self._dispatch_loop())
+        self._tasks.add(dispatch_task)
+
+        # 启动延时回复调度器，并恢复上次运行时未发送的回复
+        reply_scheduler.start(self._on_scheduled_reply_due)
+        await self._restore_scheduled_replies()
+
+        # 启动独立的轮询循环（恢复扫描）
         await self._start_independent_polling()
 
         # 启动卡住消息监控
@@ -213,8 +250,8 @@ class MessageDeliveryService:
 
                 logger.debug(f"✅ 独立轮询循环第 {loop_count} 次迭代完成")
 
-                # 等待下一次轮询
-                await asyncio.sleep(self.poll_interval)
+                # 等待下一次恢复扫描
+                await asyncio.sleep(self.recovery_interval)
 
             except asyncio.CancelledError:
                 logger.info("🛑 独立轮询循环被取消")
@@ -224,23 +261,86 @@ class MessageDeliveryService:
                 import traceback
                 logger.error(f"错误堆栈: {traceback.format_exc()}")
                 # 继续运行，不退出
-                await asyncio.sleep(self.poll_interval)
+                await asyncio.sleep(self.recovery_interval)
 
         logger.info("🏁 独立轮询循环结束")
 
+    def notify_new_message(self, instance_id: str, chat_name: str, message_id: str) -> None:
+        """
+        通知有新消息保存到数据库，由分发任务立即提交到会话调度器
+
+        可以在任意线程调用；服务未运行时忽略，消息由启动后的恢复扫描处理。
+
+        Args:
+            instance_id: 实例ID
+            chat_name: 聊天对象
+            message_id: 消息ID
+        """
+        if not self._running or self._notify_queue is None or self._loop is None or self._loop.is_closed():
+            return
+
+        item = (instance_id, chat_name, message_id)
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            self._notified_messages.add(message_id)
+            self._notify_queue.put_nowait(item)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue_notification, item)
+
+    def _enqueue_notification(self, item) -> None:
+        """在服务所在事件循环中写入通知队列"""
+        self._notified_messages.add(item[2])
+        self._notify_queue.put_nowait(item)
+
+    async def _dispatch_loop(self):
+        """新消息分发循环：读取通知队列，取回消息记录并提交到会话调度器"""
+        logger.info("新消息分发循环开始运行")
+        while self._running:
+            try:
+                item = await self._notify_queue.get()
+
+                # 一次取出队列中已有的全部通知，同一批次的消息并发读取
+                batch = [item]
+                while not self._notify_queue.empty():
+                    batch.append(self._notify_queue.get_nowait())
+
+                rows = await asyncio.gather(
+                    *(db_manager.fetchone(MESSAGE_BY_ID_SQL, (message_id,)) for _, _, message_id in batch),
+                    return_exceptions=True
+                )
+
+                # 按通知顺序提交，保证同一会话内的先后顺序
+                for (instance_id, chat_name, message_id), row in zip(batch, rows):
+                    self._notified_messages.discard(message_id)
+                    if isinstance(row, Exception):
+                        logger.error(f"读取新消息失败: {message_id}, 错误: {row}")
+                        continue
+                    if not row:
+                        logger.error(f"无法找到保存的消息: {message_id}")
+                        continue
+                    if row.get('processed') or message_id in self._processing_messages:
+                        continue
+
+                    logger.info(f"新消息直接投递处理: 实例={instance_id}, 聊天={chat_name}, ID={message_id}")
+                    self._schedule_message(row)
+
+            except asyncio.CancelledError:
+                logger.info("新消息分发循环被取消")
+                break
+            except Exception as e:
+                logger.error(f"新消息分发出错: {e}")
+                logger.exception(e)
+
     async def _process_messages_independently(self):
         """独立处理消息，不依赖其他服务"""
         try:
             # 直接查询数据库获取未处理消息
             # 包括投递失败(2)和正在投递(3)的消息，以便重新处理
-            sql = """
-            SELECT * FROM messages
-            WHERE processed = 0 AND delivery_status IN (0, 2, 3)
-            ORDER BY create_time ASC
-            LIMIT ?
-            """
-
-            messages = await db_manager.fetchall(sql, (self.batch_size,))
+            messages = await db_manager.fetchall(PENDING_MESSAGES_SQL, (self.batch_size,))
 
             if not messages:
                 logger.debug("🔍 独立轮询: 没有未处理的消息")
@@ -248,25 +348,20 @@ class MessageDeliveryService:
 
             logger.info(f"🎯 独立轮询: 发现 {len(messages)} 条未处理消息")
 
-            # 处理每条消息
+            # 按会话提交到调度器：同一会话内按时间顺序处理，不同会话和实例并行，
+            # 本轮不等待处理完成，慢速的会话不会阻塞下一轮轮询
             for message in messages:
                 message_dict = dict(message)
                 message_id = message_dict.get('message_id', 'unknown')
 
-                # 检查是否正在处理
-                if message_id in self._processing_messages:
+                # 检查是否正在处理、已在调度队列中或即将由通知分发
+                if (message_id in self._processing_messages or message_id in self._notified_messages
+                        or chat_scheduler.is_scheduled(message_id)):
                     logger.debug(f"⏭️ 跳过正在处理的消息: {message_id}")
                     continue
 
                 logger.info(f"🚀 独立处理消息: {message_id}")
-
-                # 直接处理消息，避免异步任务冲突
-                try:
-                    await self.process_message(message_dict)
-                except Exception as e:
-                    logger.error(f"❌ 处理消息 {message_id} 时出错: {e}")
-                    import traceback
-                    logger.error(f"错误堆栈: {traceback.format_exc()}")
+                self._schedule_message(message_dict)
 
         except Exception as e:
             logger.error(f"❌ 独立消息处理出错: {e}")
@@ -291,6 +386,14 @@ class MessageDeliveryService:
 
         self._tasks.clear()
 
+        # 停止延时回复调度器，未发送的回复保留在数据库中
+        await reply_scheduler.stop()
+
+        # 取消调度器中排队和正在处理的消息，未完成的消息会在下次启动时重新投递
+        await chat_scheduler.cancel_all()
+        self._notify_queue = None
+        self._notified_messages.clear()
+
     async def _message_poll_loop(self) -> None:
         """消息轮询循环"""
         logger.info("消息投递服务轮询循环已启动")
@@ -301,49 +404,8 @@ class MessageDeliveryService:
                 file_logger.debug(f"获取到 {len(instances)} 个实例")
                 logger.debug(f"消息投递轮询: 获取到 {len(instances)} 个实例")
 
-                for instance_id in instances:
-                    file_logger.debug(f"开始处理实例: {instance_id}")
-                    logger.debug(f"消息投递轮询: 开始处理实例 {instance_id}")
-
-                    # 获取未处理的消息
-                    messages = await self._get_unprocessed_messages(instance_id)
-
-                    if not messages:
-                        file_logger.debug(f"实例 {instance_id} 没有未处理的消息")
-                        logger.debug(f"消息投递轮询: 实例 {instance_id} 没有未处理的消息")
-                        continue
-
-                    file_logger.info(f"获取到 {len(messages)} 条未处理消息，实例: {instance_id}")
-                    logger.info(f"消息投递轮询: 获取到 {len(messages)} 条未处理消息，实例: {instance_id}")
-
-                    # 处理消息
-                    if self.merge_messages:
-                        # 合并消息
-                        file_logger.debug(f"开始合并消息")
-                        merged_messages = await self._merge_messages(messages)
-                        file_logger.info(f"合并后有 {len(merged_messages)} 条消息")
-                        logger.info(f"合并后有 {len(merged_messages)} 条消息")
-
-                        for message in merged_messages:
-                            file_logger.debug(f"处理消息: {message.get('message_id')}")
-                            # 直接处理消息，避免异步任务冲突
-                            try:
-                                await self.process_message(message)
-                            except Exception as e:
-                                logger.error(f"❌ 处理合并消息 {message.get('message_id')} 时出错: {e}")
-                                import traceback
-                                logger.error(f"错误堆栈: {traceback.format_exc()}")
-                    else:
-                        # 逐条处理
-                        for message in messages:
-                            file_logger.debug(f"处理消息: {message.get('message_id')}")
-                            # 直接处理消息，避免异步任务冲突
-                            try:
-                                await self.process_message(message)
-                            except Exception as e:
-                                logger.error(f"❌ 处理消息 {message.get('message_id')} 时出错: {e}")
-                                import traceback
-                                logger.error(f"错误堆栈: {traceback.format_exc()}")
+                # 各实例的查询并行执行，消息按会话提交到调度器
+                await asyncio.gather(*(self._poll_instance_messages(instance_id) for instance_id in instances))
 
                 # 等待下一次轮询
                 file_logger.debug(f"等待下一次轮询，间隔: {self.poll_interval}秒")
@@ -358,6 +420,56 @@ class MessageDeliveryService:
                 logger.error(f"消息轮询出错: {e}")
                 await asyncio.sleep(self.poll_interval)
 
+    async def _poll_instance_messages(self, instance_id: str) -> None:
+        """
+        获取单个实例的未处理消息并提交到会话调度器
+
+        Args:
+            instance_id: 实例ID
+        """
+        file_logger.debug(f"开始处理实例: {instance_id}")
+        logger.debug(f"消息投递轮询: 开始处理实例 {instance_id}")
+
+        # 获取未处理的消息
+        messages = await self._get_unprocessed_messages(instance_id)
+
+        if not messages:
+            file_logger.debug(f"实例 {instance_id} 没有未处理的消息")
+            logger.debug(f"消息投递轮询: 实例 {instance_id} 没有未处理的消息")
+            return
+
+        file_logger.info(f"获取到 {len(messages)} 条未处理消息，实例: {instance_id}")
+        logger.info(f"消息投递轮询: 获取到 {len(messages)} 条未处理消息，实例: {instance_id}")
+
+        # 处理消息
+        if self.merge_messages:
+            # 合并消息
+            file_logger.debug(f"开始合并消息")
+            messages = await self._merge_messages(messages)
+            file_logger.info(f"合并后有 {len(messages)} 条消息")
+            logger.info(f"合并后有 {len(messages)} 条消息")
+
+        for message in messages:
+            file_logger.debug(f"处理消息: {message.get('message_id')}")
+            self._schedule_message(message)
+
+    def _schedule_message(self, message: Dict[str, Any]) -> asyncio.Future:
+        """
+        将消息提交到所属会话的调度队列
+
+        Args:
+            message: 消息数据
+
+        Returns:
+            asyncio.Future: 处理结果
+        """
+        return chat_scheduler.submit(
+            message.get('instance_id', ''),
+            message.get('chat_name', ''),
+            message['message_id'],
+            lambda: self.process_message(message)
+        )
+
     async def _get_unprocessed_messages(self, instance_id: str) -> List[Dict[str, Any]]:
         """
         获取未处理的消息
@@ -370,15 +482,8 @@ class MessageDeliveryService:
         """
         try:
             # 查询未处理的消息，包括投递失败和正在投递的消息
-            sql = """
-            SELECT * FROM messages
-            WHERE instance_id = ? AND processed = 0 AND delivery_status IN (0, 2, 3)
-            ORDER BY create_time ASC
-            LIMIT ?
-            """
-
             file_logger.debug(f"查询实例 {instance_id} 的未处理消息")
-            messages = await db_manager.fetchall(sql, (instance_id, self.batch_size))
+            messages = await db_manager.fetchall(UNPROCESSED_MESSAGES_SQL, (instance_id, self.batch_size))
             file_logger.debug(f"查询到 {len(messages)} 条未处理消息")
 
             if messages:
@@ -387,7 +492,7 @@ class MessageDeliveryService:
             # 过滤掉正在处理的消息
             filtered_messages = []
             for msg in messages:
-                if msg['message_id'] not in self._processing_messages:
+                if msg['message_id'] not in self._processing_messages and not chat_scheduler.is_scheduled(msg['message_id']):
                     filtered_messages.append(msg)
                 else:
                     file_logger.debug(f"跳过正在处理的消息: {msg['message_id']}")
@@ -663,7 +768,21 @@ class MessageDeliveryService:
             if 'content' in delivery_result:
                 logger.debug(f"🔍 delivery_result['content']: {delivery_result['content'][:100] if delivery_result['content'] else 'None/Empty'}")
 
-            if should_reply and reply_content:
+            # 平台要求延时回复时，交给延时回复调度器，不阻塞当前会话的后续消息
+            reply_delay = delivery_result.get('reply_delay', 0) if should_reply and reply_content else 0
+
+            if should_reply and reply_content and reply_delay > 0:
+                if 'conversation_id' in delivery_result:
+                    # 会话ID更新失败不影响延时回复的调度
+                    try:
+                        await db_manager.execute(
+                            "UPDATE listeners SET conversation_id = ? WHERE instance_id = ? AND who = ?",
+                            (delivery_result['conversation_id'], message['instance_id'], message['chat_name'])
+                        )
+                    except Exception as e:
+                        logger.error(f"更新会话ID时出错: {e}")
+                await self._schedule_delayed_reply(message, reply_content, reply_delay)
+            elif should_reply and reply_content:
                 logger.debug(f"✅ 满足回复条件，准备发送回复: {message_id}")
                 # 记录详细的回复信息
                 logger.info(f"准备发送回复: ID={message_id}, 实例={message['instance_id']}, 聊天={message['chat_name']}, 内容长度={len(reply_content)}")
@@ -705,6 +824,11 @@ class MessageDeliveryService:
                     logger.debug(f"🔄 调用_update_message_reply_status(成功): {message_id}")
                     await self._update_message_reply_status(message_id, 1, reply_content)
                     logger.debug(f"✅ 回复状态更新完成(成功): {message_id}")
+                    conversation_history.record_turn(
+                        message['instance_id'], message['chat_name'], rule['platform_id'],
+                        message.get('content'), reply_content, message.get('create_time'),
+                        message.get('id')
+                    )
                 else:
                     # 标记为回复失败
                     logger.debug(f"🚀 步骤6: 更新回复状态为失败，消息ID: {message_id}")
@@ -1330,6 +1454,86 @@ class MessageDeliveryService:
             logger.exception(e)
             return False
 
+    async def _schedule_delayed_reply(self, message: Dict[str, Any], reply_content: str, delay: float) -> None:
+        """
+        持久化并安排延时回复
+
+        Args:
+            message: 原始消息
+            reply_content: 回复内容
+            delay: 延时（秒）
+        """
+        message_id = message['message_id']
+        instance_id = message['instance_id']
+        chat_name = message['chat_name']
+
+        due_time = reply_scheduler.next_due_time(instance_id, chat_name, delay)
+        await db_manager.execute(
+            """
+            UPDATE messages
+            SET reply_status = ?, reply_content = ?, reply_due_time = ?
+            WHERE message_id = ?
+            """,
+            (REPLY_STATUS_SCHEDULED, reply_content, due_time, message_id)
+        )
+        reply_scheduler.schedule(instance_id, chat_name, message_id, due_time)
+        logger.info(f"回复将在 {delay:.2f} 秒后发送: ID={message_id}, 实例={instance_id}, 聊天={chat_name}")
+
+    async def _restore_scheduled_replies(self) -> None:
+        """恢复上次运行时未发送的延时回复，已过期的立即发送"""
+        try:
+            # 状态值直接写在SQL中，与部分索引idx_messages_scheduled_replies的条件一致
+            rows = await db_manager.fetchall(
+                "SELECT message_id, instance_id, chat_name, reply_due_time FROM messages "
+                f"WHERE reply_status = {REPLY_STATUS_SCHEDULED} ORDER BY reply_due_time ASC"
+            )
+            for row in rows:
+                reply_scheduler.schedule(
+                    row['instance_id'], row['chat_name'], row['message_id'], row['reply_due_time'] or 0.0
+                )
+            if rows:
+                logger.info(f"恢复了 {len(rows)} 条未发送的延时回复")
+        except Exception as e:
+            logger.error(f"恢复延时回复失败: {e}")
+
+    async def _on_scheduled_reply_due(self, instance_id: str, chat_name: str, message_id: str) -> None:
+        """延时回复到期，提交到会话调度器发送，保证与该会话的其他处理顺序一致"""
+        chat_scheduler.submit(
+            instance_id, chat_name, f"reply:{message_id}",
+            lambda: self._send_scheduled_reply(message_id)
+        )
+
+    async def _send_scheduled_reply(self, message_id: str) -> bool:
+        """
+        发送到期的延时回复
+
+        Args:
+            message_id: 消息ID
+
+        Returns:
+            bool: 是否发送成功
+        """
+        message = await db_manager.fetchone(MESSAGE_BY_ID_SQL, (message_id,))
+        if not message or message.get('reply_status') != REPLY_STATUS_SCHEDULED:
+            logger.debug(f"延时回复已取消或已发送: {message_id}")
+            return False
+
+        reply_content = message.get('reply_content') or ''
+        logger.info(f"开始发送延时回复: ID={message_id}, 实例={message['instance_id']}, 聊天={message['chat_name']}")
+        reply_success = await self.send_reply(message, reply_content)
+        if reply_success:
+            logger.info(f"回复发送成功: ID={message_id}, 聊天={message['chat_name']}")
+            await self._update_message_reply_status(message_id, 1, reply_content)
+            conversation_history.record_turn(
+                message['instance_id'], message['chat_name'], message.get('platform_id'),
+                message.get('content'), reply_content, message.get('create_time'),
+                message.get('id')
+            )
+        else:
+            logger.error(f"回复发送失败: ID={message_id}, 聊天={message['chat_name']}")
+            await self._update_message_reply_status(message_id, 2, reply_content)
+        return reply_success
+
     async def _mark_as_processed(self, message: Dict[str, Any]) -> bool:
         """
         标记消息为已处理
@@ -1479,7 +1683,7 @@ class MessageDeliveryService:
 
         Args:
             message_id: 消息ID
-            status: 回复状态（0未回复，1已回复，2回复失败）
+            status: 回复状态（0未回复，1已回复，2回复失败，3等待延时发送）
             reply_content: 回复内容
 
         Returns:
@@ -20,6 +20,7 @@ from collections import defaultdict
 
 from wxauto_mgt.core.api_client import instance_manager
 from wxauto_mgt.data.db_manager import db_manager
+from wxauto_mgt.data.hot_queries import RECENT_REPLIES_SQL
 from wxauto_mgt.core.config_notifier import config_notifier, ConfigChangeEvent
 from wxauto_mgt.core.service_monitor import service_monitor
 
@@ -45,6 +46,11 @@ class ListenerInfo:
     api_connected: bool = False  # 是否已成功连接到微信实例API
 
 class MessageListener:
+    # 最近回复内容缓存的有效期（秒）
+    RECENT_REPLIES_TTL = 1.0
+    # 长轮询时服务端最多等待新消息的秒数
+    LISTEN_WAIT = 20.0
+
     def __init__(
         self,
         poll_interval: int = 5,
@@ -83,6 +89,15 @@ class MessageListener:
         # 配置变更监听标志
         self._config_listeners_registered = False
 
+        # 每个实例正在进行的监听轮询任务 {instance_id: Task}
+        self._instance_poll_tasks: Dict[str, asyncio.Task] = {}
+        # 每个实例的消息检查锁，不同实例之间互不阻塞
+        self._instance_locks: Dict[str, asyncio.Lock] = {}
+
+        # 最近回复内容缓存 (缓存时间, 内容集合)
+        self._recent_replies = (0.0, set())
+        self._recent_replies_lock = asyncio.Lock()
+
     @property
     def poll_interval(self) -> int:
         """获取轮询间隔"""
@@ -165,6 +180,13 @@ class MessageListener:
         await asyncio.gather(*self._tasks, return_exceptions=True)
         self._tasks.clear()
 
+        # 取消各实例正在进行的轮询
+        poll_tasks = list(self._instance_poll_tasks.values())
+        for task in poll_tasks:
+            task.cancel()
+        await asyncio.gather(*poll_tasks, return_exceptions=True)
+        self._instance_poll_tasks.clear()
+
         # 清理连接状态
         self._instance_connection_states.clear()
 
@@ -255,18 +277,22 @@ class MessageListener:
                 # 检查是否暂停
                 await self.wait_if_paused()
 
-                # 获取所有活跃实例
+                # 获取所有活跃实例，每个实例独立轮询，慢实例不影响其他实例
                 instances = instance_manager.get_all_instances()
                 for instance_id, api_client in instances.items():
-                    # 再次检查是否暂停（每个实例处理前）
-                    await self.wait_if_paused()
-
-                    # 检查API客户端连接状态
-                    if not await self._check_api_client_health(instance_id, api_client):
-                        logger.warning(f"实例 {instance_id} API客户端连接异常，跳过本次检查")
+                    poll_task = self._instance_poll_tasks.get(instance_id)
+                    if poll_task and not poll_task.done():
+                        # 上一轮轮询尚未结束，本轮跳过该实例
+                        logger.debug(f"实例 {instance_id} 上一轮轮询仍在进行，跳过本次检查")
                         continue
 
-                    await self.check_listener_messages(instance_id, api_client)
+                    poll_task = asyncio.create_task(self._poll_instance_listeners(instance_id, api_client))
+                    self._instance_poll_tasks[instance_id] = poll_task
+
+                # 清理已移除实例的轮询任务记录
+                for instance_id in list(self._instance_poll_tasks):
+                    if instance_id not in instances and self._instance_poll_tasks[instance_id].done():
+                        del self._instance_poll_tasks[instance_id]
 
                 # 重置错误计数
                 consecutive_errors = 0
@@ -290,6 +316,31 @@ class MessageListener:
                 else:
                     await asyncio.sleep(self.poll_interval)
 
+    async def _poll_instance_listeners(self, instance_id: str, api_client):
+        """轮询单个实例的监听消息"""
+        try:
+            # 检查是否暂停
+            await self.wait_if_paused()
+
+            # 检查API客户端连接状态
+            if not await self._check_api_client_health(instance_id, api_client):
+                logger.warning(f"实例 {instance_id} API客户端连接异常，跳过本次检查")
+                return
+
+            # 长轮询：服务端在有新消息时立即返回，收到消息后马上发起下一轮，空闲时没有请求往返。
+            # 服务端不支持长轮询（未等待就返回空结果）或出错时，退回按poll_interval轮询
+            while self.running and not self._paused:
+                started = time.time()
+                received = await self.check_listener_messages(instance_id, api_client, wait=self.LISTEN_WAIT)
+                if not received and time.time() - started < 1:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"轮询实例 {instance_id} 的监听消息时出错: {e}")
+            logger.exception(e)
+            service_monitor.record_error("message_listener", f"监听对象检查错误: {e}", "listener_check")
+
     async def _cleanup_loop(self):
         """清理过期监听对象循环"""
         consecutive_errors = 0
@@ -444,35 +495,7 @@ class MessageListener:
                         if message_id:
                             service_monitor.record_message_processed()
 
-                        # 直接处理消息投递和回复 - 新增部分
-                        if message_id:
-                            try:
-                                # 导入消息投递服务
-                                from wxauto_mgt.core.message_delivery_service import message_delivery_service
-
-                                # 获取保存的消息
-                                from wxauto_mgt.data.db_manager import db_manager
-                                saved_message = await db_manager.fetchone(
-                                    "SELECT * FROM messages WHERE message_id = ?",
-                                    (processed_msg.get('id'),)
-                                )
-
-                                if saved_message:
-                                    # 直接处理消息投递
-                                    logger.info(f"主窗口消息直接投递处理: {processed_msg.get('id')}")
-                                    # 创建异步任务处理消息，并等待处理完成
-                                    try:
-                                        # 直接等待处理完成，确保回复能发送回微信
-                                        delivery_result = await message_delivery_service.process_message(saved_message)
-                                        logger.info(f"主窗口消息投递处理完成: {processed_msg.get('id')}, 结果: {delivery_result}")
-                                    except Exception as delivery_e:
-                                        logger.error(f"主窗口消息投递处理异常: {delivery_e}")
-                                        logger.exception(delivery_e)
-                                else:
-                                    logger.error(f"无法找到保存的消息: {processed_msg.get('id')}")
-                            except Exception as e:
-                                logger.error(f"主窗口消息投递处理失败: {e}")
-                                logger.exception(e)
+                        # 消息投递由_save_message通知投递服务完成
                     else:
                         logger.error(f"添加监听对象 {chat_name} 失败，跳过保存消息: {msg.get('id')}")
                         # 不保存消息，因为没有成功添加监听对象
@@ -481,26 +504,32 @@ class MessageListener:
             logger.error(f"处理实例 {instance_id} 主窗口消息时出错: {e}")
             logger.exception(e)
 
-    async def check_listener_messages(self, instance_id: str, api_client):
+    async def check_listener_messages(self, instance_id: str, api_client, wait: float = 0) -> bool:
         """
         检查指定实例所有监听对象的新消息
 
         Args:
             instance_id: 实例ID
             api_client: API客户端实例
+            wait: 没有消息时服务端最多等待的秒数（长轮询）
+
+        Returns:
+            bool: 是否收到了消息
         """
-        async with self._lock:
+        # 只锁定当前实例，不同实例的检查可以并行进行
+        instance_lock = self._instance_locks.setdefault(instance_id, asyncio.Lock())
+        async with instance_lock:
             if instance_id not in self.listeners:
-                return
+                return False
 
             try:
                 # 获取所有监听对象的新消息
                 logger.debug(f"开始获取实例 {instance_id} 所有监听对象的新消息")
-                all_messages = await api_client.get_all_listener_messages()
+                all_messages = await api_client.get_all_listener_messages(wait=wait)
 
                 if not all_messages:
                     logger.debug(f"实例 {instance_id} 没有任何监听对象的新消息")
-                    return
+                    return False
 
                 # 处理每个监听对象的消息
                 for who, messages in all_messages.items():
@@ -575,7 +604,8 @@ class MessageListener:
                             else:
                                 logger.info(f"获取到新消息: 实例={instance_id}, 聊天={who}, 发送者={display_sender}, 内容={short_content}")
 
-                        # 保存消息到数据库
+                        # 预处理消息并构建待保存数据
+                        pending_saves = []
                         for msg in filtered_messages:
                             # 在保存前再次检查消息是否应该被过滤
                             # 特别是检查sender是否为self
@@ -646,39 +676,20 @@ class MessageListener:
                                 continue
 
                             logger.debug(f"准备保存监听消息: {save_data}")
-                            message_id = await self._save_message(save_data)
+                            pending_saves.append((processed_msg, save_data))
+
+                        # 并发保存，同一轮询的消息由组提交写入器合并为一个事务
+                        saved_ids = await asyncio.gather(
+                            *(self._save_message(save_data) for _, save_data in pending_saves)
+                        )
+
+                        # 保存成功的消息已由_save_message按顺序通知投递服务，
+                        # 投递服务按会话调度，慢速的平台调用不会阻塞本实例后续的轮询
+                        for message_id in saved_ids:
                             if message_id:
                                 logger.debug(f"监听消息保存成功，ID: {message_id}")
                                 # 记录消息处理统计
                                 service_monitor.record_message_processed()
-
-                                # 直接处理消息投递和回复 - 与主窗口保持一致
-                                try:
-                                    # 导入消息投递服务
-                                    from wxauto_mgt.core.message_delivery_service import message_delivery_service
-
-                                    # 获取保存的消息
-                                    from wxauto_mgt.data.db_manager import db_manager
-                                    saved_message = await db_manager.fetchone(
-                                        "SELECT * FROM messages WHERE message_id = ?",
-                                        (processed_msg.get('id'),)
-                                    )
-
-                                    if saved_message:
-                                        # 直接处理消息投递
-                                        logger.info(f"监听窗口消息直接投递处理: {processed_msg.get('id')}")
-                                        # 直接等待处理完成，确保回复能发送回微信
-                                        try:
-                                            delivery_result = await message_delivery_service.process_message(saved_message)
-                                            logger.info(f"监听窗口消息投递处理完成: {processed_msg.get('id')}, 结果: {delivery_result}")
-                                        except Exception as delivery_e:
-                                            logger.error(f"监听窗口消息投递处理异常: {delivery_e}")
-                                            logger.exception(delivery_e)
-                                    else:
-                                        logger.error(f"无法找到保存的消息: {processed_msg.get('id')}")
-                                except Exception as e:
-                                    logger.error(f"监听窗口消息投递处理失败: {e}")
-                                    logger.exception(e)
                     else:
                         logger.debug(f"实例 {instance_id} 监听对象 {who} 没有新消息")
 
@@ -690,9 +701,11 @@ class MessageListener:
                     if info.active:
                         info.last_check_time = time.time()
 
+                return True
             except Exception as e:
                 logger.error(f"检查实例 {instance_id} 所有监听对象的消息时出错: {e}")
                 logger.debug(f"错误详情", exc_info=True)
+                return False
 
     def _filter_messages(self, messages: List[dict]) -> List[dict]:
         """
@@ -1132,34 +1145,6 @@ class MessageListener:
                                     if message_id:
                                         logger.debug(f"超时检查消息保存成功，ID: {message_id}")
 
-                                        # 直接处理消息投递和回复 - 与主窗口保持一致
-                                        try:
-                                            # 导入消息投递服务
-                                            from wxauto_mgt.core.message_delivery_service import message_delivery_service
-
-                                            # 获取保存的消息
-                                            from wxauto_mgt.data.db_manager import db_manager
-                                            saved_message = await db_manager.fetchone(
-                                                "SELECT * FROM messages WHERE message_id = ?",
-                                                (processed_msg.get('id'),)
-                                            )
-
-                                            if saved_message:
-                                                # 直接处理消息投递
-                                                logger.info(f"超时检查消息直接投递处理: {processed_msg.get('id')}")
-                                                # 直接等待处理完成，确保回复能发送回微信
-                                                try:
-                                                    delivery_result = await message_delivery_service.process_message(saved_message)
-                                                    logger.info(f"超时检查消息投递处理完成: {processed_msg.get('id')}, 结果: {delivery_result}")
-                                                except Exception as delivery_e:
-                                                    logger.error(f"超时检查消息投递处理异常: {delivery_e}")
-                                                    logger.exception(delivery_e)
-                                            else:
-                                                logger.error(f"无法找到保存的消息: {processed_msg.get('id')}")
-                                        except Exception as e:
-                                            logger.error(f"超时检查消息投递处理失败: {e}")
-                                            logger.exception(e)
-
                         continue  # 跳过移除步骤
 
                 # 执行状态更新操作（标记为非活跃）
@@ -1288,37 +1273,52 @@ class MessageListener:
             content = message_data.get('content', '')
             if content:
                 try:
-                    # 查询最近5分钟内的回复内容
-                    five_minutes_ago = int(time.time()) - 300  # 5分钟 = 300秒
-                    query = """
-                    SELECT reply_content FROM messages
-                    WHERE reply_status = 1 AND reply_time > ?
-                    ORDER BY reply_time DESC LIMIT 10
-                    """
-                    recent_replies = await db_manager.fetchall(query, (five_minutes_ago,))
-
                     # 检查当前消息内容是否与最近的回复内容匹配
-                    for reply in recent_replies:
-                        reply_content = reply.get('reply_content', '')
-                        if reply_content and content == reply_content:
-                            logger.info(f"检测到消息内容与最近回复匹配，标记为已处理: {message_data.get('message_id', '')}")
-                            # 插入消息但标记为已处理
-                            message_data['processed'] = 1
-                            break
+                    recent_replies = await self._get_recent_replies()
+                    if content in recent_replies:
+                        logger.info(f"检测到消息内容与最近回复匹配，标记为已处理: {message_data.get('message_id', '')}")
+                        # 插入消息但标记为已处理
+                        message_data['processed'] = 1
                 except Exception as e:
                     logger.error(f"检查回复匹配时出错: {e}")
 
-            # 插入消息到数据库
-            await db_manager.insert('messages', message_data)
+            # 插入消息到数据库（组提交，同一轮询中的多条消息合并为一个事务）
+            await db_manager.insert_batched('messages', message_data)
 
             # 返回消息ID
             message_id = message_data.get('message_id', '')
             logger.debug(f"消息保存成功，ID: {message_id}")
+
+            # 通知投递服务立即处理，不再等待轮询
+            if not message_data.get('processed'):
+                from wxauto_mgt.core.message_delivery_service import message_delivery_service
+                message_delivery_service.notify_new_message(instance_id, chat_name, message_id)
             return message_id
         except Exception as e:
             logger.error(f"保存消息到数据库失败: {e}")
             return ""
 
+    async def _get_recent_replies(self) -> Set[str]:
+        """
+        获取最近5分钟内的回复内容
+
+        结果缓存RECENT_REPLIES_TTL秒，同一轮询中的大量消息只需查询一次数据库。
+
+        Returns:
+            Set[str]: 回复内容集合
+        """
+        async with self._recent_replies_lock:
+            cached_at, replies = self._recent_replies
+            if time.time() - cached_at < self.RECENT_REPLIES_TTL:
+                return replies
+
+            # 查询最近5分钟内的回复内容
+            five_minutes_ago = int(time.time()) - 300  # 5分钟 = 300秒
+            rows = await db_manager.fetchall(RECENT_REPLIES_SQL, (five_minutes_ago,))
+            replies = {row['reply_content'] for row in rows if row.get('reply_content')}
+            self._recent_replies = (time.time(), replies)
+            return replies
+
     async def _save_listener(self, instance_id: str, who: str, conversation_id: str = "", manual_added: bool = False) -> bool:
         """
         保存监听对象到数据库
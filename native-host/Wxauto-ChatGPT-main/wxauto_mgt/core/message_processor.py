@@ -9,6 +9,8 @@
 - 文件消息
 """
 
+import hashlib
+import json
 import logging
 import os
 import re
@@ -22,6 +24,19 @@ logger = logging.getLogger(__name__)
 # 导入文件处理专用日志记录器
 from wxauto_mgt.utils import file_logger
 
+# 下载目录中的内容哈希索引文件，用于相同附件去重
+DOWNLOAD_INDEX_FILE = ".download_index.json"
+
+
+def _file_sha256(file_path: str) -> str:
+    """分块计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 class MessageProcessor:
     """消息处理工具类"""
 
@@ -97,6 +112,9 @@ class MessageProcessor:
                 self.download_dir = self.temp_download_dir
                 self.using_backup_dir = True
 
+        # 内容哈希索引，首次下载时从下载目录加载
+        self._download_index: Optional[Dict[str, str]] = None
+
     async def process_message(self, message: Dict, api_client) -> Dict:
         """
         处理消息，根据消息类型进行不同处理
@@ -229,169 +247,79 @@ class MessageProcessor:
         """
         下载文件并保存到本地
 
+        先通过HEAD获取远程文件的SHA-256，内容已下载过时直接复用本地文件；
+        否则流式写入以哈希命名的临时文件（中断后下次可续传），校验通过后再重命名为最终文件。
+
         Args:
             file_path: 远程文件路径
             api_client: API客户端实例
 
         Returns:
-            Optional[Tuple[str, int]]: (本地文件路径, 文件大小)，如果下载失败则返回None
+            Optional[Tuple[str, int]]: (本地文件名, 文件大小)，如果下载失败则返回None
         """
         try:
-            import platform
-            import sys
-
             file_logger.info(f"开始下载文件: {file_path}")
             logger.info(f"开始下载文件: {file_path}")
-
-            # 记录当前环境信息，便于调试
-            file_logger.debug(f"当前操作系统: {platform.system()}")
-            file_logger.debug(f"Python版本: {sys.version}")
-            file_logger.debug(f"是否为打包环境: {getattr(sys, 'frozen', False)}")
             file_logger.debug(f"下载目录: {self.download_dir}")
 
             # 确保下载目录存在
             os.makedirs(self.download_dir, exist_ok=True)
 
-            # 检查下载目录权限
-            try:
-                test_file_path = os.path.join(self.download_dir, ".test_write_permission")
-                with open(test_file_path, 'w') as f:
-                    f.write("test")
-                os.remove(test_file_path)
-                file_logger.debug(f"下载目录写入权限正常")
-            except Exception as e:
-                file_logger.error(f"下载目录写入权限检查失败: {e}")
-                logger.error(f"下载目录写入权限检查失败: {e}")
-
-            # 调用API下载文件
-            file_content = await api_client.download_file(file_path)
-            if not file_content:
-                file_logger.error(f"下载文件失败: {file_path}")
-                logger.error(f"下载文件失败: {file_path}")
-                return None
+            # 获取远程文件信息，旧版服务端不支持时为None，直接下载且不去重
+            remote_info = await api_client.get_file_info(file_path)
+            sha256 = remote_info['sha256'] if remote_info else None
+            if sha256:
+                cached_name = self._find_downloaded(sha256, remote_info['size'])
+                if cached_name:
+                    file_logger.info(f"文件内容已下载过，复用本地文件: {cached_name}")
+                    logger.info(f"文件内容已下载过，复用本地文件: {cached_name}")
+                    return cached_name, remote_info['size']
 
             # 提取文件名 - 只取最后的文件名部分，不包含路径
             # 兼容不同操作系统的路径分隔符
-            normalized_path = file_path.replace('\\', '/')
-            file_name = os.path.basename(normalized_path)
+            file_name = os.path.basename(file_path.replace('\\', '/'))
             file_logger.debug(f"提取的文件名: {file_name}")
 
-            # 生成本地保存路径
-            local_path = os.path.join(self.download_dir, file_name)
-            file_logger.debug(f"初始本地保存路径: {local_path}")
+            # 临时文件按内容哈希命名，下载中断后下次可以从断点续传
+            part_path = os.path.join(self.download_dir, f".{sha256 or file_name}.part")
+            file_size = await api_client.download_file_to(
+                file_path, part_path, etag=remote_info['etag'] if remote_info else None
+            )
+
+            if file_size and sha256:
+                loop = asyncio.get_running_loop()
+                actual_sha256 = await loop.run_in_executor(None, _file_sha256, part_path)
+                if actual_sha256 != sha256:
+                    # 续传拼接出错或下载期间远程文件变化，丢弃后完整重新下载一次
+                    file_logger.warning(f"文件校验失败，重新下载: {file_path}")
+                    os.remove(part_path)
+                    sha256 = None
+                    file_size = await api_client.download_file_to(file_path, part_path)
+
+            if not file_size:
+                file_logger.error(f"下载文件失败: {file_path}")
+                logger.error(f"下载文件失败: {file_path}")
+                # 有哈希的临时文件保留用于续传
+                if not sha256 and os.path.exists(part_path):
+                    os.remove(part_path)
+                return None
 
-            # 如果文件已存在，添加序号
+            # 生成本地保存路径，如果文件已存在，添加序号
+            local_path = os.path.join(self.download_dir, file_name)
             counter = 1
             base_name, ext = os.path.splitext(file_name)
             while os.path.exists(local_path):
-                new_name = f"{base_name}_{counter}{ext}"
-                local_path = os.path.join(self.download_dir, new_name)
-                file_logger.debug(f"文件已存在，使用新路径: {local_path}")
+                local_path = os.path.join(self.download_dir, f"{base_name}_{counter}{ext}")
                 counter += 1
-
-            # 保存文件
-            save_success = False
-            try:
-                with open(local_path, 'wb') as f:
-                    f.write(file_content)
-                file_logger.debug(f"文件写入成功: {local_path}")
-                save_success = True
-            except Exception as e:
-                file_logger.error(f"文件写入失败: {e}")
-                logger.error(f"文件写入失败: {e}")
-
-                # 尝试使用备用方法写入
-                try:
-                    import tempfile
-                    temp_dir = tempfile.gettempdir()
-                    temp_path = os.path.join(temp_dir, file_name)
-                    file_logger.debug(f"尝试写入临时文件: {temp_path}")
-
-                    with open(temp_path, 'wb') as f:
-                        f.write(file_content)
-
-                    # 如果临时文件写入成功，尝试复制到目标位置
-                    import shutil
-                    shutil.copy2(temp_path, local_path)
-                    os.remove(temp_path)
-                    file_logger.debug(f"通过临时文件成功写入: {local_path}")
-                    save_success = True
-                except Exception as e2:
-                    file_logger.error(f"备用写入方法也失败: {e2}")
-                    logger.error(f"备用写入方法也失败: {e2}")
-
-                    # 如果备用方法也失败，尝试直接使用临时目录
-                    if hasattr(self, 'temp_download_dir') and not self.using_backup_dir:
-                        try:
-                            # 切换到临时目录
-                            temp_local_path = os.path.join(self.temp_download_dir, file_name)
-                            file_logger.warning(f"尝试直接保存到临时目录: {temp_local_path}")
-
-                            # 如果文件已存在，添加序号
-                            counter = 1
-                            base_name, ext = os.path.splitext(file_name)
-                            while os.path.exists(temp_local_path):
-                                new_name = f"{base_name}_{counter}{ext}"
-                                temp_local_path = os.path.join(self.temp_download_dir, new_name)
-                                file_logger.debug(f"临时目录中文件已存在，使用新路径: {temp_local_path}")
-                                counter += 1
-
-                            # 直接写入临时目录
-                            with open(temp_local_path, 'wb') as f:
-                                f.write(file_content)
-
-                            file_logger.info(f"成功保存到临时目录: {temp_local_path}")
-                            logger.info(f"成功保存到临时目录: {temp_local_path}")
-
-                            # 更新本地路径
-                            local_path = temp_local_path
-                            save_success = True
-
-                            # 标记使用了临时目录
-                            self.using_backup_dir = True
-                        except Exception as e3:
-                            file_logger.error(f"保存到临时目录也失败: {e3}")
-                            logger.error(f"保存到临时目录也失败: {e3}")
-                            return None
-                    else:
-                        return None
-
-            # 返回本地路径和文件大小
-            file_size = len(file_content)
-            file_logger.info(f"文件已保存: {local_path}, 大小: {file_size} 字节")
-            logger.info(f"文件已保存: {local_path}, 大小: {file_size} 字节")
+            os.replace(part_path, local_path)
 
             # 只返回文件名，不包含路径信息
             saved_file_name = os.path.basename(local_path)
-            file_logger.debug(f"返回文件名: {saved_file_name}")
-
-            # 检查文件是否真的存在
-            full_path = os.path.join(self.download_dir, saved_file_name)
-            if os.path.exists(full_path):
-                file_size_on_disk = os.path.getsize(full_path)
-                file_logger.debug(f"验证文件已保存到磁盘: {full_path}, 磁盘上的大小: {file_size_on_disk} 字节")
-
-                # 检查文件内容
-                if file_size_on_disk > 0:
-                    file_logger.debug(f"文件内容有效，大小: {file_size_on_disk} 字节")
-                else:
-                    file_logger.warning(f"文件内容为空: {full_path}")
-                    # 尝试直接写入文件内容
-                    with open(full_path, 'wb') as f:
-                        f.write(file_content)
-                    file_logger.debug(f"尝试重新写入文件内容")
-
-                    # 再次检查
-                    if os.path.exists(full_path) and os.path.getsize(full_path) > 0:
-                        file_logger.debug(f"重新写入成功，文件大小: {os.path.getsize(full_path)} 字节")
-                    else:
-                        file_logger.error(f"重新写入后文件仍然为空或不存在")
-                        return None
-            else:
-                file_logger.error(f"文件保存失败，磁盘上找不到文件: {full_path}")
-                logger.error(f"文件保存失败，磁盘上找不到文件: {full_path}")
-                return None
+            if sha256:
+                self._record_download(sha256, saved_file_name)
 
+            file_logger.info(f"文件已保存: {local_path}, 大小: {file_size} 字节")
+            logger.info(f"文件已保存: {local_path}, 大小: {file_size} 字节")
             return saved_file_name, file_size
 
         except Exception as e:
@@ -400,6 +328,50 @@ class MessageProcessor:
             logger.error(f"下载并保存文件时出错: {e}")
             return None
 
+    def _load_download_index(self) -> Dict[str, str]:
+        """加载下载目录中的内容哈希索引 {sha256: 文件名}"""
+        if self._download_index is None:
+            self._download_index = {}
+            index_path = os.path.join(self.download_dir, DOWNLOAD_INDEX_FILE)
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    self._download_index = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"读取下载索引失败，将重新建立: {e}")
+        return self._download_index
+
+    def _find_downloaded(self, sha256: str, size: int) -> Optional[str]:
+        """
+        查找已下载过的相同内容文件
+
+        Returns:
+            Optional[str]: 本地文件名，文件已被删除或大小不符时返回None
+        """
+        index = self._load_download_index()
+        file_name = index.get(sha256)
+        if not file_name:
+            return None
+        local_path = os.path.join(self.download_dir, file_name)
+        if os.path.isfile(local_path) and os.path.getsize(local_path) == size:
+            return file_name
+        del index[sha256]
+        return None
+
+    def _record_download(self, sha256: str, file_name: str) -> None:
+        """记录下载文件的内容哈希，并原子地写回索引文件"""
+        index = self._load_download_index()
+        index[sha256] = file_name
+        index_path = os.path.join(self.download_dir, DOWNLOAD_INDEX_FILE)
+        try:
+            tmp_path = f"{index_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+        except Exception as e:
+            logger.warning(f"保存下载索引失败: {e}")
+
 # 创建全局实例
 # 默认不使用临时目录，可以通过配置文件或环境变量来控制
 import os
@@ -13,6 +13,7 @@ import requests
 from typing import Dict, Any, Optional, Tuple, List
 
 from wxauto_mgt.data.db_manager import db_manager
+from wxauto_mgt.data.hot_queries import LAST_CHAT_PLATFORM_SQL
 from wxauto_mgt.core.api_client import instance_manager
 
 logger = logging.getLogger(__name__)
@@ -67,7 +68,7 @@ class MessageSender:
             try:
                 # 查询消息对应的平台ID
                 message_platform = await db_manager.fetchone(
-                    "SELECT platform_id FROM messages WHERE instance_id = ? AND chat_name = ? ORDER BY create_time DESC LIMIT 1",
+                    LAST_CHAT_PLATFORM_SQL,
                     (instance_id, chat_name)
                 )
 
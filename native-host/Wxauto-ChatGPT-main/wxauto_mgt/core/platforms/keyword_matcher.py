@@ -0,0 +1,199 @@
+"""
+关键词匹配引擎
+
+把关键词规则预编译成索引，规则不变时可以反复使用：
+- exact：小写关键词 -> 排位 的哈希表
+- contains：Aho-Corasick多模式自动机，一次扫描消息找出所有包含的关键词
+- fuzzy：先按长度、再按字符（1-gram）倒排索引筛选候选关键词，
+  只对相似度上界达到阈值的候选计算SequenceMatcher相似度
+
+每个关键词记录所属规则在规则列表中的位置（排位），匹配时返回排位最小的规则，
+与逐条规则、逐个关键词检查的结果完全一致。
+"""
+
+import logging
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger('wxauto_mgt')
+
+# 模糊匹配相似度阈值
+FUZZY_THRESHOLD = 0.8
+
+_NO_MATCH = float('inf')
+
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机，返回命中模式中最小的排位"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 以该节点结尾（含失败链上）的模式的最小排位
+        self._out: List[float] = [_NO_MATCH]
+        self._built = False
+
+    def add(self, pattern: str, rank: int) -> None:
+        """添加模式"""
+        node = 0
+        for ch in pattern:
+            next_node = self._goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][ch] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(_NO_MATCH)
+            node = next_node
+        if rank < self._out[node]:
+            self._out[node] = rank
+        self._built = False
+
+    def build(self) -> None:
+        """按广度优先顺序计算失败指针"""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                if self._out[self._fail[child]] < self._out[child]:
+                    self._out[child] = self._out[self._fail[child]]
+        self._built = True
+
+    def best_rank(self, text: str, limit: float = _NO_MATCH) -> float:
+        """
+        扫描文本，返回命中模式的最小排位
+
+        Args:
+            text: 待扫描文本
+            limit: 已知的更优排位，只关心比它更小的结果
+        """
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        best = min(limit, out[0])   # 空关键词对任何文本都成立
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node] < best:
+                best = out[node]
+        return best
+
+
+class KeywordMatcher:
+    """编译后的关键词规则索引"""
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        """
+        编译规则
+
+        Args:
+            rules: 关键词规则列表，列表顺序即匹配优先级
+        """
+        self.rules = rules
+        self._exact: Dict[str, int] = {}
+        self._contains = AhoCorasick()
+        self._has_contains = False
+        # 模糊匹配关键词: (排位, 小写关键词, 字符计数)
+        self._fuzzy: List[tuple] = []
+        # 关键词长度 -> {字符 -> 包含该字符的模糊关键词下标列表}
+        self._fuzzy_postings: Dict[int, Dict[str, List[int]]] = {}
+
+        for rank, rule in enumerate(rules):
+            keywords = rule.get('keywords', [])
+            if not keywords:
+                continue
+            match_type = rule.get('match_type', 'exact')  # 默认为完全匹配
+
+            for keyword in keywords:
+                if not isinstance(keyword, str):
+                    logger.warning(f"关键词规则 #{rank + 1} 包含非文本关键词，已忽略: {keyword!r}")
+                    continue
+                keyword_lower = keyword.lower()
+
+                if match_type == 'exact':
+                    self._exact.setdefault(keyword_lower, rank)
+                elif match_type == 'contains':
+                    self._contains.add(keyword_lower, rank)
+                    self._has_contains = True
+                elif match_type == 'fuzzy':
+                    index = len(self._fuzzy)
+                    counts = Counter(keyword_lower)
+                    self._fuzzy.append((rank, keyword_lower, counts))
+                    postings = self._fuzzy_postings.setdefault(len(keyword_lower), {})
+                    for ch in counts:
+                        postings.setdefault(ch, []).append(index)
+
+        if self._has_contains:
+            self._contains.build()
+
+    def match(self, content: str) -> Optional[Dict[str, Any]]:
+        """
+        查找第一条匹配的规则
+
+        Args:
+            content: 消息内容
+
+        Returns:
+            Optional[Dict[str, Any]]: 匹配的规则，没有匹配时返回None
+        """
+        # 转换为小写进行不区分大小写的匹配
+        content_lower = content.lower()
+
+        best = self._exact.get(content_lower, _NO_MATCH)
+        if self._has_contains:
+            best = self._contains.best_rank(content_lower, best)
+        if self._fuzzy:
+            best = self._fuzzy_best_rank(content_lower, best)
+
+        return self.rules[best] if best != _NO_MATCH else None
+
+    def _fuzzy_best_rank(self, content_lower: str, limit: float) -> float:
+        """返回排位小于limit的模糊匹配规则中的最小排位"""
+        content_len = len(content_lower)
+
+        # 匹配字符数不超过较短字符串的长度，先按长度排除不可能达到阈值的关键词
+        content_counts = Counter(content_lower)
+        common: Dict[int, int] = {}
+        for length, postings in self._fuzzy_postings.items():
+            if 2.0 * min(length, content_len) / (length + content_len) < FUZZY_THRESHOLD:
+                continue
+            # 两个字符串的公共字符数是SequenceMatcher匹配字符数的上界，
+            # 通过倒排索引只累计与消息有公共字符的关键词
+            for ch, count in content_counts.items():
+                for index in postings.get(ch, ()):
+                    kw_count = self._fuzzy[index][2][ch]
+                    common[index] = common.get(index, 0) + (count if count < kw_count else kw_count)
+
+        candidates = []
+        for index, matched in common.items():
+            rank, keyword_lower, _ = self._fuzzy[index]
+            if rank >= limit:
+                continue
+            # 与SequenceMatcher.ratio()相同的计算方式，保证上界比较与实际比较一致
+            upper = 2.0 * matched / (content_len + len(keyword_lower))
+            if upper >= FUZZY_THRESHOLD:
+                candidates.append((rank, keyword_lower))
+
+        # 按排位依次计算实际相似度，第一个达到阈值的就是结果
+        candidates.sort(key=lambda item: item[0])
+        matcher = SequenceMatcher(None, content_lower)
+        for rank, keyword_lower in candidates:
+            if rank >= limit:
+                break
+            matcher.set_seq2(keyword_lower)
+            if matcher.ratio() >= FUZZY_THRESHOLD:
+                return rank
+        return limit
@@ -8,12 +8,12 @@
 - 配置验证
 """
 
-import asyncio
 import logging
 import random
 from typing import Dict, Any, List
 
 from .base_platform import ServicePlatform
+from .keyword_matcher import KeywordMatcher
 
 # 导入标准日志记录器
 logger = logging.getLogger('wxauto_mgt')
@@ -37,8 +37,17 @@ class KeywordMatchPlatform(ServicePlatform):
         # 默认回复时间范围（秒）
         self.min_reply_time = config.get('min_reply_time', 1)
         self.max_reply_time = config.get('max_reply_time', 3)
+        # 编译后的关键词索引，规则变化时重建
+        self._matcher = None
         # 消息发送模式已在父类中初始化
 
+    def _get_matcher(self) -> KeywordMatcher:
+        """获取关键词索引，self.rules被替换后重新编译"""
+        if self._matcher is None or self._matcher.rules is not self.rules:
+            self._matcher = KeywordMatcher(self.rules)
+            logger.debug(f"关键词索引已编译，共 {len(self.rules)} 条规则")
+        return self._matcher
+
     async def initialize(self) -> bool:
         """
         初始化平台
@@ -53,6 +62,9 @@ class KeywordMatchPlatform(ServicePlatform):
                 self._initialized = False
                 return False
 
+            # 预编译关键词索引
+            self._get_matcher()
+
             # 基本配置验证完成
             logger.info("关键词匹配平台配置验证完成")
             self._initialized = True
@@ -85,18 +97,10 @@ class KeywordMatchPlatform(ServicePlatform):
 
             logger.info(f"关键词匹配平台处理消息: {content[:50]}...")
 
-            # 匹配关键词
-            matched_rule = None
-            for rule in self.rules:
-                # 获取规则信息
-                keywords = rule.get('keywords', [])
-                match_type = rule.get('match_type', 'exact')  # 默认为完全匹配
-
-                # 检查是否匹配
-                if self._match_keywords(content, keywords, match_type):
-                    matched_rule = rule
-                    logger.info(f"找到匹配的关键词规则: {keywords}")
-                    break
+            # 匹配关键词，按规则顺序返回第一条匹配的规则
+            matched_rule = self._get_matcher().match(content)
+            if matched_rule:
+                logger.info(f"找到匹配的关键词规则: {matched_rule.get('keywords', [])}")
 
             # 如果没有匹配的规则，返回空回复
             if not matched_rule:
@@ -131,16 +135,14 @@ class KeywordMatchPlatform(ServicePlatform):
             if min_time > max_time:
                 min_time, max_time = max_time, min_time
 
-            # 随机延时
+            # 随机延时，由投递服务的延时回复调度器在到期时发送，不阻塞消息处理
             delay_time = random.uniform(min_time, max_time)
             logger.info(f"关键词匹配将延时 {delay_time:.2f} 秒后回复")
 
-            # 延时
-            await asyncio.sleep(delay_time)
-
             # 返回回复内容
             return {
                 "content": reply_content,
+                "reply_delay": delay_time,
                 "raw_response": {
                     "matched_rule": matched_rule,
                     "delay_time": delay_time
@@ -152,7 +154,7 @@ class KeywordMatchPlatform(ServicePlatform):
 
     def _match_keywords(self, content: str, keywords: List[str], match_type: str) -> bool:
         """
-        匹配关键词
+        匹配单条规则的关键词（逐个检查，消息处理使用KeywordMatcher索引）
 
         Args:
             content: 消息内容
@@ -14,7 +14,8 @@ import time
 from typing import Dict, Any
 
 from .base_platform import ServicePlatform
-from wxauto_mgt.data.db_manager import db_manager
+from wxauto_mgt.core.conversation_history import conversation_history
+from wxauto_mgt.utils.tokenizer import count_messages_tokens
 
 # 导入标准日志记录器
 logger = logging.getLogger('wxauto_mgt')
@@ -86,7 +87,7 @@ class OpenAIPlatform(ServicePlatform):
         if not self._initialized:
             await self.initialize()
             if not self._initialized:
-            return {"error": "平台未初始化"}
+                return {"error": "平台未初始化"}
 
         try:
             # 构建消息历史
@@ -95,29 +96,7 @@ class OpenAIPlatform(ServicePlatform):
             ]
 
             if self.continuous_conversation:
-                history_messages = await self._load_history_messages(message)
-                if history_messages:
-                    messages.extend(history_messages)
-
-                    total_tokens = self._estimate_tokens(messages) + self._estimate_tokens(
-                        [{"role": "user", "content": message['content']}]
-                    )
-                    total_tokens += self.max_tokens
-
-                    if total_tokens > self.max_context_tokens:
-                        summary_message = await self._summarize_history(history_messages)
-                        if summary_message:
-                            messages = [
-                                {"role": "system", "content": self.system_prompt},
-                                summary_message,
-                            ]
-                            compact_tokens = self._estimate_tokens(messages)
-                            compact_tokens += self._estimate_tokens(
-                                [{"role": "user", "content": message['content']}]
-                            )
-                            compact_tokens += self.max_tokens
-                            if compact_tokens > self.max_context_tokens:
-                                messages = [{"role": "system", "content": self.system_prompt}]
+                messages.extend(await self._build_history_messages(message))
 
             messages.append({"role": "user", "content": message['content']})
 
@@ -187,19 +166,17 @@ class OpenAIPlatform(ServicePlatform):
 
     def _estimate_tokens(self, messages: list) -> int:
         """
-        简单估算tokens数量（近似）
+        计算消息列表的tokens数量
+
+        有tiktoken时按BPE词表计数，否则使用区分中文的近似计数，结果按文本缓存
 
         Args:
             messages: OpenAI消息列表
 
         Returns:
-            int: 估算tokens数量
+            int: tokens数量
         """
-        total_chars = 0
-        for msg in messages:
-            content = msg.get("content", "")
-            total_chars += len(content)
-        return max(1, total_chars // 4)
+        return count_messages_tokens(messages)
 
     async def _summarize_history(self, history_messages: list) -> Dict[str, Any]:
         """
@@ -251,9 +228,12 @@ class OpenAIPlatform(ServicePlatform):
             logger.error(f"生成总结时出错: {e}")
             return {}
 
-    async def _load_history_messages(self, message: Dict[str, Any]) -> list:
+    async def _build_history_messages(self, message: Dict[str, Any]) -> list:
         """
-        加载历史对话记录
+        组装历史对话：滚动总结加最近的轮次
+
+        历史来自内存中的会话缓存。超出上下文预算时，只把最旧的几轮和上一次的总结
+        合并成新的总结，最近的轮次仍然原样保留。
 
         Args:
             message: 当前消息数据
@@ -269,35 +249,46 @@ class OpenAIPlatform(ServicePlatform):
         if not instance_id or not chat_name:
             return []
 
-        try:
-            history = await db_manager.fetchall(
-                """
-                SELECT content, reply_content
-                FROM messages
-                WHERE instance_id = ? AND chat_name = ? AND platform_id = ? AND reply_status = 1
-                ORDER BY create_time DESC
-                LIMIT ?
-                """,
-                (instance_id, chat_name, self.platform_id, self.history_limit)
-            )
-        except Exception as e:
-            logger.error(f"加载历史记录失败: {e}")
-            return []
-
-        if not history:
-            return []
-
-        messages = []
-        for item in reversed(history):
-            user_content = (item.get('content') or '').strip()
-            reply_content = (item.get('reply_content') or '').strip()
-            if user_content:
-                messages.append({"role": "user", "content": user_content})
-            if reply_content:
-                messages.append({"role": "assistant", "content": reply_content})
-
-        logger.debug(f"OpenAI历史记录加载完成: {len(messages)} 条")
-        return messages
+        conversation = await conversation_history.get(
+            instance_id, chat_name, self.platform_id, self.history_limit
+        )
+
+        # 留给历史消息的tokens：上下文上限减去系统提示、当前消息和回复的预留
+        budget = self.max_context_tokens - self.max_tokens - self._estimate_tokens([
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": message['content']},
+        ])
+        if conversation.tokens <= budget:
+            return conversation.to_messages()
+
+        async with conversation.lock:
+            # 为新总结预留空间，从最旧的轮次开始并入总结，直到剩余轮次放得下
+            summary_reserve = min(512, self.max_tokens)
+            folded = conversation.oldest_turns(max(0, budget - summary_reserve))
+            history = conversation.to_messages(skip=len(folded))
+            # 各轮的token数已在缓存中，按累计值计算，不再重新计数
+            history_tokens = conversation.tokens - sum(turn.tokens for turn in folded)
+            if folded:
+                previous_summary = conversation.summary_message()
+                summary_input = [previous_summary] if previous_summary else []
+                for turn in folded:
+                    summary_input.extend(turn.to_messages())
+                summary_message = await self._summarize_history(summary_input)
+                if summary_message:
+                    await conversation_history.save_summary(
+                        conversation, len(folded), summary_message['content']
+                    )
+                    history = conversation.to_messages()
+                    history_tokens = conversation.tokens
+                    logger.debug(f"OpenAI历史已增量总结: {len(folded)} 轮并入总结")
+
+        if history_tokens > budget:
+            # 无法继续总结（只有一轮或总结本身过长）时，保留总结和放得下的最近轮次
+            history = conversation.fit_messages(max(0, budget))
+            logger.debug(f"OpenAI历史超出预算，按预算截取: {len(history)} 条")
+            return history
+        logger.debug(f"OpenAI历史记录组装完成: {len(history)} 条")
+        return history
 
     async def test_connection(self) -> Dict[str, Any]:
         """
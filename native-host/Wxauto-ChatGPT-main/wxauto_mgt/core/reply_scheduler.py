@@ -0,0 +1,144 @@
+"""
+延时回复调度模块
+
+平台要求延时回复时（如关键词匹配平台模拟人工回复速度），投递服务不再在处理流程中
+等待，而是把回复交给这里的调度器：按到期时间维护一个最小堆，由单个定时任务在最早
+到期时间唤醒并触发发送。到期时间同时持久化到messages.reply_due_time，
+重启后由投递服务重新加载。
+
+同一会话的回复按提交顺序发出：后提交的回复到期时间不早于该会话上一条回复。
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ReplyScheduler:
+    """基于最小堆的延时回复调度器"""
+
+    def __init__(self):
+        # (到期时间, 序号, 实例ID, 聊天对象, 消息ID)
+        self._heap: List[Tuple[float, int, str, str, str]] = []
+        self._counter = itertools.count()
+        self._chat_last_due: Dict[Tuple[str, str], float] = {}
+        self._scheduled: Dict[str, float] = {}
+        self._callback: Optional[Callable[[str, str, str], Awaitable[None]]] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, callback: Callable[[str, str, str], Awaitable[None]]) -> None:
+        """
+        启动调度器
+
+        Args:
+            callback: 到期回调，参数为(实例ID, 聊天对象, 消息ID)，由调度器在当前事件循环中调用
+        """
+        if self._task and not self._task.done():
+            return
+        self._callback = callback
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("延时回复调度器已启动")
+
+    async def stop(self) -> None:
+        """停止调度器，未到期的回复保留在数据库中，下次启动时恢复"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._heap.clear()
+        self._chat_last_due.clear()
+        self._scheduled.clear()
+        logger.info("延时回复调度器已停止")
+
+    def next_due_time(self, instance_id: str, chat_name: str, delay: float) -> float:
+        """
+        计算回复的到期时间，保证同一会话内的回复顺序
+
+        Args:
+            instance_id: 实例ID
+            chat_name: 聊天对象
+            delay: 延时（秒）
+
+        Returns:
+            float: 到期时间戳
+        """
+        due_time = time.time() + max(0.0, delay)
+        last_due = self._chat_last_due.get((instance_id, chat_name), 0.0)
+        return max(due_time, last_due)
+
+    def schedule(self, instance_id: str, chat_name: str, message_id: str, due_time: float) -> None:
+        """
+        添加一个延时回复
+
+        Args:
+            instance_id: 实例ID
+            chat_name: 聊天对象
+            message_id: 消息ID
+            due_time: 到期时间戳
+        """
+        if message_id in self._scheduled:
+            return
+        self._scheduled[message_id] = due_time
+
+        key = (instance_id, chat_name)
+        if due_time > self._chat_last_due.get(key, 0.0):
+            self._chat_last_due[key] = due_time
+
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (due_time, next(self._counter), instance_id, chat_name, message_id))
+        logger.debug(f"已安排延时回复: {message_id}, {max(0.0, due_time - time.time()):.2f} 秒后发送")
+
+        # 新回复比当前最早的回复更早到期时唤醒定时任务
+        if self._wakeup and (earliest is None or due_time < earliest):
+            self._wakeup.set()
+
+    def pending_count(self) -> int:
+        """未到期的回复数量"""
+        return len(self._heap)
+
+    async def _run(self) -> None:
+        """定时任务：睡眠到最早的到期时间，触发所有已到期的回复"""
+        while True:
+            try:
+                self._wakeup.clear()
+                if not self._heap:
+                    await self._wakeup.wait()
+                    continue
+
+                wait_time = self._heap[0][0] - time.time()
+                if wait_time > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wait_time)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    _, _, instance_id, chat_name, message_id = heapq.heappop(self._heap)
+                    self._scheduled.pop(message_id, None)
+                    key = (instance_id, chat_name)
+                    if self._chat_last_due.get(key, 0.0) <= now:
+                        self._chat_last_due.pop(key, None)
+                    try:
+                        await self._callback(instance_id, chat_name, message_id)
+                    except Exception as e:
+                        logger.error(f"触发延时回复失败: {message_id}, 错误: {e}")
+                        logger.exception(e)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"延时回复调度出错: {e}")
+                logger.exception(e)
+                await asyncio.sleep(1)
+
+
+# 创建全局实例
+reply_scheduler = ReplyScheduler()
@@ -0,0 +1,143 @@
+"""
+投递规则索引模块
+
+把按优先级排好序的投递规则编译成索引，避免每条消息都线性遍历全部规则：
+- 精确匹配和逗号分隔的名称列表展开到哈希表中
+- regex:规则在加载时预编译，可以合并的正则合并为一个多分支正则
+- 通配符规则只需记录排位最靠前的一条
+
+每条规则用它在原始列表中的位置作为排位，查询时取所有候选中排位最小的规则，
+因此匹配结果与按原顺序逐条检查完全一致。
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 合并正则时会改变分组编号或名称的写法（反向引用、命名分组、条件分组引用、全局标志），这类正则单独匹配
+_UNSAFE_COMBINE = re.compile(r'\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux-]*\)')
+
+
+class _Bucket:
+    """同一个instance_id下的规则索引"""
+
+    __slots__ = ('exact', 'combined', 'regexes', 'wildcard')
+
+    def __init__(self):
+        self.exact: Dict[str, int] = {}
+        # 合并后的正则及其分组名 -> 排位
+        self.combined: Optional[Tuple[Pattern, Dict[str, int]]] = None
+        # 无法合并的正则 (排位, 正则)，按排位升序
+        self.regexes: List[Tuple[int, Pattern]] = []
+        self.wildcard: Optional[int] = None
+
+    def best_rank(self, chat_name: str, limit: Optional[int] = None) -> Optional[int]:
+        """返回匹配chat_name的最小排位，limit表示已知的更优候选"""
+        best = limit
+
+        rank = self.exact.get(chat_name)
+        if rank is not None and (best is None or rank < best):
+            best = rank
+
+        if self.wildcard is not None and (best is None or self.wildcard < best):
+            best = self.wildcard
+
+        if self.combined is not None:
+            pattern, group_ranks = self.combined
+            match = pattern.match(chat_name)
+            if match:
+                # 多分支正则按分支顺序尝试，第一个成功的分支就是排位最小的正则
+                rank = group_ranks[match.lastgroup]
+                if best is None or rank < best:
+                    best = rank
+
+        for rank, pattern in self.regexes:
+            if best is not None and rank >= best:
+                break
+            if pattern.match(chat_name):
+                best = rank
+                break
+
+        return best
+
+
+class RuleIndex:
+    """编译后的投递规则索引"""
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        """
+        编译规则
+
+        Args:
+            rules: 按匹配顺序（优先级降序）排列的规则列表
+        """
+        self.rules = list(rules)
+        self._buckets: Dict[str, _Bucket] = {}
+        self._platform_indexes: Dict[str, 'RuleIndex'] = {}
+
+        combine: Dict[str, List[Tuple[int, str]]] = {}
+        for rank, rule in enumerate(self.rules):
+            bucket = self._buckets.setdefault(rule.get('instance_id', ''), _Bucket())
+            pattern = rule.get('chat_pattern', '') or ''
+
+            if pattern == '*':
+                if bucket.wildcard is None:
+                    bucket.wildcard = rank
+            elif pattern.startswith('regex:'):
+                regex = pattern[6:]
+                try:
+                    compiled = re.compile(regex)
+                except re.error as e:
+                    logger.error(f"规则 {rule.get('rule_id', '未知')} 的正则表达式无效，已忽略: {regex}, 错误: {e}")
+                    continue
+                if _UNSAFE_COMBINE.search(regex):
+                    bucket.regexes.append((rank, compiled))
+                else:
+                    combine.setdefault(rule.get('instance_id', ''), []).append((rank, regex))
+            else:
+                names = [p.strip() for p in pattern.split(',')] if ',' in pattern else [pattern]
+                for name in names:
+                    bucket.exact.setdefault(name, rank)
+
+        for instance_id, regexes in combine.items():
+            bucket = self._buckets[instance_id]
+            group_ranks = {f"r{rank}": rank for rank, _ in regexes}
+            try:
+                combined = re.compile('|'.join(f"(?P<r{rank}>{regex})" for rank, regex in regexes))
+                bucket.combined = (combined, group_ranks)
+            except re.error:
+                # 合并失败时退回逐条匹配
+                bucket.regexes.extend((rank, re.compile(regex)) for rank, regex in regexes)
+            bucket.regexes.sort(key=lambda item: item[0])
+
+    def match(self, instance_id: str, chat_name: str) -> Optional[Dict[str, Any]]:
+        """
+        查找第一条匹配的规则
+
+        Args:
+            instance_id: 实例ID
+            chat_name: 聊天对象名称
+
+        Returns:
+            Optional[Dict[str, Any]]: 匹配的规则
+        """
+        best = None
+        for key in (instance_id, '*'):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                best = bucket.best_rank(chat_name, best)
+            if instance_id == '*':
+                break
+        return self.rules[best] if best is not None else None
+
+    def for_platform(self, platform_id: str) -> 'RuleIndex':
+        """获取只包含指定平台规则的子索引"""
+        index = self._platform_indexes.get(platform_id)
+        if index is None:
+            rules = [rule for rule in self.rules if rule.get('platform_id') == platform_id]
+            rules.sort(key=lambda x: (-x['priority'], x['rule_id']))
+            index = RuleIndex(rules)
+            self._platform_indexes[platform_id] = index
+        return index
@@ -17,6 +17,7 @@ from typing import Dict, List, Optional, Any
 from wxauto_mgt.data.db_manager import db_manager
 from wxauto_mgt.core.service_platform import ServicePlatform, create_platform
 from wxauto_mgt.core.config_notifier import config_notifier, ConfigChangeType
+from wxauto_mgt.core.rule_index import RuleIndex
 
 logger = logging.getLogger(__name__)
 
@@ -666,9 +667,23 @@ class ServicePlatformManager:
 class DeliveryRuleManager:
     """投递规则管理器"""
 
+    # (实例ID, 聊天对象) -> 规则 缓存的最大条目数
+    MATCH_CACHE_SIZE = 10000
+
+    # 会影响规则匹配结果的配置变更
+    RULE_CHANGE_TYPES = (
+        ConfigChangeType.RULE_ADDED,
+        ConfigChangeType.RULE_UPDATED,
+        ConfigChangeType.RULE_DELETED,
+        ConfigChangeType.RULE_ENABLED,
+        ConfigChangeType.RULE_DISABLED,
+    )
+
     def __init__(self):
         """初始化投递规则管理器"""
         self._rules: List[Dict[str, Any]] = []
+        self._index = RuleIndex([])
+        self._match_cache: Dict[tuple, Optional[Dict[str, Any]]] = {}
         self._initialized = False
 
     async def initialize(self) -> bool:
@@ -688,6 +703,10 @@ class DeliveryRuleManager:
             # 从数据库加载规则
             await self._load_rules()
 
+            # 规则变更时清空匹配缓存
+            for change_type in self.RULE_CHANGE_TYPES:
+                await config_notifier.subscribe(change_type, self._on_rules_changed)
+
             self._initialized = True
             logger.info(f"投递规则管理器初始化完成，加载了 {len(self._rules)} 个规则")
             return True
@@ -787,11 +806,18 @@ class DeliveryRuleManager:
             )
 
             self._rules = rules
+            self._index = RuleIndex(rules)
+            self._match_cache.clear()
             logger.info(f"加载了 {len(rules)} 个投递规则")
         except Exception as e:
             logger.error(f"加载投递规则失败: {e}")
             raise
 
+    async def _on_rules_changed(self, event) -> None:
+        """规则配置变更回调"""
+        self._match_cache.clear()
+        logger.debug(f"规则配置变更，已清空匹配缓存: {event.change_type.value}")
+
     async def add_rule(self, name: str, instance_id: str, chat_pattern: str,
                       platform_id: str, priority: int = 0, only_at_messages: int = 0,
                       at_name: str = '', reply_at_sender: int = 0) -> Optional[str]:
@@ -1128,27 +1154,7 @@ class DeliveryRuleManager:
             await self.initialize()
 
         try:
-            # 查询所有规则
-            rules = await self.get_all_rules()
-
-            # 过滤出平台ID匹配的规则
-            platform_rules = [rule for rule in rules if rule['platform_id'] == platform_id]
-
-            # 按优先级排序（降序）
-            platform_rules.sort(key=lambda x: (-x['priority'], x['rule_id']))
-
-            # 遍历规则，找到匹配的规则
-            for rule in platform_rules:
-                # 检查实例ID是否匹配
-                if rule['instance_id'] != instance_id and rule['instance_id'] != '*':
-                    continue
-
-                # 检查聊天对象是否匹配
-                chat_pattern = rule['chat_pattern']
-                if self._match_chat_pattern(chat_pattern, chat_name):
-                    return rule
-
-            return None
+            return self._index.for_platform(platform_id).match(instance_id, chat_name)
         except Exception as e:
             logger.error(f"根据平台ID和聊天对象获取规则失败: {e}")
             return None
@@ -1168,57 +1174,26 @@ class DeliveryRuleManager:
         if not self._initialized:
             await self.initialize()
 
-        logger.info(f"开始匹配规则: 实例={instance_id}, 聊天={chat_name}, 消息内容={message_content[:50] if message_content else 'None'}...")
-        logger.info(f"当前共有 {len(self._rules)} 条规则")
-
-        # 按优先级遍历规则
-        for rule in self._rules:
-            rule_id = rule.get('rule_id', '未知')
-            rule_name = rule.get('name', '未知')
-            rule_instance = rule.get('instance_id', '')
-            rule_pattern = rule.get('chat_pattern', '')
-            rule_only_at = rule.get('only_at_messages', 0)
-            rule_at_name = rule.get('at_name', '')
-
-            logger.info(f"检查规则: ID={rule_id}, 名称={rule_name}, 实例={rule_instance}, 模式={rule_pattern}, 只响应@={rule_only_at}, @名称={rule_at_name}")
-
-            # 检查实例ID是否匹配
-            if rule['instance_id'] != instance_id and rule['instance_id'] != '*':
-                logger.info(f"规则 {rule_id} 实例ID不匹配: 规则={rule_instance}, 当前={instance_id}")
-                continue
-
-            # 检查聊天对象是否匹配
-            pattern = rule['chat_pattern']
-            is_chat_match = self._match_chat_pattern(pattern, chat_name)
-
-            # 记录匹配结果
-            if is_chat_match:
-                logger.info(f"规则 {rule_id} 聊天对象匹配成功: {pattern} 匹配 {chat_name}")
-            else:
-                logger.info(f"规则 {rule_id} 聊天对象不匹配: {pattern} 不匹配 {chat_name}")
-                continue
-
-            # 注意：@消息的检查逻辑已移至 message_filter.py 和 message_listener.py 中
-            # 这里只进行规则匹配，不进行@消息的过滤
-            # 在规则匹配阶段，我们不应该过滤掉任何消息，而是返回匹配的规则
-            # 然后由调用方根据规则中的 only_at_messages 和 at_name 字段决定是否过滤消息
+        key = (instance_id, chat_name)
+        try:
+            return self._match_cache[key]
+        except KeyError:
+            pass
 
-            # 记录规则的@消息设置，但不进行过滤
-            only_at_messages = rule.get('only_at_messages', 0)
-            at_name = rule.get('at_name', '')
+        # 注意：@消息的检查逻辑在 message_filter.py 和 message_listener.py 中，
+        # 这里只进行规则匹配，结果只与实例ID和聊天对象有关，可以缓存
+        rule = self._index.match(instance_id, chat_name)
 
-            if only_at_messages == 1:
-                logger.info(f"规则 {rule_id} 要求只响应@消息，@名称: {at_name}")
-                # 在调用方进行@消息的过滤，这里只返回匹配的规则
-            else:
-                logger.info(f"规则 {rule_id} 不要求@消息")
+        if len(self._match_cache) >= self.MATCH_CACHE_SIZE:
+            self._match_cache.clear()
+        self._match_cache[key] = rule
 
-            # 所有条件都匹配，返回规则
-            logger.info(f"规则 {rule_id} 匹配成功，返回规则")
-            return rule
-
-        logger.info(f"没有匹配到任何规则: 实例={instance_id}, 聊天={chat_name}")
-        return None
+        if rule:
+            logger.debug(f"规则 {rule.get('rule_id', '未知')} 匹配成功: 实例={instance_id}, 聊天={chat_name}, "
+                         f"模式={rule.get('chat_pattern', '')}, 只响应@={rule.get('only_at_messages', 0)}")
+        else:
+            logger.debug(f"没有匹配到任何规则: 实例={instance_id}, 聊天={chat_name}")
+        return rule
 
 
 # 创建全局实例
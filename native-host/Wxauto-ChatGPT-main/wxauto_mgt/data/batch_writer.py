@@ -0,0 +1,139 @@
+"""
+批量写入模块
+
+实现组提交（group commit）：插入请求先进入队列，等待几毫秒、累积到N行
+或上一批次提交完成时，在写连接上用一个事务统一提交。调用方await的future
+在所属事务提交后才完成，返回即表示数据已提交。每行使用独立的SAVEPOINT，
+单行失败不影响同批其他行。
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """组提交写入器"""
+
+    def __init__(self, db_manager, flush_interval: float = 0.002, max_batch: int = 200):
+        """
+        初始化批量写入器
+
+        Args:
+            db_manager: 数据库管理器
+            flush_interval: 最长等待时间（秒），超过后立即提交
+            max_batch: 单个事务最多包含的行数，达到后立即提交
+        """
+        self._db = db_manager
+        self._flush_interval = flush_interval
+        self._max_batch = max_batch
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[str, List[Any], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks = set()
+
+        # 统计信息
+        self.total_rows = 0
+        self.total_batches = 0
+
+    async def insert(self, table: str, data: Dict) -> int:
+        """
+        将插入请求加入队列，等待所在批次提交
+
+        Args:
+            table: 表名
+            data: 数据字典
+
+        Returns:
+            int: 新插入记录的ID，没有有效字段时返回0
+        """
+        prepared = await self._db._prepare_insert(table, data)
+        if not prepared:
+            return 0
+        sql, values = prepared
+
+        loop = asyncio.get_running_loop()
+        if self._loop is None or self._loop.is_closed():
+            self._loop = loop
+        if loop is not self._loop:
+            # 队列绑定在首次使用的事件循环上，其他循环（如Web服务线程）直接单条写入
+            return await self._db.transaction(lambda conn: conn.execute(sql, values).lastrowid)
+
+        future = loop.create_future()
+        self._pending.append((sql, values, future))
+
+        if len(self._pending) >= self._max_batch:
+            self._start_flush()
+        elif self._flush_handle is None and not self._flush_tasks:
+            # 写连接空闲时等待flush_interval收集同一时刻的并发写入；
+            # 有批次正在提交时不设定时器，新数据在该批次完成后立即提交
+            self._flush_handle = loop.call_later(self._flush_interval, self._start_flush)
+
+        return await future
+
+    def _start_flush(self) -> None:
+        """取出当前队列并启动提交任务"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        # 写连接是单线程执行器，多个批次按提交顺序依次执行
+        task = self._loop.create_task(self._flush(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._on_flush_done)
+
+    def _on_flush_done(self, task: asyncio.Task) -> None:
+        """批次提交完成后，立即提交期间累积的数据"""
+        self._flush_tasks.discard(task)
+        if self._pending and not self._flush_tasks:
+            self._start_flush()
+
+    async def _flush(self, batch: List[Tuple[str, List[Any], asyncio.Future]]) -> None:
+        """在一个事务中写入整批数据，并设置每个future的结果"""
+        def _write_batch(conn):
+            results = []
+            for sql, values, _ in batch:
+                conn.execute("SAVEPOINT batch_row")
+                try:
+                    results.append(conn.execute(sql, values).lastrowid)
+                    conn.execute("RELEASE batch_row")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO batch_row")
+                    conn.execute("RELEASE batch_row")
+                    results.append(e)
+            return results
+
+        try:
+            results = await self._db.transaction(_write_batch)
+        except Exception as e:
+            logger.error(f"批量写入失败，共 {len(batch)} 行: {e}")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.total_batches += 1
+        self.total_rows += len(batch)
+        logger.debug(f"批量提交 {len(batch)} 行")
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(ValueError(f"数据库插入失败: {result}"))
+            else:
+                future.set_result(result)
+
+    async def flush(self) -> None:
+        """立即提交队列中的数据并等待所有批次完成"""
+        if self._loop is asyncio.get_running_loop():
+            self._start_flush()
+        if self._flush_tasks:
+            await asyncio.gather(*list(self._flush_tasks), return_exceptions=True)
@@ -6,34 +6,41 @@
 支持多实例管理。
 """
 
-import asyncio
 import os
 import sqlite3
 import time
 import traceback
 import platform
-import aiosqlite
 import logging
 from typing import Dict, List, Optional, Any, Union
 
+from .batch_writer import BatchWriter
+from .db_pool import SQLitePool
+from .hot_queries import HOT_QUERIES, MESSAGE_INDEXES
+
 logger = logging.getLogger(__name__)
 
 class DBManager:
     """数据库管理器，负责管理数据库连接和操作"""
 
+    # 默认只读连接数量
+    DEFAULT_READERS = 4
+
     def __init__(self):
         """初始化数据库管理器"""
         self._db_path = None
         self._initialized = False
-        self._lock = asyncio.Lock()
-        self._connection = None
+        self._pool: Optional[SQLitePool] = None
+        self._table_columns: Dict[str, set] = {}
+        self._batch_writer = BatchWriter(self)
 
-    async def initialize(self, db_path: str = None) -> None:
+    async def initialize(self, db_path: str = None, readers: int = DEFAULT_READERS) -> None:
         """
         初始化数据库
 
         Args:
             db_path: 数据库文件路径，如果为None则使用默认路径
+            readers: 连接池中只读连接的数量
         """
         if self._initialized:
             logger.warning("数据库管理器已经初始化")
@@ -53,8 +60,13 @@ class DBManager:
         # 初始化数据库
         await self._init_db()
 
+        # 启动长连接池
+        self._pool = SQLitePool(db_path, readers=readers)
+        self._pool.open()
+
         # 标记为已初始化
         self._initialized = True
+        await self._load_table_columns()
 
         # 检查并确保触发器存在
         try:
@@ -70,6 +82,12 @@ class DBManager:
             logger.error(f"检查并更新表结构时出错: {e}")
             # 不要因为表结构问题而阻止应用程序启动
 
+        # 检查热点查询的执行计划，退化时只记录警告
+        try:
+            await self.check_query_plans()
+        except Exception as e:
+            logger.error(f"检查查询执行计划时出错: {e}")
+
         logger.info(f"数据库初始化完成: {db_path}")
 
     async def _init_db(self) -> None:
@@ -278,6 +296,7 @@ class DBManager:
             reply_content TEXT,
             reply_status INTEGER DEFAULT 0,
             reply_time INTEGER,
+            reply_due_time REAL,
             merged INTEGER DEFAULT 0,
             merged_count INTEGER DEFAULT 0,
             merged_ids TEXT,
@@ -293,6 +312,10 @@ class DBManager:
         conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_delivery_status ON messages(delivery_status)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_platform_id ON messages(platform_id)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_reply_status ON messages(reply_status)")
+
+        # 热点查询使用的复合索引和部分索引
+        for index_sql in MESSAGE_INDEXES:
+            conn.execute(index_sql)
         logger.debug("创建messages表索引")
 
         # 服务平台表
@@ -334,6 +357,21 @@ class DBManager:
         conn.execute("CREATE INDEX IF NOT EXISTS idx_delivery_rules_priority ON delivery_rules(priority)")
         logger.debug("创建delivery_rules表索引")
 
+        # 会话滚动总结表（OpenAI平台连续对话使用）
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            instance_id TEXT NOT NULL,
+            chat_name TEXT NOT NULL,
+            platform_id TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            summarized_until INTEGER NOT NULL DEFAULT 0,
+            summarized_until_id INTEGER NOT NULL DEFAULT 0,
+            update_time INTEGER NOT NULL,
+            PRIMARY KEY (instance_id, chat_name, platform_id)
+        )
+        """)
+        logger.debug("创建conversation_summaries表")
+
         # 创建触发器，自动删除Self和Time类型的消息
         logger.info("创建消息过滤触发器...")
 
@@ -398,6 +436,14 @@ class DBManager:
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_fixed_listeners_enabled ON fixed_listeners(enabled)")
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_fixed_listeners_session_name ON fixed_listeners(session_name)")
 
+            # 检查并添加conversation_summaries表的summarized_until_id字段
+            cursor = conn.execute("PRAGMA table_info(conversation_summaries)")
+            if 'summarized_until_id' not in [col[1] for col in cursor.fetchall()]:
+                logger.info("添加summarized_until_id字段到conversation_summaries表")
+                conn.execute(
+                    "ALTER TABLE conversation_summaries ADD COLUMN summarized_until_id INTEGER NOT NULL DEFAULT 0"
+                )
+
             logger.debug("表结构升级完成")
         except Exception as e:
             logger.error(f"升级表结构时出错: {e}")
@@ -413,10 +459,12 @@ class DBManager:
         if not self._initialized:
             raise RuntimeError("数据库管理器未初始化")
 
-        async with self._lock:
-            async with aiosqlite.connect(self._db_path) as db:
-                await db.execute(sql, params or ())
-                await db.commit()
+        # PRAGMA、VACUUM等语句不能在事务中执行
+        keyword = sql.lstrip()[:6].upper()
+        transaction = not keyword.startswith(('PRAGMA', 'VACUUM'))
+
+        await self._pool.write(lambda conn: conn.execute(sql, params or ()), transaction)
+        await self._refresh_schema_cache(sql)
 
     async def executemany(self, sql: str, params_list: List[tuple]) -> None:
         """
@@ -429,10 +477,8 @@ class DBManager:
         if not self._initialized:
             raise RuntimeError("数据库管理器未初始化")
 
-        async with self._lock:
-            async with aiosqlite.connect(self._db_path) as db:
-                await db.executemany(sql, params_list)
-                await db.commit()
+        await self._pool.write(lambda conn: conn.executemany(sql, params_list))
+        await self._refresh_schema_cache(sql)
 
     async def fetchone(self, sql: str, params: tuple = None) -> Optional[Dict]:
         """
@@ -448,11 +494,11 @@ class DBManager:
         if not self._initialized:
             raise RuntimeError("数据库管理器未初始化")
 
-        async with aiosqlite.connect(self._db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(sql, params or ()) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+        def _fetchone(conn):
+            row = conn.execute(sql, params or ()).fetchone()
+            return dict(row) if row else None
+
+        return await self._pool.read(_fetchone)
 
     async def fetchall(self, sql: str, params: tuple = None) -> List[Dict]:
         """
@@ -468,11 +514,10 @@ class DBManager:
         if not self._initialized:
             raise RuntimeError("数据库管理器未初始化")
 
-        async with aiosqlite.connect(self._db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(sql, params or ()) as cursor:
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+        def _fetchall(conn):
+            return [dict(row) for row in conn.execute(sql, params or ()).fetchall()]
+
+        return await self._pool.read(_fetchall)
 
     async def insert(self, table: str, data: Dict) -> int:
         """
@@ -496,107 +541,137 @@ class DBManager:
                 raise RuntimeError(f"数据库管理器未初始化且无法自动初始化: {init_error}")
 
         try:
-            logger.debug(f"准备向表 {table} 插入数据: {data}")
-
-            # 验证表名
-            try:
-                valid_tables = await self._get_table_names()
-                if table not in valid_tables:
-                    error_msg = f"表 {table} 不存在，可用的表: {valid_tables}"
-                    logger.error(error_msg)
-                    raise ValueError(error_msg)
-            except Exception as table_error:
-                logger.error(f"获取表名时出错: {table_error}")
-                # 继续执行，假设表存在
-
-            # 获取表结构，验证字段
-            try:
-                table_info = await self._get_table_structure(table)
-                table_columns = {col["name"] for col in table_info}
-
-                # 检查数据字段是否在表中存在
-                invalid_fields = set(data.keys()) - table_columns
-                if invalid_fields:
-                    logger.warning(f"字段 {invalid_fields} 在表 {table} 中不存在，将被忽略")
-                    # 移除无效字段
-                    for field in invalid_fields:
-                        data.pop(field, None)
-            except Exception as struct_error:
-                logger.error(f"获取表结构时出错: {struct_error}")
-                # 继续执行，不验证字段
-
-            if not data:
-                logger.error("没有有效的数据可以插入")
+            prepared = await self._prepare_insert(table, data)
+            if not prepared:
                 return 0
+            sql, values = prepared
 
-            keys = list(data.keys())
-            values = list(data.values())
-            placeholders = ','.join(['?' for _ in keys])
-
-            sql = f"INSERT INTO {table} ({','.join(keys)}) VALUES ({placeholders})"
-            logger.debug(f"执行SQL: {sql}, 参数: {values}")
-
-            async with self._lock:
-                async with aiosqlite.connect(self._db_path) as db:
-                    try:
-                        cursor = await db.execute(sql, values)
-                        await db.commit()
-                        last_rowid = cursor.lastrowid
-                        logger.debug(f"插入记录成功，ID: {last_rowid}")
-                        return last_rowid
-                    except Exception as db_error:
-                        import traceback
-                        error_msg = f"执行SQL时发生错误: {db_error}"
-                        logger.error(error_msg)
-                        logger.error(f"异常堆栈: {traceback.format_exc()}")
-
-                        # 尝试使用另一种方式插入
-                        try:
-                            logger.info("尝试使用直接SQL语句插入...")
-                            # 构建SQL语句
-                            fields = ", ".join(keys)
-                            placeholders = ", ".join(["?" for _ in keys])
-
-                            insert_sql = f"INSERT INTO {table} ({fields}) VALUES ({placeholders})"
-                            logger.debug(f"执行SQL: {insert_sql}")
-                            logger.debug(f"参数值: {values}")
-
-                            await db.execute(insert_sql, values)
-                            await db.commit()
-
-                            # 获取最后插入的ID
-                            cursor = await db.execute("SELECT last_insert_rowid()")
-                            row = await cursor.fetchone()
-                            last_id = row[0] if row else 0
-
-                            logger.info(f"使用直接SQL语句插入成功，ID: {last_id}")
-                            return last_id
-                        except Exception as direct_error:
-                            logger.error(f"直接SQL插入也失败: {direct_error}")
-                            logger.error(f"异常堆栈: {traceback.format_exc()}")
-                            raise ValueError(f"数据库插入失败: {str(db_error)}, 直接SQL插入也失败: {str(direct_error)}")
+            try:
+                last_rowid = await self._pool.write(lambda conn: conn.execute(sql, values).lastrowid)
+                logger.debug(f"插入记录成功，ID: {last_rowid}")
+                return last_rowid
+            except Exception as db_error:
+                logger.error(f"执行SQL时发生错误: {db_error}")
+                logger.error(f"异常堆栈: {traceback.format_exc()}")
+                raise ValueError(f"数据库插入失败: {str(db_error)}")
 
         except Exception as e:
-            import traceback
             logger.error(f"insert 方法异常: {e}")
             logger.error(f"异常堆栈: {traceback.format_exc()}")
             raise
 
+    async def insert_batched(self, table: str, data: Dict) -> int:
+        """
+        以组提交方式插入数据
+
+        与insert语义相同，但多个并发调用会合并到同一个事务中提交，
+        适合消息写入等高频小插入场景。返回时数据已提交。
+
+        Args:
+            table: 表名
+            data: 数据字典
+
+        Returns:
+            int: 新插入记录的ID
+        """
+        if not self._initialized:
+            raise RuntimeError("数据库管理器未初始化")
+
+        return await self._batch_writer.insert(table, data)
+
+    async def transaction(self, fn):
+        """
+        在写连接上以单个事务执行fn(conn)
+
+        Args:
+            fn: 接收sqlite3.Connection的同步函数，抛出异常时事务回滚
+
+        Returns:
+            Any: fn的返回值
+        """
+        if not self._initialized:
+            raise RuntimeError("数据库管理器未初始化")
+
+        return await self._pool.write(fn)
+
+    async def _prepare_insert(self, table: str, data: Dict) -> Optional[tuple]:
+        """
+        校验表名并过滤无效字段，生成INSERT语句
+
+        Returns:
+            Optional[tuple]: (sql, values)，没有有效字段时返回None
+        """
+        logger.debug(f"准备向表 {table} 插入数据: {data}")
+
+        # 验证表名并过滤字段（表结构带缓存，避免每次插入都查询sqlite_master）
+        try:
+            table_columns = await self._get_table_columns(table)
+            if not table_columns:
+                error_msg = f"表 {table} 不存在，可用的表: {await self._get_table_names()}"
+                logger.error(error_msg)
+                raise ValueError(error_msg)
+
+            # 检查数据字段是否在表中存在
+            invalid_fields = set(data.keys()) - table_columns
+            if invalid_fields:
+                logger.warning(f"字段 {invalid_fields} 在表 {table} 中不存在，将被忽略")
+                # 移除无效字段
+                for field in invalid_fields:
+                    data.pop(field, None)
+        except Exception as struct_error:
+            logger.error(f"获取表结构时出错: {struct_error}")
+            # 继续执行，不验证字段
+
+        if not data:
+            logger.error("没有有效的数据可以插入")
+            return None
+
+        keys = list(data.keys())
+        values = list(data.values())
+        placeholders = ','.join(['?' for _ in keys])
+
+        sql = f"INSERT INTO {table} ({','.join(keys)}) VALUES ({placeholders})"
+        logger.debug(f"执行SQL: {sql}, 参数: {values}")
+        return sql, values
+
+    async def _refresh_schema_cache(self, sql: str) -> None:
+        """DDL语句执行后重新加载表结构缓存"""
+        keyword = sql.lstrip()[:6].upper()
+        if keyword.startswith(('ALTER', 'CREATE', 'DROP')):
+            await self._load_table_columns()
+
+    async def _get_table_columns(self, table: str) -> set:
+        """获取表的字段名集合（带缓存），表不存在时返回空集合"""
+        if not self._table_columns:
+            await self._load_table_columns()
+        return self._table_columns.get(table, set())
+
+    async def _load_table_columns(self) -> None:
+        """一次性加载所有表的字段名到缓存"""
+        def _all_columns(conn):
+            tables = [row['name'] for row in
+                      conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+            return {
+                table: {row['name'] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+                for table in tables
+            }
+
+        self._table_columns = await self._pool.read(_all_columns)
+
     async def _get_table_names(self) -> List[str]:
         """获取所有表名"""
-        async with aiosqlite.connect(self._db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            rows = await cursor.fetchall()
+        def _table_names(conn):
+            rows = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
             return [row['name'] for row in rows]
 
+        return await self._pool.read(_table_names)
+
     async def _get_table_structure(self, table: str) -> List[Dict]:
         """获取表结构"""
-        async with aiosqlite.connect(self._db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(f"PRAGMA table_info({table})")
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        def _table_info(conn):
+            return [dict(row) for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+        return await self._pool.read(_table_info)
 
     async def update(self, table: str, data: Dict, conditions: Dict) -> int:
         """
@@ -619,11 +694,7 @@ class DBManager:
         sql = f"UPDATE {table} SET {set_clause} WHERE {where_clause}"
         params = list(data.values()) + list(conditions.values())
 
-        async with self._lock:
-            async with aiosqlite.connect(self._db_path) as db:
-                cursor = await db.execute(sql, params)
-                await db.commit()
-                return cursor.rowcount
+        return await self._pool.write(lambda conn: conn.execute(sql, params).rowcount)
 
     async def delete(self, table: str, conditions: Dict) -> int:
         """
@@ -641,17 +712,53 @@ class DBManager:
 
         where_clause = ' AND '.join([f"{k}=?" for k in conditions.keys()])
         sql = f"DELETE FROM {table} WHERE {where_clause}"
+        params = list(conditions.values())
 
-        async with self._lock:
-            async with aiosqlite.connect(self._db_path) as db:
-                cursor = await db.execute(sql, list(conditions.values()))
-                await db.commit()
-                return cursor.rowcount
+        return await self._pool.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def explain_query_plan(self, sql: str, params: tuple = None) -> List[str]:
+        """
+        获取查询的执行计划
+
+        Args:
+            sql: SQL查询
+            params: SQL参数
+
+        Returns:
+            List[str]: EXPLAIN QUERY PLAN输出的detail列
+        """
+        if not self._initialized:
+            raise RuntimeError("数据库管理器未初始化")
+
+        def _explain(conn):
+            return [row['detail'] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()]
+
+        return await self._pool.read(_explain)
+
+    async def check_query_plans(self) -> Dict[str, List[str]]:
+        """
+        检查热点查询是否退化为全表扫描或临时排序
+
+        Returns:
+            Dict[str, List[str]]: 退化的查询名称 -> 执行计划，全部正常时返回空字典
+        """
+        regressions = {}
+        for name, (sql, params) in HOT_QUERIES.items():
+            plan = await self.explain_query_plan(sql, params)
+            for detail in plan:
+                full_scan = detail.startswith('SCAN ') and ' USING ' not in detail
+                if full_scan or 'TEMP B-TREE' in detail:
+                    logger.warning(f"热点查询 {name} 执行计划退化: {plan}")
+                    regressions[name] = plan
+                    break
+        return regressions
 
     def get_connection(self):
         """
         获取数据库连接（同步方法）
 
+        返回的是独立的新连接，调用方负责关闭；异步代码应使用连接池方法。
+
         Returns:
             sqlite3.Connection: 数据库连接
         """
@@ -668,7 +775,12 @@ class DBManager:
         if not self._initialized:
             return
 
+        await self._batch_writer.flush()
         self._initialized = False
+        if self._pool:
+            self._pool.close()
+            self._pool = None
+        self._table_columns.clear()
         logger.info("数据库连接已关闭")
 
 # 创建全局实例
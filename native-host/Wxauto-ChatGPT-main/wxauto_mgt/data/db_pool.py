@@ -0,0 +1,189 @@
+"""
+SQLite连接池模块
+
+为DBManager提供长连接池：一个专用写连接加N个只读连接，全部运行在WAL模式下。
+每个连接固定在自己的工作线程中，协程通过run_in_executor把整个操作单元
+（执行+提交）投递到对应线程，因此写操作天然串行，且不依赖特定事件循环，
+Qt主循环和Web服务线程的事件循环可以共用同一个连接池。
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 每个连接都会执行的PRAGMA
+CONNECTION_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456,     # 256MB
+    'cache_size': -16000,       # 负数表示KB，约16MB
+    'busy_timeout': 5000,
+    'foreign_keys': 'OFF',
+}
+
+# 每个连接缓存的预编译语句数量（sqlite3模块按SQL文本复用prepared statement）
+STATEMENT_CACHE_SIZE = 256
+
+
+class SQLitePool:
+    """SQLite连接池，一个写连接 + 多个读连接"""
+
+    def __init__(self, db_path: str, readers: int = 4, pragmas: Optional[Dict[str, Any]] = None):
+        """
+        初始化连接池
+
+        Args:
+            db_path: 数据库文件路径
+            readers: 只读连接数量
+            pragmas: 覆盖默认PRAGMA配置
+        """
+        self._db_path = db_path
+        self._readers = max(1, readers)
+        self._pragmas = dict(CONNECTION_PRAGMAS)
+        if pragmas:
+            self._pragmas.update(pragmas)
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._reader_pool: Optional[ThreadPoolExecutor] = None
+        self._closed = True
+
+    @property
+    def db_path(self) -> str:
+        return self._db_path
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def open(self) -> None:
+        """创建写线程和读线程池，连接在各线程首次使用时建立"""
+        if not self._closed:
+            return
+
+        # 先用一个临时连接切换到WAL模式（journal_mode是持久化到文件的）
+        conn = sqlite3.connect(self._db_path)
+        try:
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if str(mode).lower() != 'wal':
+                logger.warning(f"数据库未能切换到WAL模式，当前模式: {mode}")
+        finally:
+            conn.close()
+
+        self._writer = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='db-writer',
+            initializer=self._open_thread_connection,
+            initargs=(False,)
+        )
+        self._reader_pool = ThreadPoolExecutor(
+            max_workers=self._readers,
+            thread_name_prefix='db-reader',
+            initializer=self._open_thread_connection,
+            initargs=(True,)
+        )
+        self._closed = False
+        logger.info(f"数据库连接池已启动: 1个写连接, {self._readers}个读连接")
+
+    def _open_thread_connection(self, read_only: bool) -> None:
+        """在工作线程中建立该线程专属的连接"""
+        conn = sqlite3.connect(
+            self._db_path,
+            timeout=30,
+            isolation_level=None,           # 由连接池显式控制事务
+            check_same_thread=False,        # 关闭时由主线程统一close
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self._pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            conn.execute("PRAGMA query_only=1")
+
+        self._local.conn = conn
+        with self._connections_lock:
+            self._connections.append(conn)
+
+    def _run_write(self, fn: Callable[[sqlite3.Connection], Any], transaction: bool = True) -> Any:
+        """在写线程中以单个事务执行fn"""
+        conn = self._local.conn
+        if not transaction:
+            return fn(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _run_read(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """在读线程中执行fn"""
+        return fn(self._local.conn)
+
+    async def write(self, fn: Callable[[sqlite3.Connection], Any], transaction: bool = True) -> Any:
+        """
+        在写连接上以单个事务执行fn(conn)
+
+        Args:
+            fn: 接收sqlite3.Connection的同步函数，抛出异常时事务回滚
+            transaction: 为False时不开启事务（用于PRAGMA、VACUUM等不能在事务中执行的语句）
+
+        Returns:
+            Any: fn的返回值
+        """
+        if self._closed:
+            raise RuntimeError("数据库连接池已关闭")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._run_write, fn, transaction)
+
+    async def read(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        在任一只读连接上执行fn(conn)
+
+        Args:
+            fn: 接收sqlite3.Connection的同步函数
+
+        Returns:
+            Any: fn的返回值
+        """
+        if self._closed:
+            raise RuntimeError("数据库连接池已关闭")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, self._run_read, fn)
+
+    def close(self) -> None:
+        """关闭所有工作线程和连接（同步方法，可在任意线程调用）"""
+        if self._closed:
+            return
+        self._closed = True
+
+        # 关闭前让SQLite根据本次运行的查询更新统计信息
+        try:
+            self._writer.submit(lambda: self._local.conn.execute("PRAGMA optimize")).result()
+        except Exception as e:
+            logger.warning(f"执行PRAGMA optimize时出错: {e}")
+
+        for executor in (self._writer, self._reader_pool):
+            if executor:
+                executor.shutdown(wait=True)
+        self._writer = None
+        self._reader_pool = None
+
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.warning(f"关闭数据库连接时出错: {e}")
+
+        logger.info("数据库连接池已关闭")
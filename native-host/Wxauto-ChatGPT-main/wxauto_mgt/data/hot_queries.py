@@ -0,0 +1,72 @@
+"""
+热点查询定义模块
+
+集中定义messages表上的高频查询及其依赖的索引。业务代码直接引用这里的SQL，
+DBManager.check_query_plans()用同一份SQL执行EXPLAIN QUERY PLAN，
+保证检查的就是线上实际执行的语句。
+"""
+
+# 投递服务：按实例获取待投递消息（包括投递失败(2)和正在投递(3)的消息）
+UNPROCESSED_MESSAGES_SQL = """
+SELECT * FROM messages
+WHERE instance_id = ? AND processed = 0 AND delivery_status IN (0, 2, 3)
+ORDER BY create_time ASC
+LIMIT ?
+"""
+
+# 投递服务独立轮询：不区分实例获取待投递消息
+PENDING_MESSAGES_SQL = """
+SELECT * FROM messages
+WHERE processed = 0 AND delivery_status IN (0, 2, 3)
+ORDER BY create_time ASC
+LIMIT ?
+"""
+
+# OpenAI平台：加载某个会话在该平台上、已总结部分之后的历史对话。
+# create_time只精确到秒，同一秒内可能有多条消息，因此按(create_time, id)比较总结水位
+HISTORY_MESSAGES_SQL = """
+SELECT id, content, reply_content, create_time
+FROM messages
+WHERE instance_id = ? AND chat_name = ? AND platform_id = ? AND reply_status = 1 AND (create_time, id) > (?, ?)
+ORDER BY create_time DESC, id DESC
+LIMIT ?
+"""
+
+# 监听器：最近5分钟内的回复内容，用于识别自己发出的回复
+RECENT_REPLIES_SQL = """
+SELECT reply_content FROM messages
+WHERE reply_status = 1 AND reply_time > ?
+ORDER BY reply_time DESC LIMIT 10
+"""
+
+# 监听器/投递服务：保存后按消息ID取回完整记录
+MESSAGE_BY_ID_SQL = "SELECT * FROM messages WHERE message_id = ?"
+
+# 消息发送器：会话最近一条消息所属的平台
+LAST_CHAT_PLATFORM_SQL = (
+    "SELECT platform_id FROM messages WHERE instance_id = ? AND chat_name = ? "
+    "ORDER BY create_time DESC LIMIT 1"
+)
+
+# 热点查询依赖的索引，部分索引的WHERE条件必须与查询条件保持一致
+MESSAGE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_messages_unprocessed ON messages(instance_id, processed, create_time) "
+    "WHERE delivery_status IN (0, 2, 3)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_pending ON messages(processed, create_time) "
+    "WHERE delivery_status IN (0, 2, 3)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_history ON messages(instance_id, chat_name, platform_id, create_time) "
+    "WHERE reply_status = 1",
+    "CREATE INDEX IF NOT EXISTS idx_messages_recent_replies ON messages(reply_status, reply_time)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_chat_time ON messages(instance_id, chat_name, create_time)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages(message_id)",
+]
+
+# 名称 -> (SQL, 示例参数)，用于执行计划检查
+HOT_QUERIES = {
+    'unprocessed_messages': (UNPROCESSED_MESSAGES_SQL, ('instance', 10)),
+    'pending_messages': (PENDING_MESSAGES_SQL, (10,)),
+    'history_messages': (HISTORY_MESSAGES_SQL, ('instance', 'chat', 'platform', 0, 0, 10)),
+    'recent_replies': (RECENT_REPLIES_SQL, (0,)),
+    'message_by_id': (MESSAGE_BY_ID_SQL, ('message',)),
+    'last_chat_platform': (LAST_CHAT_PLATFORM_SQL, ('instance', 'chat')),
+}
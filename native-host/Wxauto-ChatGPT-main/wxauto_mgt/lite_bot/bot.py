@@ -3,18 +3,21 @@ from __future__ import annotations
 import hashlib
 import logging
 import re
+import threading
 import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator
 
+from wxauto_mgt.lite_bot.cache import TTLCache
 from wxauto_mgt.lite_bot.config import BotConfig
 from wxauto_mgt.lite_bot.llm_client import LlmClient
 from wxauto_mgt.lite_bot.models import IncomingMessage, SessionInfo
 from wxauto_mgt.lite_bot.rate_limit import CooldownManager, DedupeCache, FailureTracker
 from wxauto_mgt.lite_bot.storage import SessionStore
 from wxauto_mgt.lite_bot.token_utils import (
+    current_tokenizer,
+    estimate_message_tokens,
     estimate_messages_tokens,
-    estimate_tokens,
     truncate_text_to_tokens,
 )
 
@@ -26,15 +29,35 @@ class WxAutoBot:
         self.config = config
         base_dir = Path(config.storage.base_dir)
         self.store = SessionStore(base_dir)
-        self.client = LlmClient(config.api)
-        self.dedupe = DedupeCache(config.dedupe.window_seconds)
+        self.client = LlmClient(config.api, pool_size=config.pipeline.workers)
+        self.dedupe = DedupeCache(config.dedupe.window_seconds, config.dedupe.max_entries)
         self.session_cooldown = CooldownManager(config.rate_limit.session_cooldown_seconds)
         self.user_cooldown = CooldownManager(config.rate_limit.user_cooldown_seconds)
         self.failure_tracker = FailureTracker(
             config.failure.max_consecutive_failures,
             config.failure.cooldown_seconds,
         )
-        self.vision_cache: dict[str, str] = {}
+        self.vision_cache = TTLCache(
+            config.vision.cache_ttl_seconds,
+            config.vision.cache_max_entries,
+            lru=True,
+            persist_path=base_dir / "vision_cache.json" if config.vision.cache_persist else None,
+        )
+        # 去重、冷却和失败计数在各会话的处理线程间共享
+        self._state_lock = threading.Lock()
+
+    def close(self) -> None:
+        self.vision_cache.save()
+        self.client.close()
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        return {
+            "dedupe": self.dedupe.cache.stats(),
+            "session_cooldown": self.session_cooldown.last_hit.stats(),
+            "user_cooldown": self.user_cooldown.last_hit.stats(),
+            "failures": self.failure_tracker.failures.stats(),
+            "vision": self.vision_cache.stats(),
+        }
 
     def handle_message(self, msg: IncomingMessage, adapter: Any) -> None:
         if self._is_self_message(msg):
@@ -43,13 +66,14 @@ class WxAutoBot:
 
         session = self._resolve_session(msg)
         unique_key = msg.message_id or self._hash_content(msg)
-        if self.dedupe.seen_recently(unique_key):
-            logger.info("dedupe hit: %s", unique_key)
-            return
+        with self._state_lock:
+            if self.dedupe.seen_recently(unique_key):
+                logger.info("dedupe hit: %s", unique_key)
+                return
 
-        if self.failure_tracker.is_blocked(session.session_id):
-            logger.warning("session blocked due to failures: %s", session.session_id)
-            return
+            if self.failure_tracker.is_blocked(session.session_id):
+                logger.warning("session blocked due to failures: %s", session.session_id)
+                return
 
         should_reply = self._should_trigger(msg)
         logger.info(
@@ -74,12 +98,13 @@ class WxAutoBot:
         if not should_reply:
             return
 
-        if self.session_cooldown.in_cooldown(session.session_id):
-            logger.info("session cooldown: %s", session.session_id)
-            return
-        if self.user_cooldown.in_cooldown(msg.sender_id):
-            logger.info("user cooldown: %s", msg.sender_id)
-            return
+        with self._state_lock:
+            if self.session_cooldown.in_cooldown(session.session_id):
+                logger.info("session cooldown: %s", session.session_id)
+                return
+            if self.user_cooldown.in_cooldown(msg.sender_id):
+                logger.info("user cooldown: %s", msg.sender_id)
+                return
 
         response_text = self._generate_reply(msg, session, image_meta)
         if response_text:
@@ -91,14 +116,20 @@ class WxAutoBot:
             return False
         return msg.sender_id == self.config.self_user_id
 
-    def _resolve_session(self, msg: IncomingMessage) -> SessionInfo:
+    def session_key(self, msg: IncomingMessage) -> str:
+        scope, session_key = self._session_scope_key(msg)
+        return f"{scope}:{session_key}"
+
+    def _session_scope_key(self, msg: IncomingMessage) -> tuple[str, str]:
         scope = "group" if msg.is_group else "private"
         if msg.conversation_id:
-            session_key = msg.conversation_id
-        elif msg.is_group:
-            session_key = msg.group_id or msg.group_name or msg.sender_id
-        else:
-            session_key = msg.sender_id
+            return scope, msg.conversation_id
+        if msg.is_group:
+            return scope, msg.group_id or msg.group_name or msg.sender_id
+        return scope, msg.sender_id
+
+    def _resolve_session(self, msg: IncomingMessage) -> SessionInfo:
+        scope, session_key = self._session_scope_key(msg)
         display_name = msg.group_name if msg.is_group else msg.sender_name
         session_id = self.store.resolve_session(scope, session_key, display_name)
         return SessionInfo(
@@ -149,7 +180,7 @@ class WxAutoBot:
                 "size": image_meta.size,
                 "mime": image_meta.mime_type,
             }
-        self.store.append_history(session.scope, session.session_id, record)
+        self._store_record(session, record)
 
     def _append_reply(self, session: SessionInfo, content: str) -> None:
         record = {
@@ -161,6 +192,12 @@ class WxAutoBot:
             "message_id": hashlib.sha1(f"reply:{content}:{time.time()}".encode("utf-8")).hexdigest(),
             "session_key": session.session_key,
         }
+        self._store_record(session, record)
+
+    def _store_record(self, session: SessionInfo, record: dict[str, Any]) -> None:
+        # 保存记录转换成上下文消息后的token数，组装上下文时不再重复计数
+        record["tokens"] = estimate_message_tokens(self._record_to_message(record))
+        record["tokenizer"] = current_tokenizer()
         self.store.append_history(session.scope, session.session_id, record)
 
     def _generate_reply(
@@ -176,11 +213,6 @@ class WxAutoBot:
             logger.info("image ignored by config")
             return ""
 
-        history = self.store.load_history(session.scope, session.session_id)
-        if msg.message_id:
-            history = [record for record in history if record.get("message_id") != msg.message_id]
-        history_messages = self._history_to_messages(history)
-
         system_prompt = self.config.persona.prompt_for_scope(session.scope)
         system_message = {"role": "system", "content": system_prompt}
 
@@ -192,31 +224,33 @@ class WxAutoBot:
             logger.warning("token budget too small")
             return self.config.failure.fallback_reply
 
-        if image_meta and image_meta.sha256 in self.vision_cache:
-            cached = self.vision_cache[image_meta.sha256]
+        cached = self.vision_cache.get(image_meta.sha256) if image_meta else None
+        if cached is not None:
             logger.info("vision cache hit: %s", image_meta.sha256)
             return truncate_text_to_tokens(cached, response_tokens)
 
         messages = self._trim_context(
             [system_message],
-            history_messages,
+            self._iter_history_messages(session, msg.message_id),
             latest_user,
             budget,
         )
 
         try:
             reply = self.client.send(messages)
-            self.failure_tracker.register_success(session.session_id)
+            with self._state_lock:
+                self.failure_tracker.register_success(session.session_id)
         except Exception as exc:  # noqa: BLE001
             logger.exception("llm call failed: %s", exc)
-            self.failure_tracker.register_failure(session.session_id)
+            with self._state_lock:
+                self.failure_tracker.register_failure(session.session_id)
             return self.config.failure.fallback_reply
 
         reply = reply.strip()
         if not reply:
             return ""
         if image_meta:
-            self.vision_cache[image_meta.sha256] = reply
+            self.vision_cache.set(image_meta.sha256, reply)
         reply = truncate_text_to_tokens(reply, response_tokens)
         return reply
 
@@ -230,18 +264,32 @@ class WxAutoBot:
             return self.config.vision.enable_group and msg.is_at
         return self.config.vision.enable_private
 
-    def _history_to_messages(self, history: list[dict[str, Any]]) -> list[dict[str, str]]:
-        messages: list[dict[str, str]] = []
-        for record in history:
-            role = "assistant" if record.get("direction") == "sent" else "user"
-            if record.get("type") == "image":
-                content = f"[图片] hash={record.get('image', {}).get('sha256', '')}"
+    def _iter_history_messages(
+        self,
+        session: SessionInfo,
+        exclude_message_id: str | None,
+    ) -> Iterator[tuple[dict[str, str], int]]:
+        # 从最新一条开始惰性读取，_trim_context取够预算后即停止，不会读取整个会话
+        tokenizer = current_tokenizer()
+        for record in self.store.iter_history_reversed(session.scope, session.session_id):
+            if exclude_message_id and record.get("message_id") == exclude_message_id:
+                continue
+            message = self._record_to_message(record)
+            if record.get("tokenizer") == tokenizer and isinstance(record.get("tokens"), int):
+                tokens = record["tokens"]
             else:
-                content = record.get("content") or ""
-            if record.get("sender") and role == "user":
-                content = f"{record['sender']}: {content}"
-            messages.append({"role": role, "content": content})
-        return messages
+                tokens = estimate_message_tokens(message)
+            yield message, tokens
+
+    def _record_to_message(self, record: dict[str, Any]) -> dict[str, str]:
+        role = "assistant" if record.get("direction") == "sent" else "user"
+        if record.get("type") == "image":
+            content = f"[图片] hash={record.get('image', {}).get('sha256', '')}"
+        else:
+            content = record.get("content") or ""
+        if record.get("sender") and role == "user":
+            content = f"{record['sender']}: {content}"
+        return {"role": role, "content": content}
 
     def _build_latest_message(self, msg: IncomingMessage, image_meta: Any) -> list[dict[str, Any]]:
         if msg.msg_type == "image" and msg.image_bytes and msg.image_mime:
@@ -262,10 +310,11 @@ class WxAutoBot:
     def _trim_context(
         self,
         system_messages: list[dict[str, Any]],
-        history_messages: list[dict[str, Any]],
+        history: Iterable[tuple[dict[str, Any], int]],
         latest_messages: list[dict[str, Any]],
         budget: int,
     ) -> list[dict[str, Any]]:
+        # history按从新到旧的顺序给出(消息, token数)，累加到超出预算为止
         system_tokens = estimate_messages_tokens(system_messages)
         latest_tokens = estimate_messages_tokens(latest_messages)
         if latest_tokens > self.config.limits.max_single_message_tokens:
@@ -280,13 +329,11 @@ class WxAutoBot:
 
         remaining = budget - total
         trimmed_history: list[dict[str, Any]] = []
-        for record in reversed(history_messages):
-            record_tokens = estimate_tokens(record.get("content", ""))
-            if record_tokens <= remaining:
-                trimmed_history.append(record)
-                remaining -= record_tokens
-            else:
+        for message, tokens in history:
+            if tokens > remaining:
                 break
+            trimmed_history.append(message)
+            remaining -= tokens
 
         trimmed_history.reverse()
         return [*system_messages, *trimmed_history, *latest_messages]
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger("wxauto_lite_bot")
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    带过期时间和容量上限的有序缓存，线程安全。
+
+    条目按写入顺序排列，所有条目的有效期相同，因此最早写入的条目也最先过期，
+    写入时只需从头部清理过期条目，均摊O(1)。lru=True时读取会把条目移到尾部，
+    此时头部之后可能残留过期条目，它们在被读取或因容量淘汰时清除。
+    设置persist_path时启动时从文件恢复，写入后按persist_interval定期保存。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float | None = None,
+        max_entries: int = 10000,
+        lru: bool = False,
+        persist_path: Path | None = None,
+        persist_interval: float = 60.0,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.lru = lru
+        self.persist_path = persist_path
+        self.persist_interval = persist_interval
+        self._data: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if persist_path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            value = self._get(key, time.time())
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._set(key, value, time.time())
+        self._maybe_save()
+
+    def add(self, key: str, value: Any = True) -> bool:
+        """仅在key不存在（或已过期）时写入，返回是否写入"""
+        with self._lock:
+            now = time.time()
+            if self._get(key, now) is not _MISSING:
+                self.hits += 1
+                return False
+            self.misses += 1
+            self._set(key, value, now)
+        self._maybe_save()
+        return True
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self._dirty = True
+            return entry[1]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _get(self, key: str, now: float) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= now:
+            del self._data[key]
+            self.expirations += 1
+            self._dirty = True
+            return _MISSING
+        if self.lru:
+            self._data.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value: Any, now: float) -> None:
+        self._purge_expired(now)
+        # 先删除再插入，使条目移动到尾部，保持写入顺序即过期顺序
+        self._data.pop(key, None)
+        expires_at = now + self.ttl_seconds if self.ttl_seconds is not None else None
+        self._data[key] = (expires_at, value)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        self._dirty = True
+
+    def _purge_expired(self, now: float) -> None:
+        while self._data:
+            expires_at, _ = next(iter(self._data.values()))
+            if expires_at is None or expires_at > now:
+                break
+            self._data.popitem(last=False)
+            self.expirations += 1
+
+    def _maybe_save(self) -> None:
+        if self.persist_path and time.time() - self._saved_at >= self.persist_interval:
+            self.save()
+
+    def save(self) -> None:
+        if not self.persist_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [[key, expires_at, value] for key, (expires_at, value) in self._data.items()]
+            self._dirty = False
+            self._saved_at = time.time()
+        try:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.persist_path.with_name(f"{self.persist_path.name}.tmp")
+            tmp_path.write_text(json.dumps({"entries": entries}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.persist_path)
+        except OSError as exc:
+            logger.warning("cache save failed %s: %s", self.persist_path, exc)
+
+    def _load(self) -> None:
+        if not self.persist_path.exists():
+            return
+        try:
+            data = json.loads(self.persist_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as exc:
+            logger.warning("cache load failed %s: %s", self.persist_path, exc)
+            return
+        now = time.time()
+        for key, expires_at, value in data.get("entries", []):
+            if expires_at is not None and expires_at <= now:
+                continue
+            self._data[key] = (expires_at, value)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
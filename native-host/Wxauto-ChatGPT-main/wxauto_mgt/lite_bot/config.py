@@ -57,9 +57,15 @@ class StorageConfig:
     base_dir: str = "data/wxauto_lite_bot"
 
 
+@dataclass
+class PipelineConfig:
+    workers: int = 4
+
+
 @dataclass
 class DedupeConfig:
     window_seconds: int = 60
+    max_entries: int = 10000
 
 
 @dataclass
@@ -79,6 +85,9 @@ class FailureConfig:
 class VisionConfig:
     enable_private: bool = True
     enable_group: bool = True
+    cache_max_entries: int = 500
+    cache_ttl_seconds: int = 7 * 24 * 3600
+    cache_persist: bool = True
 
 
 @dataclass
@@ -94,6 +103,7 @@ class BotConfig:
     api: ApiConfig = field(default_factory=ApiConfig)
     limits: LimitsConfig = field(default_factory=LimitsConfig)
     storage: StorageConfig = field(default_factory=StorageConfig)
+    pipeline: PipelineConfig = field(default_factory=PipelineConfig)
     dedupe: DedupeConfig = field(default_factory=DedupeConfig)
     rate_limit: RateLimitConfig = field(default_factory=RateLimitConfig)
     failure: FailureConfig = field(default_factory=FailureConfig)
@@ -118,6 +128,7 @@ def load_config(path: str | None = None) -> BotConfig:
         api=ApiConfig(**data.get("api", {})),
         limits=LimitsConfig(**data.get("limits", {})),
         storage=StorageConfig(**data.get("storage", {})),
+        pipeline=PipelineConfig(**data.get("pipeline", {})),
         dedupe=DedupeConfig(**data.get("dedupe", {})),
         rate_limit=RateLimitConfig(**data.get("rate_limit", {})),
         failure=FailureConfig(**data.get("failure", {})),
@@ -3,16 +3,25 @@ from __future__ import annotations
 import base64
 import json
 import os
-from typing import Any
+from typing import Any, Callable, Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from wxauto_mgt.lite_bot.config import ApiConfig
 
 
 class LlmClient:
-    def __init__(self, config: ApiConfig) -> None:
+    def __init__(self, config: ApiConfig, pool_size: int = 4) -> None:
         self.config = config
+        # 所有处理线程共用的长连接池
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
 
     def _headers(self) -> dict[str, str]:
         api_key = os.getenv(self.config.api_key_env, "")
@@ -39,24 +48,38 @@ class LlmClient:
         payload.update(self._extra_params())
         return payload
 
-    def send(self, messages: list[dict[str, Any]]) -> str:
+    def send(
+        self,
+        messages: list[dict[str, Any]],
+        on_delta: Callable[[str], None] | None = None,
+    ) -> str:
         payload = self._build_payload(messages)
-        response = requests.post(
+        # 使用with确保流式响应在[DONE]提前结束时连接也能归还连接池
+        with self.session.post(
             self.config.endpoint,
             headers=self._headers(),
             json=payload,
             timeout=self.config.timeout_seconds,
             stream=self.config.stream,
-        )
-        response.raise_for_status()
+        ) as response:
+            response.raise_for_status()
+
+            if not self.config.stream:
+                data = response.json()
+                return self._extract_content(data)
 
-        if not self.config.stream:
-            data = response.json()
-            return self._extract_content(data)
+            chunks: list[str] = []
+            for delta in self._iter_stream(response):
+                chunks.append(delta)
+                if on_delta:
+                    on_delta(delta)
+            return "".join(chunks)
 
-        chunks: list[str] = []
+    def _iter_stream(self, response: requests.Response) -> Iterator[str]:
+        # text/event-stream通常不带charset，此时iter_lines会返回bytes
+        response.encoding = response.encoding or "utf-8"
         for line in response.iter_lines(decode_unicode=True):
-            if not line:
+            if not line or line.startswith(":"):
                 continue
             if line.startswith("data: "):
                 line = line[6:]
@@ -64,9 +87,8 @@ class LlmClient:
                 break
             data = json.loads(line)
             delta = data.get("choices", [{}])[0].get("delta", {})
-            if "content" in delta:
-                chunks.append(delta["content"])
-        return "".join(chunks)
+            if delta.get("content"):
+                yield delta["content"]
 
     def _extract_content(self, data: dict[str, Any]) -> str:
         choices = data.get("choices", [])
@@ -5,6 +5,7 @@ import time
 
 from wxauto_mgt.lite_bot.bot import WxAutoBot
 from wxauto_mgt.lite_bot.config import load_config
+from wxauto_mgt.lite_bot.pipeline import SessionPipeline
 from wxauto_mgt.lite_bot.wxauto_adapter import WxautoAdapter
 
 
@@ -21,11 +22,16 @@ def main() -> None:
     wx = WeChat()
     adapter = WxautoAdapter(wx)
 
-    while True:
-        for raw in adapter.poll_messages():
-            message = adapter.parse_raw(raw)
-            bot.handle_message(message, adapter)
-        time.sleep(0.5)
+    pipeline = SessionPipeline(config.pipeline.workers)
+    try:
+        while True:
+            for raw in adapter.poll_messages():
+                message = adapter.parse_raw(raw)
+                pipeline.submit(bot.session_key(message), bot.handle_message, message, adapter)
+            time.sleep(0.5)
+    finally:
+        pipeline.shutdown()
+        bot.close()
 
 
 if __name__ == "__main__":
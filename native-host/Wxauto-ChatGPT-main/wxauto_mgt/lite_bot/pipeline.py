@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import functools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger("wxauto_lite_bot")
+
+
+class SessionPipeline:
+    """
+    按会话分发消息到线程池处理。
+
+    同一会话的消息严格按提交顺序逐条处理，不同会话之间并行；
+    每条消息处理完后，该会话的下一条重新排到线程池队尾，避免繁忙会话长期占用线程。
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="lite_bot")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending: dict[str, deque[Callable[[], Any]]] = {}
+
+    def submit(self, key: str, func: Callable[..., Any], *args: Any) -> None:
+        task = functools.partial(func, *args)
+        with self._lock:
+            queue = self._pending.get(key)
+            if queue is not None:
+                queue.append(task)
+                return
+            self._pending[key] = deque()
+        self._executor.submit(self._run, key, task)
+
+    def _run(self, key: str, task: Callable[[], Any]) -> None:
+        try:
+            task()
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("pipeline task failed session=%s: %s", key, exc)
+        with self._lock:
+            queue = self._pending[key]
+            if not queue:
+                del self._pending[key]
+                if not self._pending:
+                    self._idle.notify_all()
+                return
+            task = queue.popleft()
+        try:
+            self._executor.submit(self._run, key, task)
+        except RuntimeError:
+            logger.warning("pipeline stopped, dropping queued messages session=%s", key)
+            with self._lock:
+                self._pending.pop(key, None)
+                if not self._pending:
+                    self._idle.notify_all()
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(queue) + 1 for queue in self._pending.values())
+
+    def join(self) -> None:
+        with self._idle:
+            while self._pending:
+                self._idle.wait()
+
+    def shutdown(self, wait: bool = True) -> None:
+        if wait:
+            self.join()
+        self._executor.shutdown(wait=wait)
@@ -1,59 +1,49 @@
 from __future__ import annotations
 
-import time
-from collections import defaultdict, deque
+from collections import deque
+
+from wxauto_mgt.lite_bot.cache import TTLCache
+
+DEFAULT_MAX_ENTRIES = 10000
 
 
 class DedupeCache:
-    def __init__(self, window_seconds: int) -> None:
+    def __init__(self, window_seconds: int, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
         self.window_seconds = window_seconds
-        self.cache: dict[str, float] = {}
+        self.cache = TTLCache(window_seconds, max_entries)
 
     def seen_recently(self, key: str) -> bool:
-        now = time.time()
-        expired = [k for k, ts in self.cache.items() if now - ts > self.window_seconds]
-        for item in expired:
-            self.cache.pop(item, None)
-        if key in self.cache:
-            return True
-        self.cache[key] = now
-        return False
+        return not self.cache.add(key)
 
 
 class CooldownManager:
-    def __init__(self, cooldown_seconds: int) -> None:
+    def __init__(self, cooldown_seconds: int, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
         self.cooldown_seconds = cooldown_seconds
-        self.last_hit: dict[str, float] = defaultdict(float)
+        self.last_hit = TTLCache(cooldown_seconds, max_entries)
 
     def in_cooldown(self, key: str) -> bool:
-        now = time.time()
-        if now - self.last_hit.get(key, 0.0) < self.cooldown_seconds:
-            return True
-        self.last_hit[key] = now
-        return False
+        return not self.last_hit.add(key)
 
 
 class FailureTracker:
-    def __init__(self, max_failures: int, cooldown_seconds: int) -> None:
+    def __init__(self, max_failures: int, cooldown_seconds: int, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
         self.max_failures = max_failures
         self.cooldown_seconds = cooldown_seconds
-        self.failures: dict[str, int] = defaultdict(int)
-        self.cooldowns: dict[str, float] = defaultdict(float)
+        self.failures = TTLCache(max_entries=max_entries, lru=True)
+        self.cooldowns = TTLCache(cooldown_seconds, max_entries)
 
     def register_failure(self, key: str) -> None:
-        self.failures[key] += 1
-        if self.failures[key] >= self.max_failures:
-            self.cooldowns[key] = time.time() + self.cooldown_seconds
+        failures = self.failures.get(key, 0) + 1
+        self.failures.set(key, failures)
+        if failures >= self.max_failures:
+            self.cooldowns.set(key, True)
 
     def register_success(self, key: str) -> None:
-        self.failures[key] = 0
-        self.cooldowns.pop(key, None)
+        self.failures.pop(key)
+        self.cooldowns.pop(key)
 
     def is_blocked(self, key: str) -> bool:
-        until = self.cooldowns.get(key, 0.0)
-        if until and time.time() < until:
-            return True
-        return False
+        return key in self.cooldowns
 
 
 class RollingWindow:
@@ -3,9 +3,16 @@ from __future__ import annotations
 import hashlib
 import json
 import os
+import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
+
+INDEX_FILENAME = "session_index.json"
+INDEX_JOURNAL_FILENAME = "session_index.journal"
+INDEX_COMPACT_THRESHOLD = 1000
+HISTORY_FILENAME = "history.jsonl"
+TAIL_BLOCK_SIZE = 64 * 1024
 
 
 @dataclass
@@ -17,37 +24,85 @@ class StoredImage:
 
 
 class SessionIndex:
-    def __init__(self, base_dir: Path) -> None:
+    """
+    会话索引。
+
+    新会话追加写入日志文件，每累计compact_threshold条才合并进快照。
+    会话ID由key推导，崩溃时丢失日志中写了一半的最后一行，下次收到消息时会生成相同的ID。
+    """
+
+    def __init__(self, base_dir: Path, compact_threshold: int = INDEX_COMPACT_THRESHOLD) -> None:
         self.base_dir = base_dir
-        self.index_path = base_dir / "session_index.json"
+        self.index_path = base_dir / INDEX_FILENAME
+        self.journal_path = base_dir / INDEX_JOURNAL_FILENAME
+        self.compact_threshold = compact_threshold
         self.data: dict[str, Any] = {"version": 1, "sessions": {}}
+        self._journal_entries = 0
+        self._lock = threading.Lock()
         self._load()
 
     def _load(self) -> None:
-        if not self.index_path.exists():
+        if self.index_path.exists():
+            self.data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        sessions = self.data.setdefault("sessions", {})
+        if not self.journal_path.exists():
             return
-        self.data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        line = b""
+        with self.journal_path.open("rb") as handle:
+            for line in handle:
+                entry = _parse_json_line(line)
+                if entry is None:
+                    continue
+                sessions[f"{entry['scope']}:{entry['key']}"] = entry
+                self._journal_entries += 1
+        # 最后一行不完整时，下一条追加的记录会和它连在一起，因此立即合并
+        if self._journal_entries >= self.compact_threshold or not line.endswith(b"\n"):
+            self.save()
 
     def save(self) -> None:
+        with self._lock:
+            self._write_snapshot()
+
+    def _write_snapshot(self) -> None:
         self.index_path.parent.mkdir(parents=True, exist_ok=True)
-        self.index_path.write_text(
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.tmp")
+        tmp_path.write_text(
             json.dumps(self.data, ensure_ascii=False, indent=2),
             encoding="utf-8",
         )
+        os.replace(tmp_path, self.index_path)
+        # 重放已在快照中的记录没有副作用，删除日志前崩溃无需特殊处理
+        if self.journal_path.exists():
+            self.journal_path.unlink()
+        self._journal_entries = 0
+
+    def _append_journal(self, entry: dict[str, Any]) -> None:
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.journal_path.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(entry, ensure_ascii=False))
+            handle.write("\n")
+        self._journal_entries += 1
 
     def get_or_create(self, scope: str, key: str, display_name: str) -> str:
-        sessions = self.data.setdefault("sessions", {})
         session_key = f"{scope}:{key}"
-        if session_key in sessions:
-            return sessions[session_key]["id"]
-        session_id = hashlib.sha1(session_key.encode("utf-8")).hexdigest()[:16]
-        sessions[session_key] = {
-            "id": session_id,
-            "display_name": display_name,
-            "scope": scope,
-            "key": key,
-        }
-        self.save()
+        entry = self.data["sessions"].get(session_key)
+        if entry is not None:
+            return entry["id"]
+        with self._lock:
+            sessions = self.data["sessions"]
+            if session_key in sessions:
+                return sessions[session_key]["id"]
+            session_id = hashlib.sha1(session_key.encode("utf-8")).hexdigest()[:16]
+            entry = {
+                "id": session_id,
+                "display_name": display_name,
+                "scope": scope,
+                "key": key,
+            }
+            self._append_journal(entry)
+            sessions[session_key] = entry
+            if self._journal_entries >= self.compact_threshold:
+                self._write_snapshot()
         return session_id
 
 
@@ -62,30 +117,66 @@ class SessionStore:
     def _session_dir(self, scope: str, session_id: str) -> Path:
         return self.base_dir / scope / session_id
 
+    def _history_path(self, scope: str, session_id: str) -> Path:
+        return self._session_dir(scope, session_id) / HISTORY_FILENAME
+
     def append_history(self, scope: str, session_id: str, record: dict[str, Any]) -> None:
         session_dir = self._session_dir(scope, session_id)
         session_dir.mkdir(parents=True, exist_ok=True)
-        history_path = session_dir / "history.jsonl"
+        history_path = session_dir / HISTORY_FILENAME
         with history_path.open("a", encoding="utf-8") as handle:
             handle.write(json.dumps(record, ensure_ascii=False))
             handle.write("\n")
 
-    def load_history(self, scope: str, session_id: str) -> list[dict[str, Any]]:
-        history_path = self._session_dir(scope, session_id) / "history.jsonl"
+    def load_history(self, scope: str, session_id: str, limit: int | None = None) -> list[dict[str, Any]]:
+        if limit is not None:
+            return self.tail_history(scope, session_id, limit)
+        history_path = self._history_path(scope, session_id)
         if not history_path.exists():
             return []
         records: list[dict[str, Any]] = []
-        with history_path.open("r", encoding="utf-8") as handle:
+        with history_path.open("rb") as handle:
             for line in handle:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    records.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue
+                record = _parse_json_line(line)
+                if record is not None:
+                    records.append(record)
+        return records
+
+    def tail_history(self, scope: str, session_id: str, limit: int) -> list[dict[str, Any]]:
+        records: list[dict[str, Any]] = []
+        if limit <= 0:
+            return records
+        for record in self.iter_history_reversed(scope, session_id):
+            records.append(record)
+            if len(records) >= limit:
+                break
+        records.reverse()
         return records
 
+    def iter_history_reversed(self, scope: str, session_id: str) -> Iterator[dict[str, Any]]:
+        try:
+            handle = self._history_path(scope, session_id).open("rb")
+        except FileNotFoundError:
+            return
+        # 从文件末尾按块反向读取，耗时取决于调用方读取了多少条，与会话历史长度无关
+        with handle:
+            position = handle.seek(0, os.SEEK_END)
+            remainder = b""
+            while position > 0:
+                read_size = min(TAIL_BLOCK_SIZE, position)
+                position -= read_size
+                handle.seek(position)
+                lines = (handle.read(read_size) + remainder).split(b"\n")
+                # 第一段可能是跨块的行的后半部分，留到读取前一块时拼接
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    record = _parse_json_line(line)
+                    if record is not None:
+                        yield record
+            record = _parse_json_line(remainder)
+            if record is not None:
+                yield record
+
     def save_image(
         self,
         scope: str,
@@ -114,3 +205,13 @@ class SessionStore:
             size=len(image_bytes),
             mime_type=mime_type,
         )
+
+
+def _parse_json_line(line: bytes) -> dict[str, Any] | None:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
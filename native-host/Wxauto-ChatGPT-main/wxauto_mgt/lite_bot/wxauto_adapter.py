@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import threading
 import time
 from typing import Any, Iterable
 
@@ -11,17 +12,21 @@ class WxautoAdapter:
     将 wxauto 消息转换为统一模型，并发送消息。
 
     wxauto 的具体字段可能因版本而异，请根据实际数据结构调整 parse_raw。
+    微信UI操作不能并发执行，发送和拉取消息通过同一把锁串行化。
     """
 
     def __init__(self, wxauto_client: Any) -> None:
         self.wxauto = wxauto_client
+        self._ui_lock = threading.Lock()
 
     def send_text(self, session: SessionInfo, text: str) -> None:
         target = session.display_name
-        self.wxauto.SendMsg(text, target)
+        with self._ui_lock:
+            self.wxauto.SendMsg(text, target)
 
     def poll_messages(self) -> Iterable[dict[str, Any]]:
-        return self.wxauto.GetListenMessage()
+        with self._ui_lock:
+            return self.wxauto.GetListenMessage()
 
     def parse_raw(self, raw: dict[str, Any]) -> IncomingMessage:
         msg_type = raw.get("type", "text")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+会话调度器延迟测试
+
+模拟多个实例、每个实例多个会话的消息处理，其中一个实例的平台调用很慢，
+对比串行处理与ChatScheduler下健康实例的消息延迟，并校验同一会话内的处理顺序。
+
+用法:
+    python wxauto_mgt/scripts/benchmark_chat_scheduler.py [--instances 20] [--chats 5] [--messages 4]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+
+from wxauto_mgt.core.chat_scheduler import ChatScheduler
+
+FAST_DELAY = 0.02   # 健康实例的平台调用耗时（秒）
+SLOW_DELAY = 0.5    # 慢实例的平台调用耗时（秒）
+
+
+def build_messages(instances, chats, messages):
+    """生成(实例, 会话, 序号)列表，按轮询顺序交错排列"""
+    return [(f"inst_{i}", f"chat_{c}", n)
+            for n in range(messages) for i in range(instances) for c in range(chats)]
+
+
+async def handle(instance_id, delay_map, start, latencies, order, chat_name, seq):
+    """模拟一次平台调用，记录延迟和处理顺序"""
+    await asyncio.sleep(delay_map[instance_id])
+    latencies.setdefault(instance_id, []).append(time.perf_counter() - start)
+    order.setdefault((instance_id, chat_name), []).append(seq)
+
+
+async def run_serial(msgs, delay_map):
+    latencies, order = {}, {}
+    start = time.perf_counter()
+    for instance_id, chat_name, seq in msgs:
+        await handle(instance_id, delay_map, start, latencies, order, chat_name, seq)
+    return latencies, order
+
+
+async def run_scheduled(msgs, delay_map, per_instance_limit):
+    latencies, order = {}, {}
+    scheduler = ChatScheduler(per_instance_limit=per_instance_limit)
+    start = time.perf_counter()
+    futures = [
+        scheduler.submit(instance_id, chat_name, f"{instance_id}:{chat_name}:{seq}",
+                         lambda i=instance_id, c=chat_name, n=seq: handle(i, delay_map, start, latencies, order, c, n))
+        for instance_id, chat_name, seq in msgs
+    ]
+    await asyncio.gather(*futures)
+    return latencies, order
+
+
+def healthy_p95(latencies):
+    values = sorted(v for k, vs in latencies.items() if k != 'inst_0' for v in vs)
+    return values[int(len(values) * 0.95) - 1] if values else 0.0
+
+
+async def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="会话调度器延迟测试")
+    parser.add_argument('--instances', type=int, default=20, help="实例数")
+    parser.add_argument('--chats', type=int, default=5, help="每个实例的会话数")
+    parser.add_argument('--messages', type=int, default=4, help="每个会话的消息数")
+    parser.add_argument('--limit', type=int, default=4, help="每个实例的并发会话数")
+    args = parser.parse_args()
+
+    msgs = build_messages(args.instances, args.chats, args.messages)
+    # inst_0为慢实例
+    delay_map = {f"inst_{i}": (SLOW_DELAY if i == 0 else FAST_DELAY) for i in range(args.instances)}
+
+    serial_lat, _ = await run_serial(msgs, delay_map)
+    sched_lat, sched_order = await run_scheduled(msgs, delay_map, args.limit)
+
+    ordered = all(seqs == sorted(seqs) for seqs in sched_order.values())
+
+    print(f"实例: {args.instances}, 每实例会话: {args.chats}, 每会话消息: {args.messages}, 慢实例: inst_0")
+    print(f"{'':8}{'健康实例P95(s)':>16}{'健康实例均值(s)':>16}")
+    for name, lat in (('串行', serial_lat), ('调度器', sched_lat)):
+        healthy = [v for k, vs in lat.items() if k != 'inst_0' for v in vs]
+        print(f"{name:8}{healthy_p95(lat):>16.3f}{statistics.mean(healthy):>16.3f}")
+    print(f"会话内顺序保持: {'是' if ordered else '否'}")
+    return 0 if ordered else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+数据库连接池性能基准测试
+
+对比旧实现（每条语句新建aiosqlite连接、写操作串行在asyncio.Lock后面）
+与DBManager连接池、组提交写入（insert_batched）的每秒查询数。
+使用临时数据库，不影响正式数据。
+
+用法:
+    python wxauto_mgt/scripts/benchmark_db_pool.py [--ops 2000] [--concurrency 20]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+
+import aiosqlite
+
+from wxauto_mgt.data.db_manager import DBManager
+
+
+class LegacyDB:
+    """旧实现：每次操作都新建连接"""
+
+    def __init__(self, db_path):
+        self._db_path = db_path
+        self._lock = asyncio.Lock()
+
+    async def insert(self, sql, params):
+        async with self._lock:
+            async with aiosqlite.connect(self._db_path) as db:
+                await db.execute(sql, params)
+                await db.commit()
+
+    async def fetchone(self, sql, params):
+        async with aiosqlite.connect(self._db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute(sql, params) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+
+INSERT_SQL = ("INSERT INTO messages (instance_id, message_id, chat_name, message_type, "
+              "content, sender, create_time) VALUES (?, ?, ?, 'text', ?, 'user', ?)")
+SELECT_SQL = "SELECT * FROM messages WHERE instance_id = ? AND message_id = ?"
+
+
+async def run_workload(name, insert, fetchone, ops, concurrency):
+    """并发执行写入和读取，返回(写QPS, 读QPS)"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def do_insert(i):
+        async with semaphore:
+            await insert(INSERT_SQL, ('bench', f'{name}_{i}', f'chat_{i % 30}', f'content {i}', int(time.time())))
+
+    async def do_select(i):
+        async with semaphore:
+            await fetchone(SELECT_SQL, ('bench', f'{name}_{i}'))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(do_insert(i) for i in range(ops)))
+    write_qps = ops / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(do_select(i) for i in range(ops)))
+    read_qps = ops / (time.perf_counter() - start)
+
+    return write_qps, read_qps
+
+
+async def run_batched_inserts(db, ops, concurrency):
+    """通过组提交写入器并发插入，返回写QPS"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def do_insert(i):
+        async with semaphore:
+            await db.insert_batched('messages', {
+                'instance_id': 'bench', 'message_id': f'batched_{i}', 'chat_name': f'chat_{i % 30}',
+                'message_type': 'text', 'content': f'content {i}', 'sender': 'user',
+                'create_time': int(time.time())
+            })
+
+    start = time.perf_counter()
+    await asyncio.gather(*(do_insert(i) for i in range(ops)))
+    return ops / (time.perf_counter() - start)
+
+
+async def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="数据库连接池基准测试")
+    parser.add_argument('--ops', type=int, default=2000, help="每轮读/写操作数")
+    parser.add_argument('--concurrency', type=int, default=20, help="并发协程数")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='wxauto_bench_')
+    try:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        db = DBManager()
+        await db.initialize(db_path)
+
+        legacy = LegacyDB(db_path)
+        legacy_write, legacy_read = await run_workload(
+            'legacy', legacy.insert, legacy.fetchone, args.ops, args.concurrency)
+        pool_write, pool_read = await run_workload(
+            'pool', db.execute, db.fetchone, args.ops, args.concurrency)
+        batched_write = await run_batched_inserts(db, args.ops, args.concurrency)
+        await db.close()
+
+        print(f"操作数: {args.ops}, 并发: {args.concurrency}")
+        print(f"{'':8}{'写 QPS':>12}{'读 QPS':>12}")
+        print(f"{'旧实现':8}{legacy_write:>12.0f}{legacy_read:>12.0f}")
+        print(f"{'连接池':8}{pool_write:>12.0f}{pool_read:>12.0f}")
+        print(f"{'提升':8}{pool_write / legacy_write:>11.1f}x{pool_read / legacy_read:>11.1f}x")
+        print(f"{'组提交':8}{batched_write:>12.0f}{'-':>12}  ({batched_write / legacy_write:.1f}x)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
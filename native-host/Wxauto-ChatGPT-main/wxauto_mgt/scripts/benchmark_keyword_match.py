@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+关键词匹配基准测试
+
+生成几千条完全匹配、包含匹配、模糊匹配混合的关键词规则，对比逐条规则检查的旧方式
+与KeywordMatcher索引的每秒匹配次数，并校验两者匹配到的规则完全一致。
+
+用法:
+    python wxauto_mgt/scripts/benchmark_keyword_match.py [--rules 3000] [--messages 2000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+
+from wxauto_mgt.core.platforms.keyword_matcher import KeywordMatcher
+from wxauto_mgt.core.platforms.keyword_platform import KeywordMatchPlatform
+
+WORDS = ["价格", "发货", "退款", "优惠券", "尺码", "颜色", "库存", "物流", "客服", "售后",
+         "Order", "Refund", "Shipping", "Coupon", "Size", "Color", "快递", "包邮", "发票", "保修"]
+
+
+def random_phrase(rng, words=3):
+    return "".join(rng.choice(WORDS) for _ in range(words)) + str(rng.randrange(500))
+
+
+def build_rules(rng, count):
+    """生成关键词规则，约70%包含匹配、20%完全匹配、10%模糊匹配"""
+    rules = []
+    for i in range(count):
+        kind = rng.random()
+        match_type = 'contains' if kind < 0.7 else ('exact' if kind < 0.9 else 'fuzzy')
+        rules.append({
+            'keywords': [random_phrase(rng, rng.randint(1, 3)) for _ in range(rng.randint(1, 4))],
+            'match_type': match_type,
+            'replies': [f"回复{i}"],
+        })
+    return rules
+
+
+def build_messages(rng, rules, count):
+    """生成消息：命中关键词、近似关键词和不相关内容混合"""
+    messages = []
+    for _ in range(count):
+        kind = rng.random()
+        keyword = rng.choice(rng.choice(rules)['keywords'])
+        if kind < 0.3:
+            messages.append(f"请问{keyword}怎么样")
+        elif kind < 0.5:
+            messages.append(keyword.upper())
+        elif kind < 0.7:
+            messages.append(keyword[:-1] + "x")
+        else:
+            messages.append(random_phrase(rng, rng.randint(2, 8)))
+    return messages
+
+
+def linear_match(platform, rules, content):
+    """旧实现：逐条规则检查"""
+    for rule in rules:
+        if platform._match_keywords(content, rule.get('keywords', []), rule.get('match_type', 'exact')):
+            return rule
+    return None
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="关键词匹配基准测试")
+    parser.add_argument('--rules', type=int, default=3000, help="规则数量")
+    parser.add_argument('--messages', type=int, default=2000, help="消息数量")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    rules = build_rules(rng, args.rules)
+    messages = build_messages(rng, rules, args.messages)
+    platform = KeywordMatchPlatform('bench', 'bench', {'rules': rules})
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(rules)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    expected = [linear_match(platform, rules, m) for m in messages]
+    linear_ops = len(messages) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    actual = [matcher.match(m) for m in messages]
+    index_ops = len(messages) / (time.perf_counter() - start)
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a is not b)
+    hits = sum(1 for r in actual if r is not None)
+
+    print(f"规则数: {args.rules}, 消息数: {args.messages}, 命中: {hits}, 索引构建: {build_ms:.1f} ms")
+    print(f"{'逐条检查':10}{linear_ops:>12.0f} 条/秒")
+    print(f"{'编译索引':10}{index_ops:>12.0f} 条/秒  ({index_ops / linear_ops:.0f}x)")
+    print(f"结果一致: {'是' if mismatches == 0 else f'否（{mismatches}条不一致）'}")
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+lite_bot历史记录读取性能测试
+
+生成一个很长的会话历史文件，对比全量读取后再按token预算截取（旧方式）
+与从文件末尾反向读取（SessionStore.iter_history_reversed）构建上下文的耗时，
+并校验两种方式得到的上下文完全一致。
+
+用法:
+    python wxauto_mgt/scripts/benchmark_lite_bot_history.py [--lines 100000] [--rounds 20]
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+
+from wxauto_mgt.lite_bot.bot import WxAutoBot
+from wxauto_mgt.lite_bot.config import BotConfig, StorageConfig
+from wxauto_mgt.lite_bot.models import SessionInfo
+from wxauto_mgt.lite_bot.token_utils import estimate_message_tokens
+
+SCOPE = "group"
+SESSION_ID = "benchmark"
+
+
+def build_history(bot, session, lines):
+    """写入指定行数的历史记录，收发交替"""
+    for n in range(lines):
+        sent = n % 5 == 4
+        bot._store_record(session, {
+            "timestamp": 1700000000 + n,
+            "direction": "sent" if sent else "received",
+            "sender": "bot" if sent else f"user_{n % 37}",
+            "type": "text",
+            "content": f"第{n}条消息，内容长度随序号变化" + "。" * (n % 60),
+            "message_id": f"msg_{n}",
+            "session_key": SESSION_ID,
+        })
+
+
+def take_within_budget(history, budget):
+    """从新到旧累加token数，超出预算为止"""
+    kept = []
+    remaining = budget
+    for message, tokens in history:
+        if tokens > remaining:
+            break
+        kept.append(message)
+        remaining -= tokens
+    kept.reverse()
+    return kept
+
+
+def full_scan_context(bot, exclude_message_id, budget):
+    """旧方式：读取全部历史并逐条重新计数，再从后往前按预算截取"""
+    history = bot.store.load_history(SCOPE, SESSION_ID)
+    history = [record for record in history if record.get("message_id") != exclude_message_id]
+    messages = [bot._record_to_message(record) for record in history]
+    return take_within_budget(
+        ((message, estimate_message_tokens(message)) for message in reversed(messages)), budget
+    )
+
+
+def tail_context(bot, session, exclude_message_id, budget):
+    """新方式：反向惰性读取，使用记录中保存的token数，取够预算即停止"""
+    return take_within_budget(bot._iter_history_messages(session, exclude_message_id), budget)
+
+
+def measure(func, rounds):
+    durations = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), result
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="lite_bot历史记录读取性能测试")
+    parser.add_argument('--lines', type=int, default=100000, help="会话历史行数")
+    parser.add_argument('--rounds', type=int, default=20, help="每种方式的重复次数")
+    parser.add_argument('--budget', type=int, default=3000, help="历史上下文的token预算")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bot = WxAutoBot(BotConfig(storage=StorageConfig(base_dir=tmp_dir)))
+        session = SessionInfo(scope=SCOPE, session_id=SESSION_ID, session_key=SESSION_ID, display_name="benchmark")
+
+        start = time.perf_counter()
+        build_history(bot, session, args.lines)
+        print(f"生成 {args.lines} 行历史记录，耗时 {time.perf_counter() - start:.2f} 秒")
+
+        latest_id = f"msg_{args.lines - 1}"
+        full_time, full_result = measure(lambda: full_scan_context(bot, latest_id, args.budget), args.rounds)
+        tail_time, tail_result = measure(lambda: tail_context(bot, session, latest_id, args.budget), args.rounds)
+
+        print(f"全量读取: {full_time * 1000:.2f} ms/次")
+        print(f"反向读取: {tail_time * 1000:.2f} ms/次")
+        print(f"加速比: {full_time / tail_time:.1f}x，上下文包含 {len(tail_result)} 条历史")
+        print(f"结果一致: {full_result == tail_result}")
+
+
+if __name__ == "__main__":
+    main()
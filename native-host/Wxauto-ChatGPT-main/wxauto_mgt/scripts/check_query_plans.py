@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+热点查询执行计划检查
+
+对messages表的热点查询执行EXPLAIN QUERY PLAN，如果任何查询退化为全表扫描
+或需要临时排序，则以非零状态码退出，可在提交前或CI中运行。
+
+用法:
+    python wxauto_mgt/scripts/check_query_plans.py [数据库路径]
+    不指定路径时使用临时数据库检查当前建表语句。
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+
+from wxauto_mgt.data.db_manager import DBManager
+from wxauto_mgt.data.hot_queries import HOT_QUERIES
+
+
+async def check(db_path: str) -> int:
+    """检查执行计划，返回退化的查询数量"""
+    db = DBManager()
+    await db.initialize(db_path)
+    try:
+        for name, (sql, params) in HOT_QUERIES.items():
+            plan = await db.explain_query_plan(sql, params)
+            print(f"{name}:")
+            for detail in plan:
+                print(f"    {detail}")
+
+        regressions = await db.check_query_plans()
+    finally:
+        await db.close()
+
+    if regressions:
+        print(f"\n发现 {len(regressions)} 个执行计划退化的查询: {', '.join(regressions)}")
+    else:
+        print("\n所有热点查询均使用索引")
+    return len(regressions)
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) > 1:
+        return 1 if asyncio.run(check(sys.argv[1])) else 0
+
+    tmp_dir = tempfile.mkdtemp(prefix='wxauto_plan_')
+    try:
+        failed = asyncio.run(check(os.path.join(tmp_dir, 'plan.db')))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
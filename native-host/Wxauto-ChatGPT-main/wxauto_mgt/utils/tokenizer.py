@@ -0,0 +1,194 @@
+"""
+Token计数模块
+
+为上下文预算和历史截断提供统一的token计数：
+- 安装了tiktoken且编码文件可用时，使用BPE分词器精确计数（编码只加载一次）
+- 否则使用区分中日韩文字的近似算法，中文按字计数，英文按单词长度计数，
+  避免按"字符数/4"估算时中文被严重低估
+- 计数结果按文本缓存，同一条历史消息只计算一次
+
+可通过环境变量WXAUTO_TOKENIZER指定分词器：approx 强制使用近似算法，
+tiktoken:<编码名> 使用指定的tiktoken编码（默认cl100k_base）。
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# 默认的tiktoken编码
+DEFAULT_ENCODING = "cl100k_base"
+
+# 每条聊天消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 近似算法中每个中日韩字符对应的token数，略高于常见BPE词表的实测均值，宁可高估预算
+CJK_TOKENS_PER_CHAR = 1.3
+
+# 计数缓存的条目数
+COUNT_CACHE_SIZE = 8192
+
+# 中日韩文字、假名、韩文和全角标点
+_CJK_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef]")
+# 英文单词和数字
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+# 非空白字符
+_NON_SPACE_RE = re.compile(r"\S")
+
+
+class ApproxTokenizer:
+    """区分中日韩文字的近似token计数"""
+
+    name = "approx-cjk"
+
+    def count(self, text: str) -> int:
+        """
+        估算文本的token数
+
+        中日韩字符按CJK_TOKENS_PER_CHAR计，英文单词和数字每4个字符计1个token，
+        其余非空白字符（标点、表情等）每个计1个token
+        """
+        if not text:
+            return 0
+        cjk = len(_CJK_RE.findall(text))
+        words = _WORD_RE.findall(text)
+        word_chars = sum(len(word) for word in words)
+        word_tokens = sum((len(word) + 3) // 4 for word in words)
+        others = len(_NON_SPACE_RE.findall(text)) - cjk - word_chars
+        return max(1, math.ceil(cjk * CJK_TOKENS_PER_CHAR) + word_tokens + others)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截取不超过max_tokens的最长前缀，计数随前缀长度单调不减，因此用二分查找"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+
+class TiktokenTokenizer:
+    """基于tiktoken BPE词表的精确计数"""
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING):
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.name = f"tiktoken:{encoding_name}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def _create_default_tokenizer():
+    """按环境变量和tiktoken可用性选择分词器"""
+    setting = os.getenv("WXAUTO_TOKENIZER", "").strip()
+    if setting == "approx":
+        return ApproxTokenizer()
+
+    encoding_name = DEFAULT_ENCODING
+    if setting.startswith("tiktoken:"):
+        encoding_name = setting.split(":", 1)[1] or DEFAULT_ENCODING
+    if TIKTOKEN_AVAILABLE:
+        try:
+            return TiktokenTokenizer(encoding_name)
+        except Exception as e:
+            # 离线环境下编码文件不在本地缓存时会加载失败
+            logger.warning(f"加载tiktoken编码{encoding_name}失败，改用近似计数: {e}")
+    return ApproxTokenizer()
+
+
+def get_tokenizer():
+    """获取当前使用的分词器，首次调用时创建"""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                _tokenizer = _create_default_tokenizer()
+                logger.info(f"使用分词器: {_tokenizer.name}")
+    return _tokenizer
+
+
+def set_tokenizer(tokenizer) -> None:
+    """
+    替换分词器
+
+    Args:
+        tokenizer: 提供name属性以及count(text)、truncate(text, max_tokens)方法的对象
+    """
+    global _tokenizer
+    with _tokenizer_lock:
+        _tokenizer = tokenizer
+
+
+def tokenizer_name() -> str:
+    """当前分词器名称，用于判断保存的计数是否仍然有效"""
+    return get_tokenizer().name
+
+
+@lru_cache(maxsize=COUNT_CACHE_SIZE)
+def _cached_count(name: str, text: str) -> int:
+    return get_tokenizer().count(text)
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数，结果按(分词器, 文本)缓存"""
+    if not text:
+        return 0
+    return _cached_count(tokenizer_name(), text)
+
+
+def count_message_tokens(message: Dict[str, Any]) -> int:
+    """计算一条聊天消息的token数，多模态内容只计算文本部分"""
+    content = message.get("content")
+    if isinstance(content, list):
+        tokens = 0
+        for item in content:
+            if isinstance(item, dict) and item.get("type") == "text":
+                tokens += count_tokens(str(item.get("text", "")))
+    else:
+        tokens = count_tokens(str(content or ""))
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+
+def count_messages_tokens(messages: Iterable[Dict[str, Any]]) -> int:
+    """计算消息列表的token数"""
+    return sum(count_message_tokens(message) for message in messages)
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """截断文本，使其不超过max_tokens个token"""
+    if not text:
+        return text
+    return get_tokenizer().truncate(text, max_tokens)
+
@@ -32,6 +32,9 @@ api_router = APIRouter()
 # 初始化标志
 _initialized = False
 
+# 建立CPU使用率的采样基准，之后以interval=None非阻塞读取距上次调用期间的使用率
+psutil.cpu_percent(interval=None)
+
 async def verify_request_auth(request: Request):
     """
     验证请求的认证状态
@@ -513,7 +516,7 @@ async def get_system_resources(request: Request, instance_id: Optional[str] = No
                 }
 
         # 获取系统资源使用情况
-        cpu_percent = psutil.cpu_percent(interval=0.1)
+        cpu_percent = psutil.cpu_percent(interval=None)
         memory = psutil.virtual_memory()
         memory_used_mb = memory.used / (1024 * 1024)
         memory_total_mb = memory.total / (1024 * 1024)
@@ -564,7 +567,7 @@ async def get_system_status(request: Request):
         uptime_str = f"{int(days)}天{int(hours)}小时{int(minutes)}分钟"
 
         # 获取系统资源使用情况
-        cpu_percent = psutil.cpu_percent(interval=0.1)
+        cpu_percent = psutil.cpu_percent(interval=None)
         memory = psutil.virtual_memory()
         memory_used_gb = memory.used / (1024 ** 3)
         memory_total_gb = memory.total / (1024 ** 3)
@@ -590,18 +593,14 @@ async def get_system_status(request: Request):
             offline_count = 0
             error_count = 0
 
-            # 检查每个实例的实际连接状态
-            for instance in db_instances:
+            def check_instance_online(instance) -> bool:
+                """调用健康检查API获取微信连接状态"""
                 instance_id = instance.get('instance_id')
                 base_url = instance.get('base_url')
                 api_key = instance.get('api_key')
-
                 if not base_url or not api_key:
-                    offline_count += 1
-                    continue
-
+                    return False
                 try:
-                    # 调用健康检查API获取微信连接状态
                     import requests
                     health_url = f"{base_url}/api/health"
                     headers = {'X-API-Key': api_key}
@@ -609,15 +608,20 @@ async def get_system_status(request: Request):
                     health_response = requests.get(health_url, headers=headers, timeout=5)
                     if health_response.status_code == 200:
                         health_data = health_response.json()
-                        if 'data' in health_data and health_data['data'].get('wechat_status') == 'connected':
-                            online_count += 1
-                        else:
-                            offline_count += 1
-                    else:
-                        offline_count += 1
+                        return 'data' in health_data and health_data['data'].get('wechat_status') == 'connected'
+                    return False
                 except Exception as e:
                     logger.warning(f"检查实例 {instance_id} 连接状态失败: {e}")
-                    offline_count += 1
+                    return False
+
+            # 并发检查每个实例的实际连接状态，不阻塞事件循环
+            loop = asyncio.get_running_loop()
+            results = await asyncio.gather(*[
+                loop.run_in_executor(None, check_instance_online, instance)
+                for instance in db_instances
+            ])
+            online_count = sum(1 for online in results if online)
+            offline_count = len(results) - online_count
 
         except Exception as e:
             logger.warning(f"获取实例状态失败: {e}")